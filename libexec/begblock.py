@@ -5,6 +5,7 @@
 
 import traceback
 import sys
+import gc
 import os
 import time
 from collections import OrderedDict
@@ -18,6 +19,7 @@ import processingfw.pfwutils as pfwutils
 from processingfw.runqueries import runqueries
 import processingfw.pfwblock as pfwblock
 import processingfw.pfwdb as pfwdb
+import processingfw.pfwcheckpoint as pfwcheckpoint
 
 
 def begblock(argv):
@@ -34,6 +36,17 @@ def begblock(argv):
     blkdir = config.getfull('block_dir')
     os.chdir(blkdir)
 
+    # resume after last completed module if a previous begblock failed
+    checkpoint = None
+    if pfwcheckpoint.use_checkpoint(config):
+        checkpoint = pfwcheckpoint.load_checkpoint(
+            miscutils.fwsplit(config.getfull(pfwdefs.SW_MODULELIST).lower()))
+        if checkpoint is not None:
+            config = checkpoint[0]
+            config.set_block_info()
+        else:
+            pfwcheckpoint.remove_checkpoint()
+
     (exists, submit_des_services) = config.search('submit_des_services')
     if exists and submit_des_services is not None:
         os.environ['DES_SERVICES'] = submit_des_services
@@ -46,32 +59,51 @@ def begblock(argv):
     if miscutils.fwdebug_check(3, 'PFWBLOCK_DEBUG'):
         miscutils.fwdebug_print("blknum = %s" % (config[pfwdefs.PF_BLKNUM]))
     if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
-        dbh = pfwdb.PFWDB(submit_des_services, submit_des_db_section)
-        dbh.insert_block(config)
-        blktid = config['task_id']['block'][str(blknum)]
-        config['task_id']['begblock'] = dbh.create_task(name='begblock',
-                                                        info_table=None,
-                                                        parent_task_id=blktid,
-                                                        root_task_id=int(config['task_id']['attempt']),
-                                                        label=None,
-                                                        do_begin=True,
-                                                        do_commit=True)
+        dbh = pfwdb.get_pfwdb(submit_des_services, submit_des_db_section, config)
+        if checkpoint is not None and 'begblock' in config['task_id']:
+            # keep using the block and begblock tasks the checkpointed run created
+            blktid = config['task_id']['block'][str(blknum)]
+            dbh.reopen_task(blktid)
+            dbh.reopen_task(config['task_id']['begblock'], True)
+        else:
+            dbh.insert_block(config)
+            blktid = config['task_id']['block'][str(blknum)]
+            config['task_id']['begblock'] = dbh.create_task(name='begblock',
+                                                            info_table=None,
+                                                            parent_task_id=blktid,
+                                                            root_task_id=int(config['task_id']['attempt']),
+                                                            label=None,
+                                                            do_begin=True,
+                                                            do_commit=True)
 
     try:
         modulelist = miscutils.fwsplit(config.getfull(pfwdefs.SW_MODULELIST).lower())
         modules_prev_in_list = {}
 
+        # free each module's master data once no later module depends upon it
+        last_use = pfwblock.get_masterdata_last_use(config, modulelist)
+
         joblist = {}
         parlist = OrderedDict()
         masterdata = OrderedDict()
         filelist = {'infiles': {},
                     'outfiles': {}}
+        if checkpoint is not None:
+            state = checkpoint[1]
+            (joblist, parlist, masterdata, filelist, modules_prev_in_list) = \
+                (state['joblist'], state['parlist'], state['masterdata'], state['filelist'],
+                 state['modules_prev_in_list'])
+
         for num, modname in enumerate(modulelist):
+            if modname in modules_prev_in_list:
+                print("XXXXXXXXXXXXXXXXXXXX %s (done in checkpoint) XXXXXXXXXXXXXXXXXXXX" % modname)
+                continue
             print("XXXXXXXXXXXXXXXXXXXX %s XXXXXXXXXXXXXXXXXXXX" % modname)
             if modname not in config[pfwdefs.SW_MODULESECT]:
                 miscutils.fwdie("Error: Could not find module description for module %s\n" %
                                 (modname), pfwdefs.PF_EXIT_FAILURE)
             moddict = config[pfwdefs.SW_MODULESECT][modname]
+            modfiles = []
 
             runqueries(config, configfile, modname, modules_prev_in_list)
             pfwblock.read_master_lists(config, modname, masterdata, modules_prev_in_list)
@@ -81,9 +113,6 @@ def begblock(argv):
 
             if pfwdefs.PF_NOOP not in moddict or not miscutils.convertBool(moddict[pfwdefs.PF_NOOP]):
                 pfwblock.create_fullnames(config, modname, masterdata)
-                if miscutils.fwdebug_check(9, 'PFWBLOCK_DEBUG') and modname in masterdata:
-                    with open('%s-masterdata.txt' % modname, 'w') as fh:
-                        miscutils.pretty_print_dict(masterdata[modname], fh)
 
                 pfwblock.add_file_metadata(config, modname)
                 sublists = pfwblock.create_sublists(config, modname, masterdata)
@@ -93,42 +122,40 @@ def begblock(argv):
                 loopvals = pfwblock.get_wrapper_loopvals(config, modname)
                 wrapinst = pfwblock.create_wrapper_inst(config, modname, loopvals)
                 wcnt = 1
-                for winst in list(wrapinst.values()):
-                    if miscutils.fwdebug_check(6, 'PFWBLOCK_DEBUG'):
-                        miscutils.fwdebug_print("winst %d - BEG" % wcnt)
-                    pfwblock.assign_data_wrapper_inst(config, modname, winst, masterdata,
-                                                      sublists, infsect, outfsect)
-                    pfwblock.finish_wrapper_inst(config, modname, winst, outfsect)
-                    tempfiles = pfwblock.create_module_wrapper_wcl(config, modname, winst)
-                    for fl in tempfiles['infiles']:
-                        if fl not in list(filelist['infiles'].keys()):
-                            filelist['infiles'][fl] = num
-
-                    for fl in tempfiles['outfiles']:
-                        filelist['outfiles'][fl] = num
-                    #filelist['infiles'] += tempfiles['infiles']
-                    #filelist['outfiles'] += tempfiles['outfiles']
+                for (winst, tempfiles) in pfwblock.build_wrapper_insts(config, modname, wrapinst,
+                                                                       masterdata, sublists,
+                                                                       infsect, outfsect):
+                    pfwblock.register_wrapper_files(filelist, tempfiles, num)
                     pfwblock.divide_into_jobs(config, modname, winst, joblist, parlist)
+                    modfiles.append(winst['inputwcl'])
+                    if pfwdefs.IW_LISTSECT in winst:
+                        for linfo in winst[pfwdefs.IW_LISTSECT].values():
+                            modfiles.append(linfo['fullname'])
                     if miscutils.fwdebug_check(6, 'PFWBLOCK_DEBUG'):
-                        miscutils.fwdebug_print("winst %d - %s - END" % (wcnt, etime-stime))
+                        miscutils.fwdebug_print("winst %d - END" % wcnt)
                     wcnt += 1
             modules_prev_in_list[modname] = True
-
             if miscutils.fwdebug_check(9, 'PFWBLOCK_DEBUG') and modname in masterdata:
                 with open('%s-masterdata.txt' % modname, 'w') as fh:
                     miscutils.pretty_print_dict(masterdata[modname], fh)
 
-        scriptfile = pfwblock.write_runjob_script(config)
+            (_, peakrss) = pfwutils.get_rss_mb()
+            pfwblock.free_masterdata(masterdata, last_use, num)
+            gc.collect()
+            (currrss, _) = pfwutils.get_rss_mb()
+            print("PFW: after module %s peak RSS %0.1f MB, RSS after freeing master data %s MB (keeping %s)" %
+                  (modname, peakrss, "%0.1f" % currrss if currrss is not None else 'unknown',
+                   list(masterdata.keys())))
 
-        intersect = list(set(filelist['infiles'].keys()) & set(filelist['outfiles'].keys()))
-        finallist = []
+            if pfwcheckpoint.use_checkpoint(config):
+                pfwcheckpoint.save_checkpoint(config, modname, modfiles, masterdata,
+                                              {'joblist': joblist, 'parlist': parlist,
+                                               'filelist': filelist,
+                                               'modules_prev_in_list': modules_prev_in_list})
 
-        for fl in list(filelist['infiles'].keys()):
-            if fl not in intersect:
-                finallist.append(fl)
-            else:
-                if filelist['infiles'][fl] <= filelist['outfiles'][fl]:
-                    raise Exception('Input file %s requested before it is generated.' % (fl))
+        scriptfile = pfwblock.write_runjob_script(config)
+
+        finallist = pfwblock.get_block_input_files(filelist)
 
         if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
             missingfiles = dbh.check_files(config, finallist)
@@ -140,6 +167,16 @@ def begblock(argv):
             jobdict['jobnum'] = pfwutils.pad_jobnum(config.inc_jobnum())
             jobdict['jobkeys'] = jobkey
             jobdict['numexpwrap'] = len(jobdict['tasks'])
+
+        if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
+            # one transaction for all jobs instead of a commit per job
+            starttime = time.time()
+            dbh.insert_jobs(config, joblist)
+            print("DESDMTIME: insert_jobs %0.3f (%s jobs)" % (time.time()-starttime, len(joblist)))
+
+        pfwblock.tar_all_inputfiles(config, joblist)
+
+        for jobkey, jobdict in sorted(joblist.items()):
             if miscutils.fwdebug_check(6, 'PFWBLOCK_DEBUG'):
                 miscutils.fwdebug_print("jobnum = %s, jobkey = %s:" % (jobkey, jobdict['jobnum']))
             jobdict['tasksfile'] = write_workflow_taskfile(config, jobdict['jobnum'],
@@ -165,10 +202,6 @@ def begblock(argv):
                 pfwblock.copy_input_lists_home_archive(config, filemgmt,
                                                        archive_info, jobdict['inlist'])
                 filemgmt.commit()
-            jobdict['inputwcltar'] = pfwblock.tar_inputfiles(config, jobdict['jobnum'],
-                                                             jobdict['inwcl'] + jobdict['inlist'])
-            if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
-                dbh.insert_job(config, jobdict)
             pfwblock.write_jobwcl(config, jobkey, jobdict)
             if ('glidein_use_wall' in config and
                 miscutils.convertBool(config.getfull('glidein_use_wall')) and
@@ -176,6 +209,7 @@ def begblock(argv):
                 jobdict['wall'] = config['jobwalltime']
 
         miscutils.fwdebug_print("Creating job files - END")
+        config.print_expand_cache_stats()
 
         numjobs = len(joblist)
         if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
@@ -201,11 +235,14 @@ def begblock(argv):
         if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
             dbh.end_task(config['task_id']['begblock'], retval, True)
             dbh.end_task(blktid, retval, True)
+            pfwdb.release_pfwdb(dbh)
+            pfwdb.close_pfwdb_pool()
         raise
 
     # save config, have updated jobnum, wrapnum, etc
     with open(configfile, 'w') as cfgfh:
         config.write(cfgfh)
+    pfwcheckpoint.remove_checkpoint()
 
     (exists, dryrun) = config.search(pfwdefs.PF_DRYRUN)
     if exists and miscutils.convertBool(dryrun):
@@ -214,6 +251,8 @@ def begblock(argv):
         retval = pfwdefs.PF_EXIT_SUCCESS
     if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
         dbh.end_task(config['task_id']['begblock'], retval, True)
+        pfwdb.release_pfwdb(dbh)
+        pfwdb.close_pfwdb_pool()
     miscutils.fwdebug_print("END - exiting with code %s" % retval)
 
     return retval
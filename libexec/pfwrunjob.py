@@ -11,8 +11,12 @@ import time
 import tarfile
 import shutil
 import copy
+import functools
 import traceback
 import socket
+import queue
+import threading
+import concurrent.futures
 from collections import OrderedDict
 from multiprocessing import Pool
 import multiprocessing.pool as pl
@@ -43,6 +47,14 @@ job_track = {}
 hold = False
 keeprunning = True
 terminating = False
+results = []
+donejobs = 0
+# wrapnums of finished wrappers, filled by the pool's result handler thread
+completed = queue.Queue()
+# stages inputs for upcoming wrappers if prefetch_inputs is on
+prefetcher = None
+# {archive name: {filename: info}} looked up at job start if job_file_archive_info is on
+job_archive_info = None
 
 
 class Print(object):
@@ -254,18 +266,101 @@ def transfer_job_to_archives(pfw_dbh, wcl, jobfiles, putinfo, level,
             saveinfo = output_transfer_prep(pfw_dbh, wcl, jobfiles, putinfo,
                                             parent_tid, task_label, exitcode)
 
+        dests = []
         if level == job2target:
-            transfer_job_to_single_archive(pfw_dbh, wcl, saveinfo, 'target',
-                                           parent_tid, task_label, exitcode)
-
+            dests.append('target')
         if level == job2home:
-            transfer_job_to_single_archive(pfw_dbh, wcl, saveinfo, 'home',
-                                           parent_tid, task_label, exitcode)
+            dests.append('home')
+
+        if len(dests) > 1 and miscutils.checkTrue(pfwdefs.TRANSFER_CONCURRENT, wcl,
+                                                  pfwdefs.TRANSFER_CONCURRENT_DEFAULT):
+            transfer_job_to_archives_concurrently(pfw_dbh, wcl, saveinfo, dests,
+                                                  parent_tid, task_label, exitcode)
+        else:
+            for dest in dests:
+                transfer_job_to_single_archive(pfw_dbh, wcl, saveinfo, dest,
+                                               parent_tid, task_label, exitcode)
 
     if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
         miscutils.fwdebug_print("END\n\n")
 
 
+def transfer_job_to_archives_concurrently(pfw_dbh, wcl, saveinfo, dests,
+                                          parent_tid, task_label, exitcode):
+    """Transfer files from the job directory to several archives at the same time.
+    """
+    def transfer_to_dest(dest):
+        # each destination gets its own connection and copy of the file info
+        dbh = None
+        if pfw_dbh is not None:
+            dbh = pfwdb.get_pfwdb(config=wcl)
+        try:
+            transfer_job_to_single_archive(dbh, wcl, copy.deepcopy(saveinfo), dest,
+                                           parent_tid, task_label, exitcode)
+        finally:
+            pfwdb.release_pfwdb(dbh)
+
+    starttime = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(dests)) as executor:
+        futures = [executor.submit(transfer_to_dest, dest) for dest in dests]
+    print("DESDMTIME: %s-transfer_archives %0.3f (%s)" %
+          (task_label, time.time()-starttime, ','.join(dests)))
+
+    # let every destination finish before reporting a failure
+    for future in futures:
+        future.result()
+
+
+def move_files_in_streams(wcl, pfw_dbh, task_label, trans_task_id, jobfilemvmt, saveinfo, dest):
+    """Call the job file mvmt class on batches of files in parallel streams.
+
+    Uses transfer_streams streams (default 1, i.e., a single call with all files).
+    """
+    def move(mvmt, batch):
+        if dest.lower() == 'target':
+            return mvmt.job2target(batch)
+        return mvmt.job2home(batch, wcl['verify_files'])
+
+    nstreams = int(wcl.get(pfwdefs.TRANSFER_STREAMS, pfwdefs.TRANSFER_STREAMS_DEFAULT))
+    nstreams = max(1, min(nstreams, len(saveinfo)))
+    if nstreams == 1:
+        return move(jobfilemvmt, saveinfo)
+
+    # deal files largest first so streams move similar numbers of bytes
+    def filesize(fkey):
+        src = saveinfo[fkey].get('src')
+        return os.path.getsize(src) if src is not None and os.path.exists(src) else 0
+    fkeys = sorted(saveinfo.keys(), key=filesize, reverse=True)
+    batches = [{fkey: saveinfo[fkey] for fkey in fkeys[i::nstreams]} for i in range(nstreams)]
+
+    def move_in_stream(batch):
+        # job file mvmt, stats and db objects aren't written to be shared
+        # between threads, so each extra stream gets its own
+        dbh = None
+        if pfw_dbh is not None:
+            dbh = pfwdb.get_pfwdb(config=wcl)
+        try:
+            tstats = None
+            if 'transfer_stats' in wcl:
+                tstats = pfwutils.pfw_dynam_load_class(dbh, wcl, trans_task_id,
+                                                       wcl['task_id']['attempt'],
+                                                       'stats_'+task_label, wcl['transfer_stats'],
+                                                       {'parent_task_id': trans_task_id,
+                                                        'root_task_id': wcl['task_id']['attempt']})
+            return move(dynam_load_jobfilemvmt(wcl, dbh, tstats, trans_task_id), batch)
+        finally:
+            pfwdb.release_pfwdb(dbh)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nstreams) as executor:
+        futures = [executor.submit(move, jobfilemvmt, batches[0])]
+        futures.extend([executor.submit(move_in_stream, batch) for batch in batches[1:]])
+
+    results = {}
+    for future in futures:
+        results.update(future.result())
+    return results
+
+
 def dynam_load_filemgmt(wcl, pfw_dbh, archive_info, parent_tid):
     """Dynamically load filemgmt class.
     """
@@ -504,16 +599,57 @@ def transfer_archives_to_job(pfw_dbh, wcl, neededfiles, parent_tid):
     return files2get
 
 
-def get_file_archive_info(pfw_dbh, wcl, files2get, jobfiles, archive_info, parent_tid):
-    """Gets information about files in the archive.
+def load_job_file_archive_info(jobwcl, inputs):
+    """Look up archive info for every input of every wrapper in the job at once.
 
-    Gets information about files in the archive after creating appropriate
-    filemgmt object.
+    Saves {archive name: {filename: info}} in job_archive_info for
+    get_file_archive_info to use instead of querying per wrapper.
     """
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
-        miscutils.fwdebug_print("BEG")
-        miscutils.fwdebug_print("archive_info = %s" % archive_info)
+    global job_archive_info
+
+    # files made within the job aren't in an archive
+    jobouts = set([miscutils.parse_fullname(ofile, miscutils.CU_PARSE_FILENAME)
+                   for (_, _, _, _, outs) in inputs.values() for osect in outs
+                   for ofile in outs[osect]])
+    files2get = set()
+    for (_, _, _, ins, _) in inputs.values():
+        for isect in ins:
+            for ifile in ins[isect]:
+                fname = miscutils.parse_fullname(ifile, miscutils.CU_PARSE_FILENAME)
+                if fname not in jobouts:
+                    files2get.add(fname)
+    files2get = sorted(files2get)
+
+    dests = []
+    if jobwcl[pfwdefs.USE_TARGET_ARCHIVE_INPUT].lower() != 'never':
+        dests.append('target')
+    if pfwdefs.USE_HOME_ARCHIVE_INPUT in jobwcl and \
+       jobwcl[pfwdefs.USE_HOME_ARCHIVE_INPUT].lower() == 'wrapper':
+        dests.append('home')
+    if len(files2get) == 0 or len(dests) == 0:
+        return
 
+    pfw_dbh = None
+    if jobwcl['use_db']:
+        pfw_dbh = pfwdb.get_pfwdb(config=jobwcl)
+    try:
+        job_archive_info = {}
+        for dest in dests:
+            archive_info = jobwcl['%s_archive_info' % dest]
+            starttime = time.time()
+            job_archive_info[archive_info['name']] = query_file_archive_info(pfw_dbh, jobwcl, files2get,
+                                                                             archive_info,
+                                                                             jobwcl['task_id']['job'])
+            print("DESDMTIME: job_file_archive_info %0.3f (%s of %s inputs found on %s)" %
+                  (time.time()-starttime, len(job_archive_info[archive_info['name']]),
+                   len(files2get), archive_info['name']))
+    finally:
+        pfwdb.release_pfwdb(pfw_dbh)
+
+
+def query_file_archive_info(pfw_dbh, wcl, files2get, archive_info, parent_tid):
+    """Query archive for info about files after creating appropriate filemgmt object.
+    """
     # dynamically load class for archive file mgmt to find location of files in archive
     filemgmt = dynam_load_filemgmt(wcl, pfw_dbh, archive_info, parent_tid)
 
@@ -530,6 +666,32 @@ def get_file_archive_info(pfw_dbh, wcl, files2get, jobfiles, archive_info, paren
                                                       fmdefs.FM_PREFER_UNCOMPRESSED)
     if pfw_dbh is not None:
         pfw_dbh.end_task(task_id, pfwdefs.PF_EXIT_SUCCESS, True)
+    return fileinfo_archive
+
+
+def get_file_archive_info(pfw_dbh, wcl, files2get, jobfiles, archive_info, parent_tid):
+    """Gets information about files in the archive.
+
+    Uses the job-level lookup if there is one, only querying the archive
+    (after creating appropriate filemgmt object) for files not in it.
+    """
+    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+        miscutils.fwdebug_print("BEG")
+        miscutils.fwdebug_print("archive_info = %s" % archive_info)
+
+    fileinfo_archive = {}
+    files2query = files2get
+    if job_archive_info is not None and archive_info['name'] in job_archive_info:
+        jobinfo = job_archive_info[archive_info['name']]
+        fileinfo_archive = {name: jobinfo[name] for name in files2get if name in jobinfo}
+        files2query = [name for name in files2get if name not in jobinfo]
+        if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+            miscutils.fwdebug_print("%s of %s files found in job-level archive info" %
+                                    (len(fileinfo_archive), len(files2get)))
+
+    if len(files2query) > 0:
+        fileinfo_archive.update(query_file_archive_info(pfw_dbh, wcl, files2query,
+                                                        archive_info, parent_tid))
 
     if len(files2get) != 0 and len(fileinfo_archive) == 0:
         print("\tInfo: 0 files found on %s" % archive_info['name'])
@@ -599,6 +761,135 @@ def get_wrapper_inputs(pfw_dbh, wcl, infiles):
               len(existinginputs))
 
 
+class InputPrefetcher(object):
+    """Stage inputs of upcoming wrappers in the background while earlier ones run.
+
+    Wrappers find prefetched files already in the job directory so
+    get_wrapper_inputs has nothing left to transfer.  Files made by wrappers
+    in this job, or needed by wrappers already started (which get their own),
+    are never prefetched.  Staging pauses once the files prefetched for
+    wrappers not yet started total budget bytes.
+    """
+
+    def __init__(self, jobwcl, inputs, order, budget):
+        self.jobwcl = jobwcl
+        self.inputs = inputs
+        self.order = order
+        self.budget = budget
+        self.cond = threading.Condition()
+        self.started = set()        # wrapnums handed to the pool
+        self.startedfiles = set()   # filenames wrappers already started will get themselves
+        self.inflight = set()       # filenames being prefetched now
+        self.ahead = {}             # wrapnum -> bytes prefetched for it before it started
+        self.stopping = False
+        self.thread = None
+
+        self.wrapfiles = {}
+        for wrapnum in order:
+            ins = inputs[wrapnum][3]
+            self.wrapfiles[wrapnum] = set([miscutils.parse_fullname(ifile, miscutils.CU_PARSE_FILENAME)
+                                           for isect in ins for ifile in ins[isect]])
+
+        # files made within the job aren't in an archive
+        self.jobouts = set([miscutils.parse_fullname(ofile, miscutils.CU_PARSE_FILENAME)
+                            for wrapnum in order
+                            for outs in [inputs[wrapnum][4]] for osect in outs
+                            for ofile in outs[osect]])
+
+    def start(self):
+        """Start staging inputs in a background thread.
+        """
+        self.thread = threading.Thread(target=self.run, name='prefetch_inputs')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop staging, waiting for any transfer in progress to finish.
+        """
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    def wait(self, wrapnum):
+        """Mark wrapper as started, first waiting for prefetches of any of its inputs.
+        """
+        with self.cond:
+            self.started.add(wrapnum)
+            self.startedfiles.update(self.wrapfiles.get(wrapnum, ()))
+            while self.inflight & self.wrapfiles.get(wrapnum, set()):
+                self.cond.wait()
+            self.ahead.pop(wrapnum, None)
+            self.cond.notify_all()
+
+    def get_needed_files(self, wrapnum):
+        """Return {filename: fullname} of inputs to prefetch for wrapper (call with lock held).
+        """
+        neededfiles = {}
+        ins = self.inputs[wrapnum][3]
+        for isect in ins:
+            _, missing = intgmisc.check_files(ins[isect])
+            for mfile in missing:
+                fname = miscutils.parse_fullname(mfile, miscutils.CU_PARSE_FILENAME)
+                if fname not in self.jobouts and fname not in self.startedfiles:
+                    neededfiles[fname] = mfile
+        return neededfiles
+
+    def run(self):
+        """Prefetch inputs for each wrapper in the order they are expected to start.
+        """
+        pfw_dbh = None
+        try:
+            if self.jobwcl['use_db']:
+                pfw_dbh = pfwdb.get_pfwdb(config=self.jobwcl)
+            for wrapnum in self.order:
+                with self.cond:
+                    while not self.stopping and wrapnum not in self.started and \
+                          sum(self.ahead.values()) >= self.budget:
+                        self.cond.wait()
+                    if self.stopping:
+                        break
+                    if wrapnum in self.started:
+                        continue
+                    neededfiles = self.get_needed_files(wrapnum)
+                    self.inflight = set(neededfiles.keys())
+
+                nbytes = 0
+                if len(neededfiles) > 0:
+                    starttime = time.time()
+                    try:
+                        files2get = transfer_archives_to_job(pfw_dbh, self.jobwcl, neededfiles,
+                                                             self.jobwcl['task_id']['job'])
+                        if len(files2get) > 0:
+                            print("Warning: could not prefetch %s input(s) for wrapper %s" %
+                                  (len(files2get), wrapnum))
+                    except Exception as exc:
+                        print("Warning: prefetching inputs for wrapper %s failed, wrapper will get them itself: %s" %
+                              (wrapnum, exc))
+                    staged = [fullname for fullname in neededfiles.values()
+                              if os.path.exists(fullname)]
+                    nbytes = sum([os.path.getsize(fullname) for fullname in staged])
+                    print("PFW: prefetched %s/%s input file(s) (%0.1f MB) for wrapper %s in %0.3f secs" %
+                          (len(staged), len(neededfiles), nbytes/1024.0/1024.0, wrapnum,
+                           time.time()-starttime))
+                    sys.stdout.flush()
+
+                with self.cond:
+                    self.inflight = set()
+                    if wrapnum not in self.started:
+                        self.ahead[wrapnum] = nbytes
+                    self.cond.notify_all()
+        except:
+            print("Warning: input prefetcher stopped by unexpected error")
+            traceback.print_exc(file=sys.stdout)
+        finally:
+            with self.cond:
+                self.inflight = set()
+                self.cond.notify_all()
+            pfwdb.release_pfwdb(pfw_dbh)
+
+
 def get_exec_names(wcl):
     """Return string containing comma separated list of executable names.
     """
@@ -836,18 +1127,25 @@ def transfer_job_to_single_archive(pfw_dbh, wcl, saveinfo, dest,
     # tranfer files to archive
     starttime = time.time()
     sem = get_semaphore(wcl, 'output', dest, trans_task_id)
-    if dest.lower() == 'target':
-        results = jobfilemvmt.job2target(saveinfo)
-    else:
-        results = jobfilemvmt.job2home(saveinfo, wcl['verify_files'])
+    results = move_files_in_streams(wcl, pfw_dbh, task_label, trans_task_id, jobfilemvmt,
+                                    saveinfo, dest)
 
     if sem is not None:
         if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
             miscutils.fwdebug_print("Releasing lock")
         del sem
 
+    elapsed = time.time()-starttime
     if pfw_dbh is None:
-        print("DESDMTIME: %s-filemvmt %0.3f" % (task_label, time.time()-starttime))
+        print("DESDMTIME: %s-filemvmt %0.3f" % (task_label, elapsed))
+    totbytes = 0
+    for fkey, finfo in results.items():
+        src = saveinfo.get(fkey, {}).get('src')
+        if 'err' not in finfo and src is not None and os.path.exists(src):
+            totbytes += os.path.getsize(src)
+    print("%s: transferred %s files (%0.1f MB) to %s archive at %0.1f MB/s" %
+          (task_label, len(results), totbytes/1024.0/1024.0, dest,
+           totbytes/1024.0/1024.0/elapsed if elapsed > 0 else 0))
 
     arc = ""
     if 'home_archive' in wcl and 'archive' in wcl:
@@ -1260,9 +1558,16 @@ def exechost_status(wrapnum):
 def job_thread(argv):
     """Run a task in a thread.
     """
+    # so even an unhandled exception reports which wrapper finished
+    wrapnum = '-1'
+    try:
+        wrapnum = argv[0]['wrapnum']
+    except (TypeError, IndexError, KeyError):
+        pass
     try:
         stdp = None
         stde = None
+        pfw_dbh = None
         wcl = WCL()
         wcl['wrap_usage'] = 0.0
         jobfiles = {}
@@ -1290,9 +1595,13 @@ def job_thread(argv):
 
             job_task_id = wcl['task_id']['job']
             sys.stdout.flush()
-            pfw_dbh = None
             if wcl['use_db']:
-                pfw_dbh = pfwdb.PFWDB()
+                pfw_dbh = pfwdb.get_pfwdb(config=wcl)
+                if miscutils.checkTrue(pfwdefs.PFWDB_WRITE_BEHIND, wcl, pfwdefs.PFWDB_WRITE_BEHIND_DEFAULT):
+                    flush_interval = None
+                    if pfwdefs.PFWDB_FLUSH_INTERVAL in wcl:
+                        flush_interval = wcl[pfwdefs.PFWDB_FLUSH_INTERVAL]
+                    pfw_dbh.set_write_behind(True, flush_interval)
                 wcl['task_id']['jobwrapper'] = pfw_dbh.create_task(name='jobwrapper',
                                                                    info_table=None,
                                                                    parent_task_id=job_task_id,
@@ -1326,6 +1635,10 @@ def job_thread(argv):
                 wcl['task_id']['wrapper'] = -1
                 exectid = -1
 
+            if pfw_dbh is not None:
+                # wrapper writes against these task ids from its own connection
+                pfw_dbh.flush()
+
             print("Running wrapper: %s" % (wrappercmd))
             sys.stdout.flush()
             starttime = time.time()
@@ -1349,7 +1662,7 @@ def job_thread(argv):
                 print(" %s/%s" % (wcl['log_archive_path'], logfilename))
             if wcl['use_db']:
                 if pfw_dbh is None:
-                    pfw_dbh = pfwdb.PFWDB()
+                    pfw_dbh = pfwdb.get_pfwdb(config=wcl)
             else:
                 print("DESDMTIME: run_wrapper %0.3f" % (time.time()-starttime))
 
@@ -1365,6 +1678,9 @@ def job_thread(argv):
             print(traceback.format_exc())
             exitcode = pfwdefs.PF_EXIT_FAILURE
         finally:
+            # flush any queued writes and hand connection back so the
+            # next wrapper in this worker skips the login
+            pfwdb.release_pfwdb(pfw_dbh)
             if stdp is not None:
                 sys.stdout = stdp.close()
             if stde is not None:
@@ -1377,7 +1693,7 @@ def job_thread(argv):
         exc_type, exc_value, exc_traceback = sys.exc_info()
         traceback.print_exception(exc_type, exc_value, exc_traceback,
                                   limit=4, file=sys.stdout)
-        return (1, None, None, 0.0, '-1')
+        return (1, None, None, 0.0, wrapnum)
 
 
 def terminate():
@@ -1427,6 +1743,7 @@ def results_checker(result):
     global donejobs
     global keeprunning
     global terminating
+    wrapnum = None
     try:
         (res, jobf, wcl, usage, wrapnum) = result
         jobfiles_global['outfullnames'].extend(jobf['outfullnames'])
@@ -1450,7 +1767,7 @@ def results_checker(result):
                     for wrapnm, (logfile, jobfiles) in job_track.items():
                         if os.path.isfile(logfile):
                             if wcl['use_db'] and pfw_dbh is None:
-                                pfw_dbh = pfwdb.PFWDB()
+                                pfw_dbh = pfwdb.get_pfwdb(config=wcl)
                         wcl['task_id']['jobwrapper'] = -1
                         filemgmt = dynam_load_filemgmt(wcl, pfw_dbh, None, wcl['task_id']['jobwrapper'])
 
@@ -1469,6 +1786,7 @@ def results_checker(result):
                     traceback.print_exception(exc_type, exc_value, exc_traceback,
                                               limit=4, file=sys.stdout)
                 finally:
+                    pfwdb.release_pfwdb(pfw_dbh)
                     keeprunning = False
     except:
         print("Error: thread monitoring encountered an unhandled exception.")
@@ -1479,6 +1797,143 @@ def results_checker(result):
         keeprunning = False
     finally:
         donejobs += 1
+        completed.put(wrapnum)
+
+
+def results_error(wrapnum, err):
+    """Method to record a wrapper whose thread raised instead of returning.
+    """
+    global results
+    global donejobs
+    global keeprunning
+
+    print("Error: wrapper %s thread raised an unhandled exception: %s" % (wrapnum, err))
+    results.append(1)
+    if stop_all:
+        keeprunning = False
+    donejobs += 1
+    completed.put(wrapnum)
+
+
+def wrapper_done(running, wrapnum):
+    """Remove a finished wrapper from running and return it with its elapsed time.
+    """
+    global results
+    global keeprunning
+
+    if wrapnum not in running:
+        if running:
+            # can't tell which wrapper finished, so don't mark any as done
+            # (its dependents could start before its outputs exist)
+            print("Error: unknown wrapper (%s) finished, not starting any more wrappers" % wrapnum)
+            results.append(1)
+            keeprunning = False
+        return (wrapnum, 0.0)
+    return (wrapnum, time.time() - running.pop(wrapnum))
+
+
+def stop_running(running):
+    """Stop starting wrappers and wait briefly for running ones to report back.
+    """
+    # empty the worker queue so nothing else starts
+    terminate()
+
+    # give the remaining wrappers a chance to report back
+    # so everything can clean up, otherwise risk a deadlock
+    busy = 0.0
+    deadline = time.time() + 5
+    while running and time.time() < deadline:
+        try:
+            busy += wrapper_done(running, completed.get(timeout=max(0.01, deadline - time.time())))[1]
+        except queue.Empty:
+            break
+    return busy
+
+
+def build_wrapper_dag(groups, inputs):
+    """Return the wrapnums each wrapper must wait for based upon its input files.
+    """
+    producers = {}
+    deps = OrderedDict()
+    for (_, _, procs) in groups:
+        for wrapnum in procs:
+            ins = inputs[wrapnum][3]
+            deps[wrapnum] = set([producers[os.path.basename(ifile)]
+                                 for isect in ins for ifile in ins[isect]
+                                 if os.path.basename(ifile) in producers])
+
+        # outputs only satisfy wrappers in later groups, same as the group barrier
+        for wrapnum in procs:
+            outs = inputs[wrapnum][4]
+            for osect in outs:
+                for ofile in outs[osect]:
+                    producers[os.path.basename(ofile)] = wrapnum
+
+    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+        miscutils.fwdebug_print("wrapper deps = %s" % deps)
+    return deps
+
+
+def wrapper_dag_workflow(groups, inputs):
+    """Run each wrapper as soon as the wrappers producing its inputs finish.
+    """
+    global results
+    global donejobs
+
+    deps = build_wrapper_dag(groups, inputs)
+    limits = {}
+    groupof = {}
+    for (task, nproc, procs) in groups:
+        limits[task] = nproc
+        for wrapnum in procs:
+            groupof[wrapnum] = task
+    maxproc = max(limits.values())
+    # wrappers from different groups may overlap so always use separate working dirs
+    mult = maxproc > 1
+
+    results = []
+    donejobs = 0
+    pending = list(deps.keys())
+    running = OrderedDict()
+    ingroup = dict.fromkeys(limits, 0)
+    finished = set()
+    busy = 0.0
+    dagstart = time.time()
+    try:
+        while (pending or running) and keeprunning:
+            for inp in list(pending):
+                if len(running) >= maxproc or not keeprunning:
+                    break
+                task = groupof[inp]
+                if ingroup[task] < limits[task] and deps[inp] <= finished:
+                    pending.remove(inp)
+                    ingroup[task] += 1
+                    if prefetcher is not None:
+                        prefetcher.wait(inp)
+                    running[inp] = time.time()
+                    pool.apply_async(job_thread, args=(inputs[inp] + (mult,),),
+                                     callback=results_checker,
+                                     error_callback=functools.partial(results_error, inp))
+            if not running:
+                break
+            # block until a wrapper finishes instead of polling
+            (wrapnum, elapsed) = wrapper_done(running, completed.get())
+            busy += elapsed
+            if wrapnum in groupof:
+                finished.add(wrapnum)
+                ingroup[groupof[wrapnum]] -= 1
+    finally:
+        if stop_all and results and max(results) > 0:
+            busy += stop_running(running)
+
+        dagwall = time.time() - dagstart
+        print("PFW: wrapper dag: %s/%s wrappers, max fw_nthread=%s, wall=%0.3f secs, idle=%0.3f secs" %
+              (donejobs, len(deps), maxproc, dagwall, max(0.0, maxproc * dagwall - busy)))
+        sys.stdout.flush()
+
+    if stop_all and results and max(results) > 0:
+        return max(results), jobfiles_global
+    return 0, jobfiles_global
 
 
 def job_workflow(workflow, jobfiles, jobwcl=WCL()):
@@ -1491,6 +1946,7 @@ def job_workflow(workflow, jobfiles, jobwcl=WCL()):
     global job_track
     global keeprunning
     global donejobs
+    global prefetcher
 
     with open(workflow, 'r') as workflowfh:
         # for each wrapper execution
@@ -1520,47 +1976,85 @@ def job_workflow(workflow, jobfiles, jobwcl=WCL()):
         # get all of the task groupings, they will be run in numerical order
         tasks = list(jobwcl["fw_groups"].keys())
         tasks.sort()
-        # loop over each grouping
-        for l, task in enumerate(tasks):
-            results = []   # the results of running each task in the group
+        groups = []
+        for task in tasks:
             # get the maximum number of parallel processes to run at a time
             nproc = int(jobwcl["fw_groups"][task]["fw_nthread"])
-            procs = miscutils.fwsplit(jobwcl["fw_groups"][task]["wrapnums"])
-            tempproc = []
             # pare down the list to include only those in this run
-            for p in procs:
-                if p in list(inputs.keys()):
-                    tempproc.append(p)
-            procs = tempproc
-
-            # set up the thread pool
-            pool = Pool(processes=nproc)
-            if nproc > 1:
-                mult = True
-            else:
-                mult = False
-
-            try:
+            procs = [p for p in miscutils.fwsplit(jobwcl["fw_groups"][task]["wrapnums"])
+                     if p in inputs]
+            if procs:
+                groups.append((task, nproc, procs))
+        if not groups:
+            return 0, jobfiles
+
+        if miscutils.checkTrue(pfwdefs.JOB_FILE_ARCHIVE_INFO, jobwcl,
+                               pfwdefs.JOB_FILE_ARCHIVE_INFO_DEFAULT):
+            # before the pool forks so the wrappers inherit the lookup
+            load_job_file_archive_info(jobwcl, dict([(wrapnum, inputs[wrapnum])
+                                                     for (_, _, procs) in groups
+                                                     for wrapnum in procs]))
+
+        # one pool, sized for the widest group, is reused by every group
+        pool = Pool(processes=max([nproc for (_, nproc, _) in groups]))
+        # started after the pool forks its workers
+        if miscutils.checkTrue(pfwdefs.PREFETCH_INPUTS, jobwcl, pfwdefs.PREFETCH_INPUTS_DEFAULT):
+            budget = float(jobwcl.get(pfwdefs.PREFETCH_BUDGET, pfwdefs.PREFETCH_BUDGET_DEFAULT))
+            prefetcher = InputPrefetcher(jobwcl, inputs,
+                                         [wrapnum for (_, _, procs) in groups for wrapnum in procs],
+                                         budget * 1024 * 1024)
+            prefetcher.start()
+        try:
+            if miscutils.checkTrue(pfwdefs.FW_DAG, jobwcl, pfwdefs.FW_DAG_DEFAULT):
+                # start wrappers by file dependencies instead of group barriers
+                return wrapper_dag_workflow(groups, inputs)
+
+            # loop over each grouping
+            for (task, nproc, procs) in groups:
+                results = []   # the results of running each task in the group
+                mult = nproc > 1
                 numjobs = len(procs)
                 donejobs = 0
-                # attach all the grouped tasks to the pool
-                [pool.apply_async(job_thread, args=(inputs[inp] + (mult,),),
-                                  callback=results_checker) for inp in procs]
-                pool.close()
-                while donejobs < numjobs and keeprunning:
-                    # wait until all are complete before continuing
-                    time.sleep(2)
-            finally:
-                if stop_all and max(results) > 0:
-                    # empty the worker queue so nothing else starts
-                    terminate()
-                    # wait so everything can clean up, otherwise risk a deadlock
-                    time.sleep(5)
-                del pool
+                pending = list(procs)
+                running = OrderedDict()
+                busy = 0.0
+                grpstart = time.time()
+                try:
+                    while (pending or running) and keeprunning:
+                        # keep at most nproc wrappers of this group in flight
+                        while pending and len(running) < nproc and keeprunning:
+                            inp = pending.pop(0)
+                            if prefetcher is not None:
+                                prefetcher.wait(inp)
+                            running[inp] = time.time()
+                            pool.apply_async(job_thread, args=(inputs[inp] + (mult,),),
+                                             callback=results_checker,
+                                             error_callback=functools.partial(results_error, inp))
+                        if not running:
+                            break
+                        # block until a wrapper finishes instead of polling
+                        busy += wrapper_done(running, completed.get())[1]
+                finally:
+                    if stop_all and results and max(results) > 0:
+                        busy += stop_running(running)
+
+                    grpwall = time.time() - grpstart
+                    print("PFW: fw_group %s: %s/%s wrappers, fw_nthread=%s, wall=%0.3f secs, idle=%0.3f secs" %
+                          (task, donejobs, numjobs, nproc, grpwall,
+                           max(0.0, nproc * grpwall - busy)))
+                    sys.stdout.flush()
 
-                jobfiles = jobfiles_global
-                if stop_all and max(results) > 0:
+                    jobfiles = jobfiles_global
+                if stop_all and results and max(results) > 0:
                     return max(results), jobfiles
+        finally:
+            if prefetcher is not None:
+                prefetcher.stop()
+                prefetcher = None
+            if not terminating:
+                pool.close()
+                pool.join()
+            del pool
     return 0, jobfiles
 
 
@@ -1723,8 +2217,14 @@ def call_compress_files(pfw_dbh, jobwcl, jobfiles, putinfo, exitcode):
         miscutils.fwdebug_print("0 files to compress")
     else:
         task_id = None
-        compress_ver = pfwutils.get_version(jobwcl[pfwdefs.COMPRESSION_EXEC],
-                                            jobwcl[pfwdefs.IW_EXEC_DEF])
+        backend = jobwcl.get(pfwdefs.COMPRESSION_BACKEND, pfwdefs.COMPRESSION_BACKEND_DEFAULT)
+        if backend == 'exec':
+            compress_name = jobwcl[pfwdefs.COMPRESSION_EXEC]
+            compress_ver = pfwutils.get_version(jobwcl[pfwdefs.COMPRESSION_EXEC],
+                                                jobwcl[pfwdefs.IW_EXEC_DEF])
+        else:
+            # record what actually does the compression
+            (compress_name, compress_ver) = pfwcompress.get_backend_info(backend)
         if pfw_dbh is not None:
             task_id = pfw_dbh.create_task(name='compress_files',
                                           info_table='compress_task',
@@ -1734,17 +2234,22 @@ def call_compress_files(pfw_dbh, jobwcl, jobfiles, putinfo, exitcode):
                                           do_begin=True,
                                           do_commit=True)
             # add to compress_task table
-            pfw_dbh.insert_compress_task(task_id, jobwcl[pfwdefs.COMPRESSION_EXEC],
+            pfw_dbh.insert_compress_task(task_id, compress_name,
                                          compress_ver, jobwcl[pfwdefs.COMPRESSION_ARGS],
                                          putinfo)
 
         errcnt = 0
         tot_bytes_after = 0
+        nprocs = int(jobwcl.get(pfwdefs.COMPRESSION_NPROCS, pfwdefs.COMPRESSION_NPROCS_DEFAULT))
+        max_io = jobwcl.get(pfwdefs.COMPRESSION_MAX_IO)
+        if max_io is not None:
+            max_io = int(max_io)
         (results, tot_bytes_before, tot_bytes_after) = pfwcompress.compress_files(to_compress,
                                                                                   jobwcl[pfwdefs.COMPRESSION_SUFFIX],
                                                                                   jobwcl[pfwdefs.COMPRESSION_EXEC],
                                                                                   jobwcl[pfwdefs.COMPRESSION_ARGS],
-                                                                                  3, jobwcl[pfwdefs.COMPRESSION_CLEANUP])
+                                                                                  3, jobwcl[pfwdefs.COMPRESSION_CLEANUP],
+                                                                                  nprocs, max_io, backend)
 
         filelist = []
         wgb_fnames = []
@@ -11,6 +11,11 @@ import copy
 import re
 import time
 import json
+import shlex
+import shutil
+import traceback
+import multiprocessing
+import concurrent.futures
 from collections import OrderedDict
 
 import despymisc.miscutils as miscutils
@@ -29,6 +34,7 @@ import intgutils.queryutils as queryutils
 import processingfw.pfwdefs as pfwdefs
 import processingfw.pfwutils as pfwutils
 import processingfw.pfwcondor as pfwcondor
+import processingfw.pfwmasterlist as pfwmasterlist
 
 
 def get_datasect_types(config, modname):
@@ -474,8 +480,7 @@ def assign_file_to_wrapper_inst(config, theinputs, theoutputs, moddict,
         #    miscutils.fwdebug_print("Added to wrapoutputs %s" % moddict[pfwdefs.SW_FILESECT][fsectname]['fullname'])
         #    winst['wrapoutputs'][len(winst['wrapoutputs'])+1] = moddict[pfwdefs.SW_FILESECT][fsectname]['fullname']
     else:
-        sobj = copy.deepcopy(winst)
-        sobj.update(finfo)   # order matters file values must override winst values
+        sobj = pfwutils.search_overlay(finfo, winst)   # file values must override winst values
 
         # note: save keys/vals used when creating filenames in order to use to create future filenames
 
@@ -523,15 +528,7 @@ def assign_file_to_wrapper_inst(config, theinputs, theoutputs, moddict,
             finfo['filename'] = fnames
             filelist.append(finfo)
 
-        if modname not in masterdata:
-            masterdata[modname] = OrderedDict()
-
-        if fkey in masterdata[modname]:
-            initcnt = len(masterdata[modname][fkey]['list']['line']) + 1
-            newdata = queryutils.convert_single_files_to_lines(filelist, initcnt)
-            masterdata[modname][fkey]['list']['line'].update(newdata['list']['line'])
-        else:
-            masterdata[modname][fkey] = queryutils.convert_single_files_to_lines(filelist)
+        save_file_info(masterdata, modname, fkey, filelist)
 
         if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
             miscutils.fwdebug_print("saved file info for %s.%s" % (modname, fkey))
@@ -571,6 +568,20 @@ def assign_file_to_wrapper_inst(config, theinputs, theoutputs, moddict,
         miscutils.fwdebug_print("END: winst=%s" % winst)
 
 
+def save_file_info(masterdata, modname, fkey, filelist):
+    """Save info for files created for a wrapper instance as if read from query.
+    """
+    if modname not in masterdata:
+        masterdata[modname] = OrderedDict()
+
+    if fkey in masterdata[modname]:
+        initcnt = len(masterdata[modname][fkey]['list']['line']) + 1
+        newdata = queryutils.convert_single_files_to_lines(filelist, initcnt)
+        masterdata[modname][fkey]['list']['line'].update(newdata['list']['line'])
+    else:
+        masterdata[modname][fkey] = queryutils.convert_single_files_to_lines(filelist)
+
+
 def assign_list_to_wrapper_inst(config, theinputs, theoutputs, moddict, currvals,
                                 winst, lname, ldict, sublists):
     """Assign list to wrapper instance.
@@ -586,8 +597,7 @@ def assign_list_to_wrapper_inst(config, theinputs, theoutputs, moddict, currvals
         winst[pfwdefs.IW_LISTSECT] = OrderedDict()
 
     ### create an object that has values from ldict and winst
-    sobj = copy.deepcopy(ldict)
-    sobj.update(winst)
+    sobj = pfwutils.search_overlay(winst, ldict)
 
     if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
         miscutils.fwdebug_print("sobj = %s" % (sobj))
@@ -752,7 +762,7 @@ def output_list(config, sublist, sobj, lname, currvals):
         miscutils.fwdebug_print("creating listdir and listname")
 
     # list dir and filename must use current attempt values
-    currvals2 = copy.deepcopy(currvals)
+    currvals2 = pfwutils.search_overlay(currvals)
     currvals2[pfwdefs.REQNUM] = config.getfull(pfwdefs.REQNUM)
     currvals2[pfwdefs.UNITNAME] = config.getfull(pfwdefs.UNITNAME)
     currvals2[pfwdefs.ATTNUM] = config.getfull(pfwdefs.ATTNUM)
@@ -801,12 +811,12 @@ def output_list(config, sublist, sobj, lname, currvals):
 
         sort_key = sort_key.lower()
 
+        sort_getter = compile_value_getter(sort_key, None, 1)
         if sort_numeric:
             lines = sorted(lines, reverse=sort_reverse,
-                           key=lambda k: float(get_value_from_line(k, sort_key, None, 1)))
+                           key=lambda k: float(sort_getter(k)))
         else:
-            lines = sorted(lines, reverse=sort_reverse,
-                           key=lambda k: get_value_from_line(k, sort_key, None, 1))
+            lines = sorted(lines, reverse=sort_reverse, key=sort_getter)
 
     allow_missing = False
     if 'allow_missing' in sobj:
@@ -818,11 +828,12 @@ def output_list(config, sublist, sobj, lname, currvals):
 
     if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
         miscutils.fwdebug_print("Writing list to file %s" % listname)
+    if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
+        miscutils.fwdebug_print("columns = %s" % columns)
+    write_line = compile_list_writer(columns[0], lineformat, allow_missing)
     with open(listname, "w") as listfh:
         for linedict in lines:
-            if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
-                miscutils.fwdebug_print("columns = %s" % columns)
-            output_line(listfh, linedict, lineformat, allow_missing, columns[0])
+            write_line(listfh, linedict)
 
     if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
         miscutils.fwdebug_print("END\n\n")
@@ -835,66 +846,129 @@ def output_line(listfh, line, lineformat, allow_missing, keyarr):
     if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
         miscutils.fwdebug_print("BEG line=%s  keyarr=%s" % (line, keyarr))
 
-    lineformat = lineformat.lower()
+    compile_list_writer(keyarr, lineformat, allow_missing)(listfh, line)
 
-    if lineformat == 'config' or lineformat == 'wcl':
-        listfh.write("<file>\n")
 
-    numkeys = len(keyarr)
-    for i in range(0, numkeys):
-        key = keyarr[i]
-        value = None
-        if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
-            miscutils.fwdebug_print("key: %s" % key)
+def get_line_values(line, key, nickname=None):
+    """Return unique values for lowercase key in a master list line.
 
-        valuefmt = None
-        if key.startswith('$FMT{'):
-            rmatch = re.match(r'\$FMT\{\s*([^,]+)\s*,\s*(\S+)\s*\}', key)
-            if rmatch:
-                valuefmt = rmatch.group(1).strip()
-                key = rmatch.group(2).strip()
-                if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
-                    miscutils.fwdebug_print("valuefmt = %s, key = %s" % (valuefmt, key))
-            else:
-                miscutils.fwdie("Error: invalid FMT column: %s" % (key), pfwdefs.PF_EXIT_FAILURE)
+    Same search as get_value_from_line without its debugging and conversions.
+    """
+    valhash = {}
+    if key in line:
+        valhash[line[key]] = True
 
-        if '.' in key:
-            if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
-                miscutils.fwdebug_print("Found period in key")
-            [nickname, key2] = key.replace(' ', '').split('.')
-            if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
-                miscutils.fwdebug_print("\tnickname = %s, key2 = %s" % (nickname, key2))
-            value = get_value_from_line(line, key2, nickname, None)
-            if value == None:
-                if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
-                    miscutils.fwdebug_print("Didn't find value in line with nickname %s" % (nickname))
-                    miscutils.fwdebug_print("Trying to find %s without nickname" % (key2))
-                value = get_value_from_line(line, key2, None, 1)
-                if value == None:
-                    if allow_missing:
-                        value = ""
-                    else:
-                        miscutils.fwdie("Error: could not find value %s for line...\n%s" %
-                                        (key, line), pfwdefs.PF_EXIT_FAILURE)
-                else: # assume nickname was really table name
-                    if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
-                        miscutils.fwdebug_print("\tassuming nickname (%s) was really table name" % (nickname))
-                    key = key2
+    if 'file' in line:
+        files = line['file']
+        if nickname is not None:
+            if nickname in files and key in files[nickname]:
+                valhash[files[nickname][key]] = True
         else:
-            value = get_value_from_line(line, key, None, 1)
+            for fdict in files.values():
+                if key in fdict:
+                    valhash[fdict[key]] = True
 
-        # handle last field (separate to avoid trailing comma)
-        if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
-            miscutils.fwdebug_print("printing key=%s value=%s" % (key, value))
-        if i == numkeys - 1:
-            print_value(listfh, key, value, lineformat, True, valuefmt)
+    return list(valhash)
+
+
+def compile_value_getter(key, nickname=None, numvals=None):
+    """Return function equivalent to get_value_from_line for a fixed key.
+    """
+    key = key.lower()
+    if '.' in key:
+        (nickname, key) = key.split('.')
+
+    def getter(line):
+        valarr = get_line_values(line, key, nickname)
+        if numvals is not None and len(valarr) != numvals:
+            # let get_value_from_line report the problem
+            return get_value_from_line(line, key, nickname, numvals)
+        if len(valarr) == 0:
+            return None
+        if numvals == 1 or len(valarr) == 1:
+            return str(valarr[0]).strip()
+        return str(valarr).strip()
+
+    return getter
+
+
+def compile_value_format(valuefmt):
+    """Return function applying a $FMT format to a value as print_value does.
+    """
+    if valuefmt is None:
+        return str
+    if re.search(r'%\d*d', valuefmt):
+        return lambda value: valuefmt % int(value)
+    if re.search(r'%\d*(.\d+)f', valuefmt):
+        return lambda value: valuefmt % float(value)
+    return lambda value: valuefmt % value
+
+
+def compile_list_column(key, allow_missing):
+    """Return function giving (key, formatted value) for a list column in a line.
+    """
+    valuefmt = None
+    if key.startswith('$FMT{'):
+        rmatch = re.match(r'\$FMT\{\s*([^,]+)\s*,\s*(\S+)\s*\}', key)
+        if rmatch:
+            valuefmt = rmatch.group(1).strip()
+            key = rmatch.group(2).strip()
         else:
-            print_value(listfh, key, value, lineformat, False, valuefmt)
+            miscutils.fwdie("Error: invalid FMT column: %s" % (key), pfwdefs.PF_EXIT_FAILURE)
+    fmtvalue = compile_value_format(valuefmt)
+
+    if '.' not in key:
+        getter = compile_value_getter(key, None, 1)
+        return lambda line: (key, fmtvalue(getter(line)))
+
+    [nickname, key2] = key.replace(' ', '').split('.')
+    nickgetter = compile_value_getter(key2, nickname, None)
+    anygetter = compile_value_getter(key2, None, 1)
+
+    def column(line):
+        value = nickgetter(line)
+        if value is not None:
+            return (key, fmtvalue(value))
 
-    if lineformat == "config" or lineformat == 'wcl':
-        listfh.write("</file>\n")
+        value = anygetter(line)
+        if value is None:
+            if allow_missing:
+                return (key, fmtvalue(""))
+            miscutils.fwdie("Error: could not find value %s for line...\n%s" %
+                            (key, line), pfwdefs.PF_EXIT_FAILURE)
+        # assume nickname was really table name
+        return (key2, fmtvalue(value))
+
+    return column
+
+
+def compile_list_writer(keyarr, lineformat, allow_missing):
+    """Return function writing a master list line to an input list file.
+
+    Column specs are parsed once so many lines can be written quickly.
+    """
+    lineformat = lineformat.lower()
+    columns = [compile_list_column(key, allow_missing) for key in keyarr]
+
+    if lineformat == 'config' or lineformat == 'wcl':
+        def writer(listfh, line):
+            parts = ["<file>\n"]
+            for column in columns:
+                parts.append("     %s=%s\n" % column(line))
+            parts.append("</file>\n")
+            listfh.write(''.join(parts))
     else:
-        listfh.write("\n")
+        if lineformat == 'textcsv':
+            sep = ', '
+        elif lineformat == 'texttab':
+            sep = '\t'
+        else:
+            sep = ' '
+
+        def writer(listfh, line):
+            listfh.write(sep.join([column(line)[1] for column in columns]) + "\n")
+
+    return writer
 
 
 def print_value(outfh, key, value, lineformat, last, valuefmt):
@@ -1014,8 +1088,7 @@ def finish_wrapper_inst(config, modname, winst, outfsect):
                 if pfwdefs.DIRPAT not in fdict:
                     print("Warning: Could not find %s in %s's section" % (pfwdefs.DIRPAT, fname))
                 else:
-                    searchobj = copy.deepcopy(fdict)
-                    searchobj.update(winst)
+                    searchobj = pfwutils.search_overlay(winst, fdict)
                     searchopts['searchobj'] = searchobj
                     winst[pfwdefs.IW_FILESECT][fname]['archivepath'] = config.get_filepath('ops',
                                                                                            fdict[pfwdefs.DIRPAT], searchopts)
@@ -1202,7 +1275,10 @@ def write_jobwcl(config, jobkey, jobdict):
         for key in [pfwdefs.COMPRESSION_EXEC,
                     pfwdefs.COMPRESSION_ARGS,
                     pfwdefs.COMPRESSION_SUFFIX,
-                    pfwdefs.COMPRESSION_CLEANUP]:
+                    pfwdefs.COMPRESSION_CLEANUP,
+                    pfwdefs.COMPRESSION_NPROCS,
+                    pfwdefs.COMPRESSION_MAX_IO,
+                    pfwdefs.COMPRESSION_BACKEND]:
             if key in config:
                 jobwcl[key] = config.get(key)
 
@@ -1222,6 +1298,31 @@ def write_jobwcl(config, jobkey, jobdict):
     else:
         jobwcl[pfwdefs.MASTER_SAVE_FILE] = pfwdefs.MASTER_SAVE_FILE_DEFAULT
 
+    (exists, fw_dag) = config.search(pfwdefs.FW_DAG, {intgdefs.REPLACE_VARS: True})
+    if exists:
+        jobwcl[pfwdefs.FW_DAG] = miscutils.convertBool(fw_dag)
+    else:
+        jobwcl[pfwdefs.FW_DAG] = pfwdefs.FW_DAG_DEFAULT
+
+    (exists, prefetch) = config.search(pfwdefs.PREFETCH_INPUTS, {intgdefs.REPLACE_VARS: True})
+    if exists:
+        jobwcl[pfwdefs.PREFETCH_INPUTS] = miscutils.convertBool(prefetch)
+    else:
+        jobwcl[pfwdefs.PREFETCH_INPUTS] = pfwdefs.PREFETCH_INPUTS_DEFAULT
+
+    (exists, jobinfo) = config.search(pfwdefs.JOB_FILE_ARCHIVE_INFO, {intgdefs.REPLACE_VARS: True})
+    if exists:
+        jobwcl[pfwdefs.JOB_FILE_ARCHIVE_INFO] = miscutils.convertBool(jobinfo)
+    else:
+        jobwcl[pfwdefs.JOB_FILE_ARCHIVE_INFO] = pfwdefs.JOB_FILE_ARCHIVE_INFO_DEFAULT
+
+    for key in [pfwdefs.PFWDB_WRITE_BEHIND, pfwdefs.PFWDB_FLUSH_INTERVAL,
+                pfwdefs.PFWDB_POOL_MAX_SIZE, pfwdefs.PFWDB_POOL_MAX_IDLE,
+                pfwdefs.TRANSFER_CONCURRENT, pfwdefs.TRANSFER_STREAMS,
+                pfwdefs.PREFETCH_BUDGET]:
+        if key in config:
+            jobwcl[key] = config.getfull(key)
+
     target_archive = init_use_archive_info(config, jobwcl, pfwdefs.USE_TARGET_ARCHIVE_INPUT,
                                            pfwdefs.USE_TARGET_ARCHIVE_OUTPUT, pfwdefs.TARGET_ARCHIVE)
     home_archive = init_use_archive_info(config, jobwcl, pfwdefs.USE_HOME_ARCHIVE_INPUT,
@@ -1447,6 +1548,90 @@ def create_wrapper_inst(config, modname, loopvals):
     return wrapperinst
 
 
+def build_wrapper_inst(config, modname, winst, masterdata, sublists, infsect, outfsect):
+    """Assign data to a wrapper instance, finish it and write its wrapper wcl.
+
+    Returns the input and output files of the instance.
+    """
+    assign_data_wrapper_inst(config, modname, winst, masterdata, sublists, infsect, outfsect)
+    finish_wrapper_inst(config, modname, winst, outfsect)
+    return create_module_wrapper_wcl(config, modname, winst)
+
+
+# set in the parent right before forking the pool so workers inherit
+# config, master data and sublists instead of having them pickled
+_WRAPINST_ARGS = None
+
+
+def _build_wrapper_inst_worker(winst):
+    """Build a single wrapper instance in a pool worker.
+    """
+    (config, modname, sublists, infsect, outfsect) = _WRAPINST_ARGS
+
+    # files created for this instance are returned for the parent's master data
+    newdata = OrderedDict()
+    try:
+        files = build_wrapper_inst(config, modname, winst, newdata, sublists, infsect, outfsect)
+    except BaseException:   # fwdie exits which would otherwise hang the pool
+        raise Exception("Error building wrapper instance %s:\n%s" %
+                        (winst[pfwdefs.PF_WRAPNUM], traceback.format_exc()))
+
+    newfiles = OrderedDict()
+    for fkey, master in newdata.get(modname, {}).items():
+        newfiles[fkey] = [list(line['file'].values())[0]
+                          for line in master['list'][intgdefs.LISTENTRY].values()]
+    sys.stdout.flush()
+    return (winst, files, newfiles)
+
+
+def build_wrapper_insts(config, modname, wrapinst, masterdata, sublists, infsect, outfsect):
+    """Build all wrapper instances for a module, in parallel if configured.
+
+    Wrapnums are already assigned, so instances are independent of each other.
+    Returns list of (winst, files) in the order of wrapinst.
+    """
+    global _WRAPINST_ARGS
+
+    (exists, nproc) = config.search(pfwdefs.WRAPINST_NPROC,
+                                    {pfwdefs.PF_CURRVALS: {'curr_module': modname},
+                                     intgdefs.REPLACE_VARS: True})
+    if not exists:
+        nproc = pfwdefs.WRAPINST_NPROC_DEFAULT
+    nproc = max(1, min(int(nproc), len(wrapinst)))
+
+    starttime = time.time()
+    results = []
+    if nproc == 1:
+        for winst in wrapinst.values():
+            files = build_wrapper_inst(config, modname, winst, masterdata, sublists,
+                                       infsect, outfsect)
+            results.append((winst, files))
+    else:
+        sys.stdout.flush()
+        _WRAPINST_ARGS = (config, modname, sublists, infsect, outfsect)
+        pool = multiprocessing.get_context('fork').Pool(nproc)
+        try:
+            chunksize = max(1, min(100, len(wrapinst) // (nproc * 4)))
+            for (winst, files, newfiles) in pool.imap(_build_wrapper_inst_worker,
+                                                      wrapinst.values(), chunksize):
+                # merge in wrapnum order so master data matches a serial run
+                wrapinst[winst['wrapkeys']] = winst
+                for fkey, filelist in newfiles.items():
+                    save_file_info(masterdata, modname, fkey, filelist)
+                results.append((winst, files))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _WRAPINST_ARGS = None
+
+    print("DESDMTIME: build_wrapper_insts %s %0.3f (%s wrappers, %s procs)" %
+          (modname, time.time()-starttime, len(wrapinst), nproc))
+    return results
+
+
 def create_new_filename(config, fsectname, fsectdict, sobj, currvals):
 
     miscutils.fwdebug_print("BEG")
@@ -1455,8 +1640,7 @@ def create_new_filename(config, fsectname, fsectdict, sobj, currvals):
     miscutils.fwdebug_print("sobj=%s" % sobj)
     miscutils.fwdebug_print("currvals=%s" % currvals)
 
-    new_sobj = copy.deepcopy(fsectdict)
-    new_sobj.update(sobj)
+    new_sobj = pfwutils.search_overlay(sobj, fsectdict)
 
     # see if wcl specifies filename directly
     if 'filename' in fsectdict:
@@ -1531,8 +1715,7 @@ def create_new_depends_filenames(config, master, modname, flabel):
                 if 'fullname' in newfinfo:
                     del newfinfo['fullname']
 
-                sobj = copy.deepcopy(newfinfo)
-                sobj.update(fsectdict)
+                sobj = pfwutils.search_overlay(fsectdict, newfinfo)
 
                 filelist = create_new_filename(config, flabel, fsectdict, sobj, currvals)
                 #print type(filelist), filelist
@@ -1622,6 +1805,8 @@ def read_master_lists(config, modname, masterdata, modules_prev_in_list):
                 master = None
                 with open(qoutfile, 'r') as jsonfh:
                     master = json.load(jsonfh)
+            elif qouttype == pfwmasterlist.COLUMNAR_FORMAT:
+                master = pfwmasterlist.read_master_list(qoutfile)
             elif qouttype == 'xml':
                 raise Exception("xml datasets not supported yet")
             elif qouttype == 'wcl':
@@ -1683,6 +1868,69 @@ def read_master_lists(config, modname, masterdata, modules_prev_in_list):
     miscutils.fwdebug_print("END\n\n")
 
 
+def get_masterdata_last_use(config, modulelist):
+    """Return index in modulelist of the last module needing each module's master data.
+    """
+    last_use = {}
+    for num, modname in enumerate(modulelist):
+        last_use[modname.lower()] = num
+        if modname not in config[pfwdefs.SW_MODULESECT]:
+            continue
+        for (_, sdict) in config.combine_lists_files(modname):
+            for dkey in [pfwdefs.DATA_DEPENDS, 'depends-newname']:
+                if dkey in sdict:
+                    depmod = miscutils.fwsplit(sdict[dkey], '.')[0].lower()
+                    last_use[depmod] = max(num, last_use.get(depmod, num))
+    return last_use
+
+
+def free_masterdata(masterdata, last_use, num):
+    """Free master data no module after the num-th one depends upon.
+    """
+    for modname in list(masterdata.keys()):
+        if last_use.get(modname.lower(), -1) <= num:
+            if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
+                miscutils.fwdebug_print("freeing master data for %s" % modname)
+            del masterdata[modname]
+
+
+def register_wrapper_files(filelist, tempfiles, num):
+    """Record files read and written by a wrapper instance of the num-th module.
+
+    filelist['infiles'] maps each file to the first module reading it and
+    filelist['outfiles'] maps each file to the last module writing it.
+    """
+    infiles = filelist['infiles']
+    for fl in tempfiles['infiles']:
+        if fl not in infiles:
+            infiles[fl] = num
+
+    outfiles = filelist['outfiles']
+    for fl in tempfiles['outfiles']:
+        outfiles[fl] = num
+
+
+def get_block_input_files(filelist):
+    """Return input files not produced within the block.
+
+    Dies listing every file read by a module at or before the one producing it.
+    """
+    outfiles = filelist['outfiles']
+    blockinputs = []
+    badorder = []
+    for fl, innum in filelist['infiles'].items():
+        outnum = outfiles.get(fl)
+        if outnum is None:
+            blockinputs.append(fl)
+        elif innum <= outnum:
+            badorder.append(fl)
+
+    if len(badorder) > 0:
+        raise Exception("The following input files are requested before they are generated: " +
+                        ",".join(badorder))
+    return blockinputs
+
+
 def remove_column_format(columns):
     """Return columns minus any formatting specification.
     """
@@ -1757,7 +2005,7 @@ def create_fullnames(config, modname, masterdata):
                             if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
                                 miscutils.fwdebug_print("flabel=%s" % flabel)
                             if flabel in moddict[pfwdefs.SW_FILESECT]:
-                                dictcurr[flabel] = copy.deepcopy(moddict[pfwdefs.SW_FILESECT][flabel])
+                                dictcurr[flabel] = pfwutils.search_overlay(moddict[pfwdefs.SW_FILESECT][flabel])
                                 dictcurr[flabel]['curr_module'] = modname
                             else:
                                 print("list files = ", list(moddict[pfwdefs.SW_FILESECT].keys()))
@@ -1789,7 +2037,7 @@ def create_fullnames(config, modname, masterdata):
             else:  # file
                 if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
                     miscutils.fwdebug_print("file sect: sname=%s" % sname)
-                currvals = copy.deepcopy(sdict)
+                currvals = pfwutils.search_overlay(sdict)
                 currvals['curr_module'] = modname
 
                 for llabel, ldict in list(master['list'][intgdefs.LISTENTRY].items()):
@@ -1823,32 +2071,16 @@ def create_sublists(config, modname, masterdata):
             if numlines == 0:
                 miscutils.fwdie("Error: 0 lines in master list", pfwdefs.PF_EXIT_FAILURE)
 
-            sublists[sname] = OrderedDict()
             keys = get_match_keys(sdict)
 
             if len(keys) > 0:
-                sdict['keyvals'] = OrderedDict()
                 print("\t%s-%s: dividing by %s" % (modname, sname, keys))
-                for linenick, linedict in list(master['list'][intgdefs.LISTENTRY].items()):
-                    index = ""
-                    listkeys = []
-                    for key in keys:
-                        if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
-                            miscutils.fwdebug_print("key = %s" % key)
-                            miscutils.fwdebug_print("linedict = %s" % linedict)
-                        val = get_value_from_line(linedict, key, None, 1)
-                        index += val + '_'
-                        listkeys.append(val)
-                    sdict['keyvals'][index] = listkeys
-                    if index not in sublists[sname]:
-                        sublists[sname][index] = {'list': {intgdefs.LISTENTRY: OrderedDict()}}
-                    sublists[sname][index]['list'][intgdefs.LISTENTRY][linenick] = copy.deepcopy(linedict)
-                    if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
-                        miscutils.fwdebug_print("index = %s" % index)
-                        miscutils.fwdebug_print("listkeys = %s" % listkeys)
-
+                (sublists[sname], sdict['keyvals']) = divide_master_list(master, keys)
             else:
-                sublists[sname]['onlyone'] = copy.deepcopy(master)
+                lines = master['list'][intgdefs.LISTENTRY]
+                sublists[sname] = OrderedDict()
+                sublists[sname]['onlyone'] = {'list': {intgdefs.LISTENTRY:
+                                                       pfwmasterlist.MasterListView(lines, list(lines.keys()))}}
 
             #del masterdata[modname][sname]
 
@@ -1867,6 +2099,39 @@ def create_sublists(config, modname, masterdata):
     return sublists
 
 
+def divide_master_list(master, keys):
+    """Group lines of master list by their values for keys.
+
+    Returns sublists keyed by index string along with the key values for each
+    index.  Sublists are views sharing the master list's lines, not copies.
+    """
+    lines = master['list'][intgdefs.LISTENTRY]
+
+    # tuple of key values -> line nicknames
+    groups = OrderedDict()
+    for linenick, linedict in lines.items():
+        vals = tuple(get_value_from_line(linedict, key, None, 1) for key in keys)
+        if vals in groups:
+            groups[vals].append(linenick)
+        else:
+            groups[vals] = [linenick]
+
+    sublists = OrderedDict()
+    keyvals = OrderedDict()
+    for vals, linenicks in groups.items():
+        index = ''.join([val + '_' for val in vals])
+        if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
+            miscutils.fwdebug_print("index = %s" % index)
+            miscutils.fwdebug_print("listkeys = %s" % list(vals))
+        if index in sublists:    # different values joining into same index string
+            linenicks = list(sublists[index]['list'][intgdefs.LISTENTRY]) + linenicks
+        keyvals[index] = list(vals)
+        sublists[index] = {'list': {intgdefs.LISTENTRY:
+                                    pfwmasterlist.MasterListView(lines, linenicks)}}
+
+    return (sublists, keyvals)
+
+
 def get_wrap_iter_obj_key(config, moddict):
     """Get wrapper iter object key.
     """
@@ -2719,15 +2984,47 @@ def create_jobmngr_dag(config, dagfile, scriptfile, joblist):
     miscutils.fwdebug_print("END\n\n")
 
 
-def tar_inputfiles(config, jobnum, inlist):
-    """Tar the input wcl files for a single job.
-    """
-    inputtar = config.get_filename('inputwcltar', {pfwdefs.PF_CURRVALS: {'jobnum': jobnum}})
-    tjpad = pfwutils.pad_jobnum(jobnum)
-    miscutils.coremakedirs(tjpad)
+def tar_all_inputfiles(config, joblist):
+    """Tar the input wcl files for all jobs concurrently.
 
-    pfwutils.tar_list("%s/%s" % (tjpad, inputtar), inlist)
-    return inputtar
+    Sets inputwcltar in each job's dictionary.
+    """
+    (exists, nthreads) = config.search(pfwdefs.TAR_NTHREADS, {intgdefs.REPLACE_VARS: True})
+    if not exists:
+        nthreads = pfwdefs.TAR_NTHREADS_DEFAULT
+    nthreads = max(1, min(int(nthreads), len(joblist)))
+
+    (exists, compressor) = config.search(pfwdefs.TAR_COMPRESSOR, {intgdefs.REPLACE_VARS: True})
+    if not exists:
+        compressor = None
+    elif compressor and not shutil.which(shlex.split(compressor)[0]):
+        print("Warning: could not find %s, using python gzip for input wcl tarballs" %
+              compressor)
+        compressor = None
+
+    # determine names in main thread since config isn't thread-safe
+    tars = []
+    for jobdict in joblist.values():
+        jobnum = jobdict['jobnum']
+        inputtar = config.get_filename('inputwcltar', {pfwdefs.PF_CURRVALS: {'jobnum': jobnum}})
+        tjpad = pfwutils.pad_jobnum(jobnum)
+        miscutils.coremakedirs(tjpad)
+        jobdict['inputwcltar'] = inputtar
+        tars.append((jobnum, "%s/%s" % (tjpad, inputtar), jobdict['inwcl'] + jobdict['inlist']))
+
+    def tar_job(tarinfo):
+        (jobnum, tarname, inlist) = tarinfo
+        starttime = time.time()
+        pfwutils.tar_list(tarname, inlist, compressor)
+        return (jobnum, len(inlist), time.time() - starttime)
+
+    starttime = time.time()
+    # tarfile's compression and file I/O release the GIL so threads are enough
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nthreads) as executor:
+        for (jobnum, numfiles, elapsed) in executor.map(tar_job, tars):
+            print("DESDMTIME: tar_inputfiles %s %0.3f (%s files)" % (jobnum, elapsed, numfiles))
+    print("DESDMTIME: tar_all_inputfiles %0.3f (%s jobs, %s threads)" %
+          (time.time() - starttime, len(tars), nthreads))
 
 
 def create_runjob_condorfile(config, scriptfile):
@@ -0,0 +1,161 @@
+"""Checkpoints allowing a failed begblock to resume after its last completed module.
+
+The manifest records, per completed module, hashes of the query outputs and
+the wrapper wcl and list files written for it.  A module's master data only
+changes while that module runs, so it is pickled once, when the module
+completes, to a file of its own.  The rest of the state needed by later
+modules (joblist, etc.) is pickled and the config is saved as wcl after each
+module.  When begblock is rerun, the checkpoint is only used if every
+recorded file still matches its hash.
+"""
+
+import os
+import glob
+import json
+import pickle
+import hashlib
+from collections import OrderedDict
+
+import despymisc.miscutils as miscutils
+import processingfw.pfwdefs as pfwdefs
+import processingfw.pfwconfig as pfwconfig
+
+MANIFEST_FILE = 'begblock_checkpoint.json'
+STATE_FILE = 'begblock_checkpoint.pkl'
+CONFIG_FILE = 'begblock_checkpoint.wcl'
+MASTERDATA_FILE = 'begblock_checkpoint_%s.pkl'   # per module
+
+
+def use_checkpoint(config):
+    """Return whether begblock should save and resume from checkpoints.
+    """
+    return miscutils.checkTrue(pfwdefs.BEGBLOCK_CHECKPOINT, config,
+                               pfwdefs.BEGBLOCK_CHECKPOINT_DEFAULT)
+
+
+def hash_file(filename):
+    """Return sha1 hex digest of a file's contents.
+    """
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as infh:
+        for chunk in iter(lambda: infh.read(1024*1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_query_outputs(config, modname):
+    """Return the query output files for a module.
+    """
+    return [sdict['qoutfile'] for (_, sdict) in config.combine_lists_files(modname)
+            if 'qoutfile' in sdict]
+
+
+def _replace_file(filename, writefunc, mode='w'):
+    """Write a file via a temporary file so a crash never leaves it partial.
+    """
+    tmpname = filename + '.tmp'
+    with open(tmpname, mode) as outfh:
+        writefunc(outfh)
+    os.replace(tmpname, filename)
+
+
+def _dump(obj):
+    """Return function pickling obj to an open file.
+    """
+    return lambda outfh: pickle.dump(obj, outfh, pickle.HIGHEST_PROTOCOL)
+
+
+def save_checkpoint(config, modname, files, masterdata, state):
+    """Record module as completed along with the state needed to resume after it.
+
+    files are the wrapper wcl and list files written for the module, masterdata is
+    the master data still kept and state is a dictionary of begblock's other
+    in-memory data.
+    """
+    manifest = {'modules': []}
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, 'r') as infh:
+            manifest = json.load(infh)
+
+    modinfo = {'modname': modname,
+               'queries': {fname: hash_file(fname) for fname in get_query_outputs(config, modname)},
+               'files': {fname: hash_file(fname) for fname in files},
+               'masterdata': None}
+    if modname in masterdata:
+        modinfo['masterdata'] = MASTERDATA_FILE % modname
+        _replace_file(modinfo['masterdata'], _dump(masterdata[modname]), 'wb')
+    manifest['modules'].append(modinfo)
+
+    state = dict(state)
+    state['masterdata_modules'] = list(masterdata.keys())
+    _replace_file(CONFIG_FILE, config.write)
+    _replace_file(STATE_FILE, _dump(state), 'wb')
+    # manifest last so it never refers to state from a different module
+    _replace_file(MANIFEST_FILE, lambda outfh: json.dump(manifest, outfh, indent=4))
+    print("\tSaved begblock checkpoint after module %s (%s files)" %
+          (modname, len(modinfo['files']) + len(modinfo['queries'])))
+
+
+def check_manifest(modulelist):
+    """Return manifest if checkpoint is valid for modulelist, else None.
+
+    Valid means the completed modules are the start of modulelist and every
+    recorded file still matches its hash.
+    """
+    if not os.path.exists(MANIFEST_FILE):
+        return None
+
+    with open(MANIFEST_FILE, 'r') as infh:
+        manifest = json.load(infh)
+
+    completed = [modinfo['modname'] for modinfo in manifest['modules']]
+    if len(completed) == 0:
+        return None
+    if completed != modulelist[:len(completed)]:
+        print("Warning: begblock checkpoint modules %s don't match module list, ignoring" %
+              completed)
+        return None
+
+    for modinfo in manifest['modules']:
+        for fname, fhash in list(modinfo['queries'].items()) + list(modinfo['files'].items()):
+            if not os.path.exists(fname) or hash_file(fname) != fhash:
+                print("Warning: %s changed since begblock checkpoint, ignoring checkpoint" %
+                      fname)
+                return None
+        if modinfo['masterdata'] is not None and not os.path.exists(modinfo['masterdata']):
+            print("Warning: missing %s, ignoring checkpoint" % modinfo['masterdata'])
+            return None
+
+    return manifest
+
+
+def load_checkpoint(modulelist):
+    """Return (config, state, completed modules) from a valid checkpoint or None.
+    """
+    manifest = check_manifest(modulelist)
+    if manifest is None:
+        return None
+    completed = [modinfo['modname'] for modinfo in manifest['modules']]
+
+    config = pfwconfig.PfwConfig({'wclfile': CONFIG_FILE})
+    with open(STATE_FILE, 'rb') as infh:
+        state = pickle.load(infh)
+
+    # only read master data of modules not yet freed
+    masterfiles = {modinfo['modname']: modinfo['masterdata'] for modinfo in manifest['modules']}
+    state['masterdata'] = OrderedDict()
+    for modname in state.pop('masterdata_modules'):
+        with open(masterfiles[modname], 'rb') as infh:
+            state['masterdata'][modname] = pickle.load(infh)
+
+    print("Resuming begblock after module %s (%s modules already completed)" %
+          (completed[-1], len(completed)))
+    return (config, state, completed)
+
+
+def remove_checkpoint():
+    """Remove checkpoint files.
+    """
+    for fname in [MANIFEST_FILE, STATE_FILE, CONFIG_FILE] + glob.glob(MASTERDATA_FILE % '*'):
+        if os.path.exists(fname):
+            os.unlink(fname)
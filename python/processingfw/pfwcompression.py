@@ -6,8 +6,15 @@
 # reserved variables:  __UCFILE__ uncompressed file, __CFILE__ compressed file
 
 import copy
+import time
+import concurrent.futures
 import shlex
 import os
+import re
+import sys
+import zlib
+import gzip
+import shutil
 import subprocess
 
 import despymisc.miscutils as miscutils
@@ -39,62 +46,254 @@ def run_compression_command(cmd, fname_compressed, max_try_cnt=1):
     return returncode
 
 
-def compress_files(listfullnames, compresssuffix, execname, argsorig, max_try_cnt=3, cleanup=True):
-    """Compress given files.
+def run_in_process(compressfunc, fname_compressed, max_try_cnt=1):
+    """Run an in-process compression function, retrying on failure.
     """
-    if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
-        miscutils.fwdebug_print("BEG num files to compress = %s" % (len(listfullnames)))
-
-    results = {}
-    tot_bytes_before = 0
-    tot_bytes_after = 0
-    for fname in listfullnames:
-        errstr = None
-        cmd = None
-        fname_compressed = None
-        returncode = 1
+    trycnt = 1
+    returncode = 1
+    while trycnt <= max_try_cnt and returncode != 0:
         try:
-            if not os.path.exists(fname):
-                errstr = "Error: Uncompressed file does not exist (%s)" % fname
-                returncode = 1
-            else:
-                tot_bytes_before += os.path.getsize(fname)
-                fname_compressed = fname + compresssuffix
-
-                # create command
-                args = copy.deepcopy(argsorig)
-                args = replfuncs.replace_vars_single(args,
-                                                     {'__UCFILE__': fname,
-                                                      '__CFILE__': fname_compressed},
-                                                     None)
-                cmd = '%s %s' % (execname, args)
-                if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
-                    miscutils.fwdebug_print("compression command: %s" % cmd)
-
-                returncode = run_compression_command(cmd, fname_compressed, max_try_cnt)
-        except IOError as exc:
-            errstr = "I/O error({0}): {1}".format(exc.errno, exc.strerror)
+            compressfunc()
+            returncode = 0
+        except (IOError, OSError, ValueError) as exc:
+            print("Error: in-process compression failed - %s" % exc)
             returncode = 1
-
-        if returncode != 0:
-            errstr = "Compression failed with exit code %i" % returncode
             # check for partial compressed output and remove
             if os.path.exists(fname_compressed):
                 miscutils.fwdebug_print("Compression failed.  Removing compressed file.")
                 os.unlink(fname_compressed)
-        elif miscutils.convertBool(cleanup): # if successful, remove uncompressed if requested
-            os.unlink(fname)
+        trycnt += 1
+    return returncode
+
+
+def get_args_level(args, default):
+    """Return compression level given as -N (e.g., -9) in the compression args.
+    """
+    level = default
+    for arg in shlex.split(args):
+        if re.match(r'^-[1-9]$', arg):
+            level = int(arg[1:])
+    return level
+
+
+def exec_backend(fname, fname_compressed, execname, args, max_try_cnt):
+    """Compress by running the compression executable (default backend).
+    """
+    cmd = '%s %s' % (execname, args)
+    if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
+        miscutils.fwdebug_print("compression command: %s" % cmd)
+    return (run_compression_command(cmd, fname_compressed, max_try_cnt), cmd)
+
+
+def gzip_backend(fname, fname_compressed, execname, args, max_try_cnt):
+    """Compress with python's gzip module instead of a gzip process.
+
+    Honors a -N compression level in the compression args.
+    """
+    level = get_args_level(args, 6)
+
+    def compressfunc():
+        with open(fname, 'rb') as infh, gzip.open(fname_compressed, 'wb', level) as outfh:
+            shutil.copyfileobj(infh, outfh, 1024*1024)
+
+    cmd = 'gzip(compresslevel=%s) %s' % (level, fname)
+    return (run_in_process(compressfunc, fname_compressed, max_try_cnt), cmd)
+
+
+def fits_backend(fname, fname_compressed, execname, args, max_try_cnt):
+    """Tile compress FITS images with astropy instead of an fpack process.
+
+    Honors fpack's -r/-g/-h (rice/gzip/hcompress) and -q level args.
+    """
+    compression_type = 'RICE_1'
+    quantize_level = 4.0
+    argv = shlex.split(args)
+    for (i, arg) in enumerate(argv):
+        if arg == '-g':
+            compression_type = 'GZIP_1'
+        elif arg == '-h':
+            compression_type = 'HCOMPRESS_1'
+        elif arg == '-r':
+            compression_type = 'RICE_1'
+        elif arg == '-q' and i+1 < len(argv):
+            quantize_level = float(argv[i+1])
+
+    cmd = 'astropy(compression_type=%s, quantize_level=%s) %s' % \
+          (compression_type, quantize_level, fname)
+    try:
+        # optional dependency only needed if this backend is chosen
+        from astropy.io import fits
+    except ImportError:
+        print("Error: fits compression backend requires astropy")
+        return (1, cmd)
+
+    def compressfunc():
+        with fits.open(fname, memmap=True) as hdus:
+            outhdus = fits.HDUList([fits.PrimaryHDU(header=hdus[0].header)])
+            for hdu in hdus:
+                if isinstance(hdu, (fits.PrimaryHDU, fits.ImageHDU)) and hdu.data is not None:
+                    outhdus.append(fits.CompImageHDU(data=hdu.data, header=hdu.header,
+                                                     compression_type=compression_type,
+                                                     quantize_level=quantize_level))
+                elif not isinstance(hdu, fits.PrimaryHDU):
+                    outhdus.append(hdu)
+            outhdus.writeto(fname_compressed, overwrite=True)
+
+    return (run_in_process(compressfunc, fname_compressed, max_try_cnt), cmd)
+
+
+# compression_backend values, anything else is loaded as module.function
+COMPRESSION_BACKENDS = {'exec': exec_backend,
+                        'gzip': gzip_backend,
+                        'fits': fits_backend}
+
+
+def register_compression_backend(name, backend):
+    """Make a compression backend selectable by name.
 
-        if returncode == 0:
-            tot_bytes_after += os.path.getsize(fname_compressed)
+    backend(fname, fname_compressed, execname, args, max_try_cnt) returns
+    (exit code, description of what was run).
+    """
+    COMPRESSION_BACKENDS[name] = backend
+
+
+def get_compression_backend(name):
+    """Return compression backend function for name.
+    """
+    if name is None:
+        name = 'exec'
+    if name not in COMPRESSION_BACKENDS:
+        COMPRESSION_BACKENDS[name] = miscutils.dynamically_load_class(name)
+    return COMPRESSION_BACKENDS[name]
+
+
+def get_backend_info(name):
+    """Return (name, version) to record for an in-process compression backend.
+    """
+    if name == 'gzip':
+        return ('python-gzip', 'zlib %s' % zlib.ZLIB_VERSION)
+    if name == 'fits':
+        try:
+            import astropy
+            return ('astropy', astropy.__version__)
+        except ImportError:
+            return ('astropy', None)
+
+    backend = get_compression_backend(name)
+    module = sys.modules.get(getattr(backend, '__module__', None))
+    return (name, getattr(module, '__version__', None))
+
+
+def compress_file(fname, compresssuffix, execname, argsorig, max_try_cnt=3, cleanup=True,
+                  backend=None):
+    """Compress a single file.
+
+    Returns (result, bytes before, bytes after) where result is the
+    compress_files results entry for the file.
+    """
+    errstr = None
+    cmd = None
+    fname_compressed = None
+    returncode = 1
+    bytes_before = 0
+    bytes_after = 0
+    starttime = time.time()
+    try:
+        if not os.path.exists(fname):
+            errstr = "Error: Uncompressed file does not exist (%s)" % fname
+            returncode = 1
         else:
-            tot_bytes_after += os.path.getsize(fname)
+            bytes_before = os.path.getsize(fname)
+            fname_compressed = fname + compresssuffix
+
+            # create command
+            args = copy.deepcopy(argsorig)
+            args = replfuncs.replace_vars_single(args,
+                                                 {'__UCFILE__': fname,
+                                                  '__CFILE__': fname_compressed},
+                                                 None)
+            (returncode, cmd) = get_compression_backend(backend)(fname, fname_compressed,
+                                                                 execname, args, max_try_cnt)
+    except IOError as exc:
+        errstr = "I/O error({0}): {1}".format(exc.errno, exc.strerror)
+        returncode = 1
+
+    if returncode != 0:
+        if errstr is None:
+            errstr = "Compression failed with exit code %i" % returncode
+        # check for partial compressed output and remove
+        if fname_compressed is not None and os.path.exists(fname_compressed):
+            miscutils.fwdebug_print("Compression failed.  Removing compressed file.")
+            os.unlink(fname_compressed)
+    elif miscutils.convertBool(cleanup): # if successful, remove uncompressed if requested
+        os.unlink(fname)
+
+    if returncode == 0:
+        bytes_after = os.path.getsize(fname_compressed)
+    elif os.path.exists(fname):
+        bytes_after = os.path.getsize(fname)
+
+    elapsed = time.time() - starttime
+    # save exit code, cmd and new name
+    result = {'status': returncode,
+              'outname': fname_compressed,
+              'err': errstr,
+              'cmd': cmd,
+              'elapsed': elapsed,
+              'mbps': bytes_before / 1024.0 / 1024.0 / elapsed if elapsed > 0 else None}
+    if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
+        miscutils.fwdebug_print("%s: %s => %s bytes in %0.3f secs" %
+                                (fname, bytes_before, bytes_after, elapsed))
+    return (result, bytes_before, bytes_after)
+
+
+def get_num_workers(numfiles, nprocs=1, max_io=None):
+    """Return number of files to compress at once.
+
+    nprocs of 0 means one per core.  Never more than the number of cores, or
+    max_io if given, so compressions don't just compete for disk.
+    """
+    ncores = os.cpu_count() or 1
+    nworkers = ncores if nprocs == 0 else min(nprocs, ncores)
+    if max_io:
+        nworkers = min(nworkers, max_io)
+    return max(1, min(nworkers, numfiles))
+
+
+def compress_files(listfullnames, compresssuffix, execname, argsorig, max_try_cnt=3, cleanup=True,
+                   nprocs=1, max_io=None, backend=None):
+    """Compress given files, running up to nprocs compressions at once.
+    """
+    if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
+        miscutils.fwdebug_print("BEG num files to compress = %s" % (len(listfullnames)))
+
+    nworkers = get_num_workers(len(listfullnames), nprocs, max_io)
+    get_compression_backend(backend)   # fail before compressing anything if unknown
+    starttime = time.time()
+
+    def compress_one(fname):
+        return compress_file(fname, compresssuffix, execname, argsorig, max_try_cnt, cleanup,
+                             backend)
+
+    if nworkers > 1:
+        # work is done in the compression processes so threads are enough to drive them
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as executor:
+            filestats = list(executor.map(compress_one, listfullnames))
+    else:
+        filestats = [compress_one(fname) for fname in listfullnames]
+
+    results = {}
+    tot_bytes_before = 0
+    tot_bytes_after = 0
+    for (fname, (result, bytes_before, bytes_after)) in zip(listfullnames, filestats):
+        results[fname] = result
+        tot_bytes_before += bytes_before
+        tot_bytes_after += bytes_after
 
-        # save exit code, cmd and new name
-        results[fname] = {'status': returncode,
-                          'outname': fname_compressed,
-                          'err': errstr,
-                          'cmd': cmd}
+    elapsed = time.time() - starttime
+    print("DESDMTIME: compress_files %0.3f (%s files, %s workers, %0.1f MB/s)" %
+          (elapsed, len(listfullnames), nworkers,
+           tot_bytes_before / 1024.0 / 1024.0 / elapsed if elapsed > 0 else 0))
 
     if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
         miscutils.fwdebug_print("END bytes %s => %s" % (tot_bytes_before, tot_bytes_after))
@@ -18,6 +18,12 @@ import intgutils.replace_funcs as replfuncs
 from intgutils.wcl import WCL
 import processingfw.pfwdb as pfwdb
 
+# maximum number of memoized pattern expansions
+EXPAND_CACHE_MAX_SIZE = 100000
+
+# marks a variable missing from searchobj when checking a memoized expansion
+_NOT_IN_SEARCHOBJ = object()
+
 # order in which to search for values
 PFW_SEARCH_ORDER = [pfwdefs.SW_FILESECT, pfwdefs.SW_LISTSECT, 'exec', 'job',
                     pfwdefs.SW_MODULESECT, pfwdefs.SW_BLOCKSECT,
@@ -31,6 +37,13 @@ class PfwConfig(WCL):
     def __init__(self, args):
         """ Initialize configuration object, typically reading from wclfile """
 
+        # memoized pattern expansions for get_filename/get_filepath
+        self.expand_cache = {}
+        self.expand_stats = {'hits': 0, 'misses': 0, 'uncacheable': 0}
+        self.expand_deps = {}
+        self.expand_key_versions = {}
+        self.expand_base_version = 0
+
         WCL.__init__(self)
 
         # data which needs to be kept across programs must go in self
@@ -130,6 +143,153 @@ class PfwConfig(WCL):
             self[pfwdefs.PF_TASKNUM] = '0'
             self[pfwdefs.PF_JOBNUM] = '0'
 
+    def __setitem__(self, key, value):
+        WCL.__setitem__(self, key, value)
+        self.touch_expand_key(key)
+
+    def __delitem__(self, key):
+        WCL.__delitem__(self, key)
+        self.touch_expand_key(key)
+
+    def update(self, *args, **kwargs):
+        WCL.update(self, *args, **kwargs)
+        self.clear_expand_cache()
+
+    def touch_expand_key(self, key):
+        """Invalidate memoized expansions that use the given top-level key.
+
+        Code that changes a value inside a config section in place must call this
+        with the section's name.
+        """
+        if not hasattr(self, 'expand_key_versions'):   # still being unpickled
+            return
+        if key in PFW_SEARCH_ORDER or key == 'current':
+            self.expand_base_version += 1
+        else:
+            self.expand_key_versions[key] = self.expand_key_versions.get(key, 0) + 1
+
+    def clear_expand_cache(self):
+        """Forget memoized pattern expansions.
+        """
+        if getattr(self, 'expand_cache', None):
+            self.expand_cache = {}
+            self.expand_deps = {}
+
+    def get_expand_cache_key(self, pattern, searchopts, how):
+        """Return key for memoizing the expansion of pattern or None if can't memoize.
+
+        Key is the pattern plus the currvals.  _cached_expand adds the version and
+        searchobj value of each variable the expansion uses.
+        """
+        if not isinstance(pattern, str) or pattern.count('$') != pattern.count('${'):
+            return None     # other replacements (e.g., functions) aren't memoized
+
+        currvals = ()
+        if searchopts is not None and searchopts.get(pfwdefs.PF_CURRVALS):
+            currvals = tuple(sorted(searchopts[pfwdefs.PF_CURRVALS].items()))
+            try:
+                hash(currvals)
+            except TypeError:
+                return None
+
+        return (how, pattern, currvals)
+
+    def get_expand_deps(self, pattern, searchopts):
+        """Return names of variables used by expanding pattern or None if can't memoize.
+
+        Follows nested ${} references with the same currvals and searchobj.
+        """
+        lookupopts = {'required': False}
+        if searchopts is not None:
+            for okey in [pfwdefs.PF_CURRVALS, 'searchobj']:
+                if okey in searchopts:
+                    lookupopts[okey] = searchopts[okey]
+
+        names = []
+        todo = [pattern]
+        while todo:
+            text = todo.pop()
+            if text.count('$') != text.count('${'):
+                return None
+            for var in re.findall(r'\$\{([^}]+)\}', text):
+                name = var.split(':')[0]
+                if name in names:
+                    continue
+                names.append(name)
+                (found, value) = self.search(name, lookupopts)
+                if not found:
+                    return None
+                if isinstance(value, str) and '$' in value:
+                    todo.append(value)
+        return tuple(names)
+
+    def _expand_full_key(self, key, names, searchobj):
+        """Return key plus the version and searchobj value of each of the given names.
+        """
+        state = [key, names, self.expand_base_version]
+        for name in names:
+            state.append(self.expand_key_versions.get(name, 0))
+            state.append(searchobj.get(name, _NOT_IN_SEARCHOBJ))
+        return tuple(state)
+
+    def print_expand_cache_stats(self):
+        """Print how well memoizing pattern expansions worked.
+        """
+        stats = self.expand_stats
+        total = stats['hits'] + stats['misses'] + stats['uncacheable']
+        if total > 0:
+            print("PFW: pattern expansion cache: %s hits, %s misses, %s uncacheable (%0.1f%% hit rate)" %
+                  (stats['hits'], stats['misses'], stats['uncacheable'],
+                   100.0 * stats['hits'] / total))
+
+    def _cached_expand(self, key, pattern, searchopts, expandfunc):
+        """Return expansion from cache or by calling expandfunc.
+        """
+        if key is None:
+            self.expand_stats['uncacheable'] += 1
+            return expandfunc()
+
+        searchobj = {}
+        if searchopts is not None and searchopts.get('searchobj') is not None:
+            searchobj = searchopts['searchobj']
+
+        fullkey = None
+        retval = None
+        try:
+            if key in self.expand_deps:
+                fullkey = self._expand_full_key(key, self.expand_deps[key], searchobj)
+                retval = self.expand_cache.get(fullkey)
+
+            if retval is not None:
+                self.expand_stats['hits'] += 1
+            else:
+                # variables used may differ from last time this key was seen
+                names = self.get_expand_deps(pattern, searchopts)
+                if names is not None:
+                    fullkey = self._expand_full_key(key, names, searchobj)
+                    hash(fullkey)
+                    self.expand_deps[key] = names
+                else:
+                    fullkey = None
+        except TypeError:   # unhashable searchobj value
+            fullkey = None
+
+        if retval is None:
+            retval = expandfunc()
+            if fullkey is None:
+                self.expand_stats['uncacheable'] += 1
+                return retval
+
+            self.expand_stats['misses'] += 1
+            if len(self.expand_cache) >= EXPAND_CACHE_MAX_SIZE:
+                self.expand_cache = {}
+            self.expand_cache[fullkey] = retval
+
+        # callers may modify results
+        if isinstance(retval, str):
+            return retval
+        return copy.deepcopy(retval)
+
     # assumes already run through chk
     def set_submit_info(self):
         """Initialize submit time values.
@@ -286,6 +446,7 @@ class PfwConfig(WCL):
         else:
             # make sure to reset curr_archive from possible prev block value
             curdict['curr_archive'] = None
+        self.touch_expand_key('current')
 
         if 'submit_des_services' in self:
             self['des_services'] = self['submit_des_services']
@@ -455,17 +616,29 @@ class PfwConfig(WCL):
 
         if (searchopts is None or intgdefs.REPLACE_VARS not in searchopts or
                 miscutils.convertBool(searchopts[intgdefs.REPLACE_VARS])):
-            sopt2 = {}
+            expand = True
+            keepvars = False
             if searchopts is not None:
-                sopt2 = copy.deepcopy(searchopts)
-            sopt2[intgdefs.REPLACE_VARS] = True
-            if 'expand' not in sopt2:
-                sopt2['expand'] = True
-            if 'keepvars' not in sopt2:
-                sopt2['keepvars'] = False
-            retval = replfuncs.replace_vars(filenamepat, self, sopt2)
-            if not miscutils.convertBool(sopt2['keepvars']):
-                retval = retval[0]
+                expand = searchopts.get('expand', True)
+                keepvars = searchopts.get('keepvars', False)
+
+            def expandfunc():
+                sopt2 = {}
+                if searchopts is not None:
+                    sopt2 = copy.deepcopy(searchopts)
+                sopt2[intgdefs.REPLACE_VARS] = True
+                if 'expand' not in sopt2:
+                    sopt2['expand'] = True
+                if 'keepvars' not in sopt2:
+                    sopt2['keepvars'] = False
+                result = replfuncs.replace_vars(filenamepat, self, sopt2)
+                if not miscutils.convertBool(sopt2['keepvars']):
+                    result = result[0]
+                return result
+
+            key = self.get_expand_cache_key(filenamepat, searchopts,
+                                            ('filename', str(expand), str(keepvars)))
+            retval = self._cached_expand(key, filenamepat, searchopts, expandfunc)
 
         return retval
 
@@ -485,7 +658,10 @@ class PfwConfig(WCL):
             miscutils.fwdie("Error: Could not find pattern %s in directory patterns" %
                             dirpat, pfwdefs.PF_EXIT_FAILURE)
 
-        results = replfuncs.replace_vars_single(filepathpat, self, searchopts)
+        key = self.get_expand_cache_key(filepathpat, searchopts, ('filepath',))
+        results = self._cached_expand(
+            key, filepathpat, searchopts,
+            lambda: replfuncs.replace_vars_single(filepathpat, self, searchopts))
         return results
 
     def combine_lists_files(self, modulename):
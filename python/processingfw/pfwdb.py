@@ -1,11 +1,16 @@
 """Define a database utility class extending despydmdb.desdmdbi.
 """
 
+import atexit
+import concurrent.futures
 import os
 import socket
 import sys
+import threading
+import time
 import traceback
-from datetime import datetime
+import weakref
+from datetime import datetime, timezone
 from collections import OrderedDict
 
 from intgutils import intgdefs
@@ -15,6 +20,8 @@ from despymisc import miscutils
 import qcframework.Messaging as Messaging
 from processingfw import pfwutils
 from processingfw import pfwdefs
+from processingfw import pfwsqlite
+from processingfw import pfwfilecache
 
 
 class PFWDB(desdmdbi.DesDmDbi):
@@ -24,12 +31,231 @@ class PFWDB(desdmdbi.DesDmDbi):
     filetypes and to ingest metadata associated with those headers.
     """
 
+    def __new__(cls, desfile=None, section=None):
+        """ Use the SQLite stand-in if the des services section asks for it """
+        if cls is PFWDB and pfwsqlite.get_sqlite_file(desfile, section) is not None:
+            cls = SQLitePFWDB
+        return super(PFWDB, cls).__new__(cls)
+
     def __init__(self, desfile=None, section=None):
         """ Initialize object """
         if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
             miscutils.fwdebug_print("%s, %s" % (desfile, section))
 
-        desdmdbi.DesDmDbi.__init__(self, desfile, section)
+        super(PFWDB, self).__init__(desfile, section)
+
+        # write-behind queue of [sql, table, [params, ...], set(task ids)] batches
+        self.write_behind = False
+        self.write_queue = []
+        self.write_queue_start = None
+        self.flush_interval = pfwdefs.PFWDB_FLUSH_INTERVAL_DEFAULT
+        self.queue_bypass = False
+        self.write_stats = {'rows': 0, 'batches': 0, 'flushes': 0}
+        self.server_time_offset = None
+
+    ##### WRITE-BEHIND #####
+    def set_write_behind(self, enable=True, flush_interval=None):
+        """Turn on/off buffering of task and PFW row writes until flush.
+
+        Queued rows can't use the server's current timestamp (it would be the
+        flush time), so they get the server time computed from this host's UTC
+        clock plus the server offset measured when write-behind is turned on.
+        They can differ from server-stamped rows by the round trip of that query.
+        """
+        if not enable:
+            self.flush()
+        elif self.server_time_offset is None:
+            self.server_time_offset = self.get_server_time_offset()
+        self.write_behind = enable
+        if flush_interval is not None:
+            self.flush_interval = float(flush_interval)
+        if enable:
+            _write_behind_dbhs.add(self)
+
+    def get_server_time_offset(self):
+        """Return difference between the timestamp server stores for now and UTC here.
+        """
+        curs = super(PFWDB, self).cursor()
+        curs.execute("select %s %s" % (self.get_current_timestamp_str(), self.from_dual()))
+        servernow = curs.fetchone()[0]
+        curs.close()
+        utcnow = datetime.now(timezone.utc).replace(tzinfo=None)
+        if isinstance(servernow, str):
+            servernow = datetime.strptime(servernow, '%Y-%m-%d %H:%M:%S.%f')
+        # stored like the timestamp column stores it, i.e., the server's wall clock
+        return servernow.replace(tzinfo=None) - utcnow
+
+    def get_server_now(self):
+        """Return the timestamp the server would store for now.
+        """
+        return datetime.now(timezone.utc).replace(tzinfo=None) + self.server_time_offset
+
+    def queue_write(self, sql, table, params, rowid=None):
+        """Queue a single row write, merging with earlier identical statements.
+        """
+        if self.write_queue_start is None:
+            self.write_queue_start = time.time()
+        self.write_stats['rows'] += 1
+
+        # Merge into the latest batch with same sql if the write can safely move
+        # ahead of every batch queued after it.  Only task statements may move,
+        # past other tables (task rows never reference PFW rows) or past task
+        # batches not touching the same task id.
+        table = table.lower()
+        for i in range(len(self.write_queue) - 1, -1, -1):
+            batch = self.write_queue[i]
+            if batch[0] == sql:
+                batch[2].append(params)
+                batch[3].add(rowid)
+                break
+            if table != 'task' or rowid is None or \
+               (batch[1] == table and (None in batch[3] or rowid in batch[3])):
+                self.write_queue.append([sql, table, [params], set([rowid])])
+                break
+        else:
+            self.write_queue.append([sql, table, [params], set([rowid])])
+
+        if time.time() - self.write_queue_start >= self.flush_interval:
+            self.flush()
+
+    def queue_row(self, table, row, wherevals=None):
+        """Queue an insert (or update if wherevals given) of a row.
+        """
+        ctstr = self.get_current_timestamp_str()
+        params = {}
+        exprs = []
+        for col, val in row.items():
+            exprs.append((col, self.get_named_bind_string(col)))
+            if val == ctstr:
+                # the server timestamp would be the flush time, so bind the time now
+                params[col] = self.get_server_now()
+            else:
+                params[col] = val
+
+        if wherevals is None:
+            sql = "insert into %s (%s) values (%s)" % (table, ','.join([c for (c, _) in exprs]),
+                                                      ','.join([e for (_, e) in exprs]))
+        else:
+            whereclause = []
+            for col, val in wherevals.items():
+                whereclause.append("%s=%s" % (col, self.get_named_bind_string('w_' + col)))
+                params['w_' + col] = val
+            sql = "update %s set %s where %s" % (table, ','.join(["%s=%s" % ce for ce in exprs]),
+                                                 ' and '.join(whereclause))
+        if wherevals is None:
+            rowid = row.get('id')
+        else:
+            rowid = wherevals.get('id')
+        self.queue_write(sql, table, params, rowid)
+
+    def flush(self):
+        """Execute queued writes in a single transaction using executemany.
+        """
+        if not self.write_queue:
+            return
+
+        queue = self.write_queue
+        self.write_queue = []
+        self.write_queue_start = None
+        self.queue_bypass = True
+        starttime = time.time()
+        try:
+            curs = super(PFWDB, self).cursor()
+            for (sql, _, params, _) in queue:
+                curs.executemany(sql, params)
+            curs.close()
+            super(PFWDB, self).commit()
+        except:
+            super(PFWDB, self).rollback()
+            raise
+        finally:
+            self.queue_bypass = False
+
+        self.write_stats['flushes'] += 1
+        self.write_stats['batches'] += len(queue)
+        if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+            miscutils.fwdebug_print("flushed %s rows in %s batches (%0.3f secs), totals %s" %
+                                    (sum([len(b[2]) for b in queue]), len(queue),
+                                     time.time()-starttime, self.write_stats))
+
+    def cursor(self):
+        """Return a cursor, first flushing queued writes so they are visible.
+        """
+        if self.write_queue and not self.queue_bypass:
+            self.flush()
+        return super(PFWDB, self).cursor()
+
+    def commit(self):
+        """Commit unless writes are queued, in which case the next flush commits.
+        """
+        if not (self.write_behind and self.write_queue):
+            super(PFWDB, self).commit()
+
+    def close(self):
+        """Flush queued writes and close the connection.
+        """
+        self.flush()
+        _write_behind_dbhs.discard(self)
+        super(PFWDB, self).close()
+
+    def create_task(self, name, info_table, parent_task_id=None, root_task_id=None,
+                    i_am_root=False, label=None, do_begin=False, do_commit=False):
+        """Insert a task row, queueing it when in write-behind mode.
+        """
+        if not self.write_behind:
+            return super(PFWDB, self).create_task(name=name, info_table=info_table,
+                                                 parent_task_id=parent_task_id,
+                                                 root_task_id=root_task_id,
+                                                 i_am_root=i_am_root, label=label,
+                                                 do_begin=do_begin, do_commit=do_commit)
+
+        # sequence value is needed now, but does not require the queue to be flushed
+        self.queue_bypass = True
+        try:
+            task_id = self.get_seq_next_value('task_seq')
+        finally:
+            self.queue_bypass = False
+
+        row = OrderedDict([('name', name), ('info_table', info_table),
+                           ('parent_task_id', None), ('root_task_id', None), ('label', label),
+                           ('start_time', None), ('exec_host', None), ('id', task_id)])
+        if parent_task_id is not None:
+            row['parent_task_id'] = int(parent_task_id)
+        if i_am_root:
+            row['root_task_id'] = task_id
+        elif root_task_id is not None:
+            row['root_task_id'] = int(root_task_id)
+        if do_begin:
+            # fold begin_task into the insert
+            row['start_time'] = self.get_server_now()
+            row['exec_host'] = socket.gethostname()
+        self.queue_row('task', row)
+        return task_id
+
+    def begin_task(self, task_id, do_commit=False):
+        """Mark task as started, queueing it when in write-behind mode.
+        """
+        if not self.write_behind:
+            return super(PFWDB, self).begin_task(task_id, do_commit)
+        self.queue_row('task', OrderedDict([('start_time', self.get_server_now()),
+                                            ('exec_host', socket.gethostname())]),
+                       {'id': task_id})
+
+    def end_task(self, task_id, status, do_commit=False):
+        """Mark task as finished, queueing it when in write-behind mode.
+        """
+        if not self.write_behind:
+            return super(PFWDB, self).end_task(task_id, status, do_commit)
+        self.queue_row('task', OrderedDict([('end_time', self.get_server_now()),
+                                            ('status', status)]),
+                       {'id': task_id})
+
+    def reopen_task(self, task_id, do_commit=False):
+        """Clear end time and status of a task that is being resumed.
+        """
+        self.basic_update_row('task', {'end_time': None, 'status': None}, {'id': task_id})
+        if do_commit:
+            self.commit()
 
     def get_database_defaults(self):
         """Grab default configuration information stored in database.
@@ -382,6 +608,71 @@ class PFWDB(desdmdbi.DesDmDbi):
             row['jobkeys'] = jobdict['jobkeys']
         self.insert_PFW_row('PFW_JOB', row)
 
+    def insert_jobs(self, wcl, joblist):
+        """Insert entries for all jobs into the task and pfw_job tables at once.
+        """
+        if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+            miscutils.fwdebug_print("Inserting %s jobs to pfw_job table\n" % len(joblist))
+        if len(joblist) == 0:
+            return
+
+        blknum = wcl[pfwdefs.PF_BLKNUM]
+        blktid = int(wcl['task_id']['block'][blknum])
+        attempt_tid = int(wcl['task_id']['attempt'])
+
+        jobdicts = [joblist[jobkey] for jobkey in sorted(joblist.keys())]
+        task_ids = self.get_seq_next_values('task_seq', len(jobdicts))
+
+        taskrows = []
+        jobrows = []
+        for jobdict, task_id in zip(jobdicts, task_ids):
+            taskrows.append({'id': task_id,
+                             'name': 'job',
+                             'info_table': 'pfw_job',
+                             'parent_task_id': blktid,
+                             'root_task_id': attempt_tid,
+                             'label': None})
+            jobrows.append({'task_id': task_id,
+                            'pfw_attempt_id': wcl['pfw_attempt_id'],
+                            'pfw_block_task_id': blktid,
+                            'jobnum': int(jobdict['jobnum']),
+                            'expect_num_wrap': jobdict['numexpwrap'],
+                            'pipeprod': wcl['pipeprod'],
+                            'pipever': wcl['pipever'],
+                            'jobkeys': jobdict.get('jobkeys')})
+            wcl['task_id']['job'][jobdict['jobnum']] = task_id
+
+        try:
+            self.insert_many_rows('task', taskrows)
+            self.insert_many_rows('pfw_job', jobrows)
+        except:
+            self.rollback()
+            raise
+        self.commit()
+
+    def insert_many_rows(self, table, rows):
+        """Insert rows (dicts having same keys) with a single array bind (no commit).
+        """
+        cols = list(rows[0].keys())
+        sql = "insert into %s (%s) values (%s)" % \
+              (table, ','.join(cols), ','.join([self.get_named_bind_string(c) for c in cols]))
+        if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+            miscutils.fwdebug_print("sql> %s (%s rows)" % (sql, len(rows)))
+        curs = self.cursor()
+        curs.executemany(sql, rows)
+        curs.close()
+
+    def get_seq_next_values(self, seqname, count):
+        """Return list of count next values of a sequence using a single query.
+        """
+        sql = "select %s.nextval from dual connect by level <= %s" % \
+              (seqname, self.get_named_bind_string('cnt'))
+        curs = self.cursor()
+        curs.execute(sql, {'cnt': count})
+        values = sorted([row[0] for row in curs])
+        curs.close()
+        return values
+
     def update_job_target_info(self, wcl, submit_condor_id=None,
                                target_batch_id=None, exechost=None):
         """Save information about target job from pfwrunjob.
@@ -463,9 +754,7 @@ class PFWDB(desdmdbi.DesDmDbi):
             sql = "update task set exec_host='%s'" % (exechost)
 
             if 'PFW_JOB_START_EPOCH' in os.environ:
-                # doing conversion on DB to avoid any timezone issues
-                sql += ", start_time = (from_tz(to_timestamp('1970-01-01','YYYY-MM-DD') + numtodsinterval(%s,'SECOND'), 'UTC') at time zone 'US/Central')" % (
-                    os.environ['PFW_JOB_START_EPOCH'])
+                sql += ", start_time = %s" % self.get_epoch_timestamp_str(os.environ['PFW_JOB_START_EPOCH'])
 
             sql += ' where id=%s' % (wcl['task_id']['job'])
             curs = self.cursor()
@@ -477,6 +766,12 @@ class PFWDB(desdmdbi.DesDmDbi):
             #updatevals['exec_host'] = exechost
             #self.update_PFW_row('TASK', updatevals, wherevals)
 
+    def get_epoch_timestamp_str(self, epoch):
+        """Return SQL expression converting unix epoch to a timestamp.
+        """
+        # doing conversion on DB to avoid any timezone issues
+        return "(from_tz(to_timestamp('1970-01-01','YYYY-MM-DD') + numtodsinterval(%s,'SECOND'), 'UTC') at time zone 'US/Central')" % (epoch)
+
     def update_job_junktar(self, wcl, junktar=None):
         """Update row in pfw_job with junk tarball name.
         """
@@ -734,6 +1029,9 @@ class PFWDB(desdmdbi.DesDmDbi):
     def insert_PFW_row(self, pfwtable, row):
         """Insert a row into a PFW table and commit.
         """
+        if self.write_behind:
+            self.queue_row(pfwtable, OrderedDict(sorted(row.items())))
+            return
         self.basic_insert_row(pfwtable, row)
         self.commit()
         if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
@@ -742,6 +1040,10 @@ class PFWDB(desdmdbi.DesDmDbi):
     def update_PFW_row(self, pfwtable, updatevals, wherevals):
         """Update a row in a PFW table and commit.
         """
+        if self.write_behind:
+            self.queue_row(pfwtable, OrderedDict(sorted(updatevals.items())),
+                           OrderedDict(sorted(wherevals.items())))
+            return
         self.basic_update_row(pfwtable, updatevals, wherevals)
         self.commit()
 
@@ -991,20 +1293,295 @@ class PFWDB(desdmdbi.DesDmDbi):
         return logfullnames
 
     def check_files(self, config, filelist):
-        missingfiles = []
-        curs = self.cursor()
+        """Return files in filelist which are not in the home archive.
+
+        Files are checked in chunks, optionally over several connections, skipping
+        files found on an earlier check if the verified file cache is on.
+        """
         home_archive = config.getfull('home_archive')
-        files = []
-        gtt = self.load_filename_gtt(filelist)
 
-        curs.execute("select filename, compression from %s gtt where not exists (select df.filename,df.compression from desfile df, file_archive_info fai where gtt.filename=df.filename and nullcmp(gtt.compression, df.compression)=1 and df.id=fai.desfile_id and fai.archive_name='%s')" % (gtt, home_archive))
+        cache = pfwfilecache.get_verified_cache(config)
+        tocheck = filelist
+        if cache is not None:
+            verified = pfwfilecache.load_verified(cache, home_archive)
+            tocheck = [fname for fname in filelist
+                       if pfwfilecache.file_key(fname) not in verified]
+            print("\tcheck_files: %s of %s files already verified in %s" %
+                  (len(filelist) - len(tocheck), len(filelist), home_archive))
+
+        (exists, chunksize) = config.search(pfwdefs.CHECK_FILES_CHUNK_SIZE,
+                                            {intgdefs.REPLACE_VARS: True})
+        if not exists:
+            chunksize = pfwdefs.CHECK_FILES_CHUNK_SIZE_DEFAULT
+        chunksize = max(1, int(chunksize))
+        chunks = [tocheck[i:i+chunksize] for i in range(0, len(tocheck), chunksize)]
+
+        (exists, nthreads) = config.search(pfwdefs.CHECK_FILES_NTHREADS,
+                                           {intgdefs.REPLACE_VARS: True})
+        if not exists:
+            nthreads = pfwdefs.CHECK_FILES_NTHREADS_DEFAULT
+        nthreads = max(1, min(int(nthreads), len(chunks)))
+
+        starttime = time.time()
+        missingfiles = []
+        numchecked = 0
+        if nthreads > 1:
+            pool_key = getattr(self, 'pool_key', (None, None))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=nthreads) as executor:
+                futures = [executor.submit(_check_files_chunk, pool_key, home_archive, chunk)
+                           for chunk in chunks]
+                for (chunk, future) in zip(chunks, futures):
+                    missingfiles.extend(future.result())
+                    numchecked += len(chunk)
+                    print("\tcheck_files: checked %s/%s files (%s missing)" %
+                          (numchecked, len(tocheck), len(missingfiles)))
+        else:
+            for chunk in chunks:
+                missingfiles.extend(self.check_files_chunk(home_archive, chunk))
+                numchecked += len(chunk)
+                print("\tcheck_files: checked %s/%s files (%s missing)" %
+                      (numchecked, len(tocheck), len(missingfiles)))
+        print("DESDMTIME: check_files %0.3f (%s files, %s chunks, %s threads)" %
+              (time.time() - starttime, len(tocheck), len(chunks), nthreads))
+
+        if cache is not None:
+            missingset = set(missingfiles)
+            pfwfilecache.save_verified(cache, home_archive,
+                                       [fname for fname in tocheck if fname not in missingset])
 
-        results = curs.fetchall()
-        for res in results:
-            if res[1] is not None:
-                missingfiles.append(res[0] + res[1])
-            else:
-                missingfiles.append(res[0])
+        return missingfiles
+
+    def check_files_chunk(self, archive, filelist):
+        """Return files in filelist which are not in the given archive.
+        """
+        missingfiles = []
+        gtt = self.load_filename_gtt(filelist)
+
+        curs = self.cursor()
+        curs.execute("select filename, compression from %s gtt where not exists (select df.filename,df.compression from desfile df, file_archive_info fai where gtt.filename=df.filename and nullcmp(gtt.compression, df.compression)=1 and df.id=fai.desfile_id and fai.archive_name=%s)" % (gtt, self.get_named_bind_string('archive_name')), {'archive_name': archive})
+
+        # stream results since a large chunk could be mostly missing
+        results = curs.fetchmany(10000)
+        while results:
+            for res in results:
+                if res[1] is not None:
+                    missingfiles.append(res[0] + res[1])
+                else:
+                    missingfiles.append(res[0])
+            results = curs.fetchmany(10000)
+        curs.close()
         self.empty_gtt(gtt)
 
         return missingfiles
+
+
+def _check_files_chunk(pool_key, archive, filelist):
+    """Check one chunk of files on a pooled connection of its own.
+    """
+    dbh = get_pfwdb(*pool_key)
+    try:
+        return dbh.check_files_chunk(archive, filelist)
+    finally:
+        release_pfwdb(dbh)
+
+
+class SQLitePFWDB(PFWDB, pfwsqlite.SQLiteDbi):
+    """PFWDB running against the SQLite stand-in instead of Oracle.
+    """
+
+    def get_database_defaults(self):
+        """Not supported, the stand-in has no OPS_* metadata tables.
+        """
+        raise NotImplementedError("Error: sqlite stand-in can't provide database defaults "
+                                  "(set use_db_in = False)")
+
+    def get_epoch_timestamp_str(self, epoch):
+        """Return SQL expression converting unix epoch to a timestamp.
+        """
+        return "datetime(%s, 'unixepoch', 'localtime')" % (float(epoch))
+
+    def get_seq_next_values(self, seqname, count):
+        """Return list of count next values of emulated sequence.
+        """
+        return pfwsqlite.SQLiteDbi.get_seq_next_values(self, seqname, count)
+
+
+# connections in write-behind mode, flushed if still open at interpreter exit
+_write_behind_dbhs = weakref.WeakSet()
+
+
+def _flush_write_behind():
+    """Flush any queued writes left at exit.
+    """
+    for dbh in list(_write_behind_dbhs):
+        try:
+            dbh.flush()
+        except Exception:
+            (extype, exvalue, trback) = sys.exc_info()
+            traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+
+
+atexit.register(_flush_write_behind)
+
+
+# per-process pool of idle PFWDB connections keyed on (desfile, section)
+_pool = {}
+_pool_pid = None
+_pool_lock = threading.Lock()
+# connections inherited from a parent process, kept so they are never closed here
+_pool_inherited = []
+# pool limits from the config/wcl passed to get_pfwdb
+_pool_limits = {}
+
+
+def set_pool_limits(config):
+    """Use pool limits set in config (wcl or PfwConfig) for this process' pool.
+    """
+    for key in [pfwdefs.PFWDB_POOL_MAX_SIZE, pfwdefs.PFWDB_POOL_MAX_IDLE]:
+        if key in config:
+            _pool_limits[key] = int(config.getfull(key))
+
+
+def _pool_limit(key, default):
+    """Return pool limit from config, environment (DESDM_<KEY>) or default.
+    """
+    if key in _pool_limits:
+        return _pool_limits[key]
+    envkey = 'DESDM_%s' % key.upper()
+    if envkey in os.environ:
+        return int(os.environ[envkey])
+    return default
+
+
+def _pool_key(desfile, section):
+    """Return key identifying which database a connection points to.
+    """
+    if desfile is None:
+        desfile = os.environ.get('DES_SERVICES')
+    if section is None:
+        section = os.environ.get('DES_DB_SECTION')
+    return (desfile, section)
+
+
+def _pool_check_pid():
+    """Forget connections created by a parent process (call with lock held).
+    """
+    global _pool_pid
+
+    if _pool_pid != os.getpid():
+        for idle in _pool.values():
+            _pool_inherited.extend([dbh for (dbh, _) in idle])
+        _pool.clear()
+        _pool_pid = os.getpid()
+
+
+def _pool_evict(now):
+    """Return connections idle too long, removing them from pool (call with lock held).
+    """
+    max_idle = _pool_limit(pfwdefs.PFWDB_POOL_MAX_IDLE, pfwdefs.PFWDB_POOL_MAX_IDLE_DEFAULT)
+    stale = []
+    for idle in _pool.values():
+        while idle and now - idle[0][1] > max_idle:
+            stale.append(idle.pop(0)[0])
+    return stale
+
+
+def _close_quietly(dbh):
+    """Close connection ignoring errors from a dead connection.
+    """
+    try:
+        dbh.close()
+    except Exception:
+        pass
+
+
+def _is_alive(dbh):
+    """Return whether a pooled connection still answers queries.
+    """
+    try:
+        curs = dbh.cursor()
+        curs.execute("select 1 %s" % dbh.from_dual())
+        curs.fetchall()
+        curs.close()
+        return True
+    except Exception:
+        return False
+
+
+def get_pfwdb(desfile=None, section=None, config=None):
+    """Borrow a PFWDB connection, reusing a healthy idle one from this process' pool.
+
+    Pool limits are taken from config if given, otherwise from the environment.
+    """
+    if config is not None:
+        set_pool_limits(config)
+    key = _pool_key(desfile, section)
+    while True:
+        with _pool_lock:
+            _pool_check_pid()
+            stale = _pool_evict(time.time())
+            idle = _pool.get(key)
+            dbh = None
+            if idle:
+                dbh = idle.pop()[0]   # most recently used first
+        for stale_dbh in stale:
+            _close_quietly(stale_dbh)
+
+        if dbh is None:
+            break
+        if _is_alive(dbh):
+            if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+                miscutils.fwdebug_print("reusing pooled connection for %s" % str(key))
+            return dbh
+        if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+            miscutils.fwdebug_print("dropping dead pooled connection for %s" % str(key))
+        _close_quietly(dbh)
+
+    dbh = PFWDB(desfile, section)
+    dbh.pool_key = key
+    dbh.pool_pid = os.getpid()
+    return dbh
+
+
+def release_pfwdb(dbh):
+    """Return a borrowed PFWDB connection to the pool or close it if pool is full.
+    """
+    if dbh is None:
+        return
+    if not hasattr(dbh, 'pool_key') or dbh.pool_pid != os.getpid():
+        # not borrowed from this process' pool
+        return
+
+    try:
+        # queued writes belong to the borrower, then never hand
+        # uncommitted work to the next borrower
+        dbh.set_write_behind(False)
+        dbh.rollback()
+    except Exception:
+        _close_quietly(dbh)
+        return
+
+    max_size = _pool_limit(pfwdefs.PFWDB_POOL_MAX_SIZE, pfwdefs.PFWDB_POOL_MAX_SIZE_DEFAULT)
+    with _pool_lock:
+        _pool_check_pid()
+        stale = _pool_evict(time.time())
+        idle = _pool.setdefault(dbh.pool_key, [])
+        if len(idle) < max_size:
+            idle.append((dbh, time.time()))
+            dbh = None
+
+    for stale_dbh in stale:
+        _close_quietly(stale_dbh)
+    if dbh is not None:
+        _close_quietly(dbh)
+
+
+def close_pfwdb_pool():
+    """Close all idle pooled connections owned by this process.
+    """
+    with _pool_lock:
+        _pool_check_pid()
+        idle = [dbh for conns in _pool.values() for (dbh, _) in conns]
+        _pool.clear()
+    for dbh in idle:
+        _close_quietly(dbh)
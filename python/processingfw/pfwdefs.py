@@ -38,12 +38,57 @@ USE_TARGET_ARCHIVE_INPUT = 'use_target_archive_input'
 USE_TARGET_ARCHIVE_OUTPUT = 'use_target_archive_output'
 VALID_TARGET_ARCHIVE_INPUT = ['job', 'never']
 VALID_TARGET_ARCHIVE_OUTPUT = ['wrapper', 'job', 'never']
+TRANSFER_CONCURRENT = 'transfer_concurrent'   # output to target and home archives at the same time
+TRANSFER_CONCURRENT_DEFAULT = False
+TRANSFER_STREAMS = 'transfer_streams'   # parallel job_file_mvmt calls per archive
+TRANSFER_STREAMS_DEFAULT = 1
+PREFETCH_INPUTS = 'prefetch_inputs'   # stage upcoming wrappers' inputs while earlier ones run
+PREFETCH_INPUTS_DEFAULT = False
+PREFETCH_BUDGET = 'prefetch_budget'   # MB of inputs staged ahead of the wrappers needing them
+PREFETCH_BUDGET_DEFAULT = 10240
+JOB_FILE_ARCHIVE_INFO = 'job_file_archive_info'   # look up all wrapper inputs in archives at job start
+JOB_FILE_ARCHIVE_INFO_DEFAULT = False
 
 
 MASTER_USE_FWTHREADS = 'master_use_fwthreads'
 MASTER_USE_FWTHREADS_DEFAULT = False
 MAX_FWTHREADS = 'max_fwthreads'
 MAX_FWTHREADS_DEFAULT = 1
+FW_DAG = 'fw_dag'      # start wrappers on input availability across fw_groups
+FW_DAG_DEFAULT = False
+MAX_QUERY_THREADS = 'max_query_threads'   # concurrent master list queries per module
+MAX_QUERY_THREADS_DEFAULT = 1
+QUERY_IN_PROCESS = 'query_in_process'   # run query_fields searches without genquerydb.py
+QUERY_IN_PROCESS_DEFAULT = False
+WRAPINST_NPROC = 'wrapinst_nproc'  # processes building a module's wrapper instances in begblock
+WRAPINST_NPROC_DEFAULT = 1
+TAR_NTHREADS = 'tar_nthreads'      # threads creating job input wcl tarballs in begblock
+TAR_NTHREADS_DEFAULT = 4
+TAR_COMPRESSOR = 'tar_compressor'  # optional external compressor for tarballs (e.g., pigz)
+BEGBLOCK_CHECKPOINT = 'begblock_checkpoint'   # save state after each module so begblock can resume
+BEGBLOCK_CHECKPOINT_DEFAULT = False
+QUERY_CACHE_DIR = 'query_cache_dir'     # shared dir for cached master lists (unset = no cache)
+QUERY_CACHE_TTL = 'query_cache_ttl'     # seconds a cached master list stays valid
+QUERY_CACHE_TTL_DEFAULT = 86400
+QUERY_CACHE_TOKEN = 'query_cache_token'  # optional sql whose result is part of the cache key
+CHECK_FILES_CHUNK_SIZE = 'check_files_chunk_size'   # filenames per archive existence query
+CHECK_FILES_CHUNK_SIZE_DEFAULT = 50000
+CHECK_FILES_NTHREADS = 'check_files_nthreads'   # db connections checking chunks concurrently
+CHECK_FILES_NTHREADS_DEFAULT = 1
+VERIFIED_CACHE_DIR = 'verified_cache_dir'   # dir for cache of files known to be in archive (unset = no cache)
+VERIFIED_CACHE_TTL = 'verified_cache_ttl'   # seconds before the cache is started over
+VERIFIED_CACHE_TTL_DEFAULT = 604800
+
+# idle database connections kept per process (if not in wcl, env DESDM_PFWDB_POOL_MAX_SIZE/IDLE)
+PFWDB_POOL_MAX_SIZE = 'pfwdb_pool_max_size'
+PFWDB_POOL_MAX_SIZE_DEFAULT = 2
+PFWDB_POOL_MAX_IDLE = 'pfwdb_pool_max_idle'   # secs
+PFWDB_POOL_MAX_IDLE_DEFAULT = 600
+# buffer task/PFW row writes and flush them in batches
+PFWDB_WRITE_BEHIND = 'pfwdb_write_behind'
+PFWDB_WRITE_BEHIND_DEFAULT = False
+PFWDB_FLUSH_INTERVAL = 'pfwdb_flush_interval'   # secs
+PFWDB_FLUSH_INTERVAL_DEFAULT = 30
 
 CREATE_JUNK_TARBALL = 'create_junk_tarball'
 STAGE_FILES = 'stagefiles'
@@ -63,6 +108,11 @@ COMPRESSION_SUFFIX = 'compression_suffix'
 COMPRESSION_ARGS = 'compression_args'
 COMPRESSION_CLEANUP = 'compress_cleanup'
 COMPRESSION_CLEANUP_DEFAULT = True
+COMPRESSION_NPROCS = 'compression_nprocs'   # files compressed at once, 0 = one per core
+COMPRESSION_NPROCS_DEFAULT = 1
+COMPRESSION_MAX_IO = 'compression_max_io'   # optional cap on compressions at once to limit disk load
+COMPRESSION_BACKEND = 'compression_backend'   # exec, gzip, fits or module.function
+COMPRESSION_BACKEND_DEFAULT = 'exec'
 COMPRESS_FILES = 'compress_files'
 
 
@@ -0,0 +1,87 @@
+"""Local cache of files already verified to be in an archive.
+
+Each archive has its own cache file holding a creation timestamp followed by
+64-bit hashes of the filenames found in that archive.  Resubmits skip asking
+the database about files whose hash is already in the cache.  Hashes, rather
+than a Bloom filter, are used so a missing file is (practically) never skipped.
+"""
+
+import os
+import time
+import array
+import struct
+import hashlib
+
+import intgutils.intgdefs as intgdefs
+import processingfw.pfwdefs as pfwdefs
+
+
+def get_verified_cache(config):
+    """Return verified file cache settings from config or None if caching is off.
+    """
+    (exists, cachedir) = config.search(pfwdefs.VERIFIED_CACHE_DIR, {intgdefs.REPLACE_VARS: True})
+    if not exists or not cachedir:
+        return None
+
+    (exists, ttl) = config.search(pfwdefs.VERIFIED_CACHE_TTL, {intgdefs.REPLACE_VARS: True})
+    if not exists:
+        ttl = pfwdefs.VERIFIED_CACHE_TTL_DEFAULT
+
+    return {'dir': cachedir, 'ttl': int(ttl)}
+
+
+def get_cache_file(cache, archive):
+    """Return name of the cache file for an archive.
+    """
+    return os.path.join(cache['dir'], '%s.verified' % archive)
+
+
+def file_key(filename):
+    """Return the 64-bit hash stored in the cache for a filename.
+    """
+    return struct.unpack('<Q', hashlib.sha1(filename.encode('utf-8')).digest()[:8])[0]
+
+
+def load_verified(cache, archive):
+    """Return set of hashes of files previously verified to be in the archive.
+    """
+    cachefile = get_cache_file(cache, archive)
+    if not os.path.exists(cachefile):
+        return set()
+
+    with open(cachefile, 'rb') as infh:
+        data = infh.read()
+    if len(data) < 8:
+        return set()
+
+    (created,) = struct.unpack('<Q', data[:8])
+    if time.time() - created > cache['ttl']:
+        # start over so files removed from the archive are eventually noticed
+        os.unlink(cachefile)
+        return set()
+
+    # ignore a partial hash at the end from a concurrent append
+    hashes = array.array('Q')
+    hashes.frombytes(data[8:len(data) - (len(data) - 8) % 8])
+    return set(hashes)
+
+
+def save_verified(cache, archive, filenames):
+    """Add files just verified to be in the archive to its cache.
+    """
+    if len(filenames) == 0:
+        return
+
+    os.makedirs(cache['dir'], exist_ok=True)
+    hashes = array.array('Q', [file_key(fname) for fname in filenames])
+    cachefile = get_cache_file(cache, archive)
+    try:
+        # O_EXCL so only one process writes the timestamp
+        fd = os.open(cachefile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o664)
+        os.write(fd, struct.pack('<Q', int(time.time())))
+    except FileExistsError:
+        fd = os.open(cachefile, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, hashes.tobytes())
+    finally:
+        os.close(fd)
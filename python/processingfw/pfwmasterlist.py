@@ -0,0 +1,439 @@
+"""Compact columnar storage for master lists.
+
+A columnar master list stores each distinct value once in a string table
+(with a table of their offsets) and each (file nickname, key) pair as a column
+of uint32 indexes into that table.  The string table and columns are
+memory-mapped when read and strings are decoded on first use, so a large
+dataset is not parsed into nested dictionaries up front.  read_master_list returns the same
+{'list': {'line': {...}}} shape as a json master list, with lines, files and
+file dictionaries being thin views into the columns.
+"""
+
+import sys
+import copy
+import json
+import mmap
+import array
+import struct
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+
+import intgutils.intgdefs as intgdefs
+
+COLUMNAR_FORMAT = 'columnar'
+
+_MAGIC = b'PFWCOL2\n'
+_MISSING = 0xFFFFFFFF
+
+
+class _Deleted(object):
+    """Marker for a value deleted after reading, the same object after unpickling.
+    """
+
+    def __reduce__(self):
+        return '_DELETED'
+
+
+_DELETED = _Deleted()
+
+
+def _encode_value(value):
+    """Encode a single value keeping its type.
+    """
+    if value is None:
+        return 'n'
+    if isinstance(value, bool):
+        return 'b%d' % value
+    if isinstance(value, int):
+        return 'i%d' % value
+    if isinstance(value, float):
+        return 'f%r' % value
+    return 's%s' % value
+
+
+def _decode_value(encval):
+    """Decode a single value encoded by _encode_value.
+    """
+    vtype = encval[:1]
+    if vtype == 's':
+        return encval[1:]
+    if vtype == 'n':
+        return None
+    if vtype == 'i':
+        return int(encval[1:])
+    if vtype == 'f':
+        return float(encval[1:])
+    if vtype == 'b':
+        return encval[1:] == '1'
+    raise ValueError("Invalid value in columnar master list: %s" % encval)
+
+
+def write_master_list(filename, master):
+    """Write master list dictionary to filename in columnar format.
+    """
+    lines = master['list'][intgdefs.LISTENTRY]
+    linekeys = list(lines.keys())
+    numlines = len(linekeys)
+
+    strindex = {}
+    strings = []
+    columns = OrderedDict()     # (nickname, key) -> array of string indexes
+
+    def setval(nickname, key, idx, value):
+        encval = _encode_value(value)
+        if encval not in strindex:
+            strindex[encval] = len(strings)
+            strings.append(encval)
+        col = columns.get((nickname, key))
+        if col is None:
+            col = array.array('I', [_MISSING]) * numlines
+            columns[(nickname, key)] = col
+        col[idx] = strindex[encval]
+
+    for idx, lkey in enumerate(linekeys):
+        for key, value in lines[lkey].items():
+            if key == 'file':
+                for nickname, fdict in value.items():
+                    for fkey, fvalue in fdict.items():
+                        setval(nickname, fkey, idx, fvalue)
+            else:
+                setval(None, key, idx, value)
+
+    encstrings = [x.encode('utf-8') for x in strings]
+    stroffsets = array.array('Q', [0])
+    for encstr in encstrings:
+        stroffsets.append(stroffsets[-1] + len(encstr))
+    header = {'numlines': numlines,
+              'linekeys': linekeys,
+              'columns': list(columns.keys()),
+              'byteorder': sys.byteorder,
+              'numstrings': len(strings),
+              'strtab_len': stroffsets[-1]}
+    hdrbytes = json.dumps(header).encode('utf-8')
+
+    with open(filename, 'wb') as outfh:
+        outfh.write(_MAGIC)
+        outfh.write(struct.pack('<Q', len(hdrbytes)))
+        outfh.write(hdrbytes)
+        for encstr in encstrings:
+            outfh.write(encstr)
+        # align offsets and columns so they can be cast directly from the memory map
+        pad = -outfh.tell() % 8
+        outfh.write(b'\0' * pad)
+        stroffsets.tofile(outfh)
+        for col in columns.values():
+            col.tofile(outfh)
+
+
+def read_master_list(filename):
+    """Return master list from columnar file.
+    """
+    return {'list': {intgdefs.LISTENTRY: ColumnarLines(_ColumnarStore(filename))}}
+
+
+class _ColumnarStore(object):
+    """Columns of a master list file plus in-memory changes.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as infh:
+            self.mmap = mmap.mmap(infh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("%s is not a columnar master list" % filename)
+        pos = len(_MAGIC)
+        (hdrlen,) = struct.unpack('<Q', self.mmap[pos:pos+8])
+        pos += 8
+        header = json.loads(self.mmap[pos:pos+hdrlen].decode('utf-8'))
+        pos += hdrlen
+
+        # strings are decoded when first needed
+        self.strtab_pos = pos
+        pos += header['strtab_len']
+        pos += -pos % 8
+        numstrings = header['numstrings']
+        self.stroffsets = self._map_array('Q', pos, numstrings + 1, header['byteorder'])
+        pos += 8 * (numstrings + 1)
+        self.strings = {}
+
+        self.numlines = header['numlines']
+        self.linekeys = header['linekeys']
+        self.columns = OrderedDict()
+        for (nickname, key) in header['columns']:
+            self.columns[(nickname, key)] = self._map_array('I', pos, self.numlines,
+                                                            header['byteorder'])
+            pos += 4 * self.numlines
+
+        # changes made after reading, (nickname, key) -> {line index: value}
+        self.changes = OrderedDict()
+        self.changed_nicks = set()
+
+        # keys per nickname in column order, None is the line itself
+        self.nickkeys = OrderedDict()
+        # columns read from the file per nickname, [(key, column), ...]
+        self.nickcols = OrderedDict()
+        for (nickname, key), col in self.columns.items():
+            self.nickkeys.setdefault(nickname, OrderedDict())[key] = True
+            self.nickcols.setdefault(nickname, []).append((key, col))
+
+    def _map_array(self, typecode, pos, length, byteorder):
+        """Return array of length items of typecode at pos in the memory map.
+        """
+        nbytes = array.array(typecode).itemsize * length
+        if byteorder == sys.byteorder:
+            return memoryview(self.mmap)[pos:pos+nbytes].cast(typecode)
+        arr = array.array(typecode)
+        arr.frombytes(self.mmap[pos:pos+nbytes])
+        arr.byteswap()
+        return arr
+
+    def __getstate__(self):
+        # memory map can't be pickled, so just save the changes and reopen the file
+        return {'filename': self.filename, 'changes': self.changes, 'nickkeys': self.nickkeys}
+
+    def __setstate__(self, state):
+        self.__init__(state['filename'])
+        self.changes = state['changes']
+        self.changed_nicks = set([nickname for (nickname, _) in self.changes])
+        self.nickkeys = state['nickkeys']
+
+    def string(self, stridx):
+        """Return value stored at stridx in the string table.
+        """
+        value = self.strings.get(stridx, _DELETED)
+        if value is _DELETED:
+            beg = self.strtab_pos + self.stroffsets[stridx]
+            end = self.strtab_pos + self.stroffsets[stridx+1]
+            value = _decode_value(self.mmap[beg:end].decode('utf-8'))
+            self.strings[stridx] = value
+        return value
+
+    def get(self, nickname, key, idx):
+        """Return (found, value) for key of given file in line idx.
+        """
+        if (nickname, key) in self.changes:
+            value = self.changes[(nickname, key)].get(idx, None)
+            if value is _DELETED:
+                return (False, None)
+            if value is not None or idx in self.changes[(nickname, key)]:
+                return (True, value)
+        col = self.columns.get((nickname, key))
+        if col is None or col[idx] == _MISSING:
+            return (False, None)
+        return (True, self.string(col[idx]))
+
+    def set(self, nickname, key, idx, value):
+        """Set key of given file in line idx.
+        """
+        self.changes.setdefault((nickname, key), {})[idx] = value
+        self.changed_nicks.add(nickname)
+        self.nickkeys.setdefault(nickname, OrderedDict())[key] = True
+
+    def keys(self, nickname, idx):
+        """Return keys present for given file in line idx.
+        """
+        if nickname not in self.changed_nicks:
+            return [key for (key, col) in self.nickcols.get(nickname, ())
+                    if col[idx] != _MISSING]
+        return [key for key in self.nickkeys.get(nickname, ())
+                if self.get(nickname, key, idx)[0]]
+
+    def has_file(self, nickname, idx):
+        """Return whether given file has any keys in line idx.
+        """
+        if nickname not in self.changed_nicks:
+            return any(col[idx] != _MISSING for (_, col) in self.nickcols.get(nickname, ()))
+        return len(self.keys(nickname, idx)) > 0
+
+
+class _ColumnarMapping(MutableMapping):
+    """Common behavior of the views into a columnar master list.
+    """
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return repr(self.todict())
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.todict(), memo)
+
+    def todict(self):
+        """Return contents as plain dictionaries.
+        """
+        return OrderedDict((key, val.todict() if isinstance(val, _ColumnarMapping) else val)
+                           for key, val in self.items())
+
+
+class ColumnarLines(_ColumnarMapping):
+    """Lines of a columnar master list keyed by line nickname.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lineidx = None
+        self.added = OrderedDict()    # lines added or replaced after reading
+        self.deleted = set()
+
+    def _index(self, lkey):
+        if self.lineidx is None:
+            self.lineidx = {k: i for i, k in enumerate(self.store.linekeys)}
+        return self.lineidx.get(lkey)
+
+    def __getitem__(self, lkey):
+        if lkey in self.added:
+            return self.added[lkey]
+        idx = self._index(lkey)
+        if idx is None or lkey in self.deleted:
+            raise KeyError(lkey)
+        return _ColumnarLine(self.store, idx)
+
+    def __setitem__(self, lkey, value):
+        self.added[lkey] = value
+
+    def __delitem__(self, lkey):
+        if lkey in self.added:
+            del self.added[lkey]
+        elif self._index(lkey) is not None and lkey not in self.deleted:
+            self.deleted.add(lkey)
+        else:
+            raise KeyError(lkey)
+
+    def keys(self):
+        keys = [k for k in self.store.linekeys if k not in self.deleted and k not in self.added]
+        return keys + list(self.added.keys())
+
+    def __len__(self):
+        return len(self.keys()) if self.added or self.deleted else self.store.numlines
+
+
+class _ColumnarLine(_ColumnarMapping):
+    """Single line of a columnar master list.
+    """
+
+    def __init__(self, store, idx):
+        self.store = store
+        self.idx = idx
+
+    def __getitem__(self, key):
+        if key == 'file':
+            return _ColumnarFiles(self.store, self.idx)
+        (found, value) = self.store.get(None, key, self.idx)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key == 'file':
+            files = _ColumnarFiles(self.store, self.idx)
+            files.clear()
+            files.update(value)
+        else:
+            self.store.set(None, key, self.idx, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.store.set(None, key, self.idx, _DELETED)
+
+    def keys(self):
+        return self.store.keys(None, self.idx) + ['file']
+
+
+class _ColumnarFiles(_ColumnarMapping):
+    """Files in a single line of a columnar master list keyed by file nickname.
+    """
+
+    def __init__(self, store, idx):
+        self.store = store
+        self.idx = idx
+
+    def __getitem__(self, nickname):
+        if nickname is None or not self.store.has_file(nickname, self.idx):
+            raise KeyError(nickname)
+        return _ColumnarFile(self.store, self.idx, nickname)
+
+    def __setitem__(self, nickname, fdict):
+        fdict = dict(fdict)
+        for key in self.store.keys(nickname, self.idx):
+            if key not in fdict:
+                self.store.set(nickname, key, self.idx, _DELETED)
+        for key, value in fdict.items():
+            self.store.set(nickname, key, self.idx, value)
+
+    def __delitem__(self, nickname):
+        for key in self[nickname].keys():
+            self.store.set(nickname, key, self.idx, _DELETED)
+
+    def keys(self):
+        return [nick for nick in self.store.nickkeys
+                if nick is not None and self.store.has_file(nick, self.idx)]
+
+
+class _ColumnarFile(_ColumnarMapping):
+    """Information about a single file in a line of a columnar master list.
+    """
+
+    def __init__(self, store, idx, nickname):
+        self.store = store
+        self.idx = idx
+        self.nickname = nickname
+
+    def __getitem__(self, key):
+        (found, value) = self.store.get(self.nickname, key, self.idx)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.nickname, key, self.idx, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.store.set(self.nickname, key, self.idx, _DELETED)
+
+    def keys(self):
+        return self.store.keys(self.nickname, self.idx)
+
+
+class MasterListView(Mapping):
+    """Read-only view of a subset of the lines of a master list.
+
+    Used for sublists so lines are shared with the master list instead of copied.
+    """
+
+    def __init__(self, lines, linekeys):
+        self.lines = lines
+        self.linekeys = linekeys
+        self.keyset = None
+
+    def __getitem__(self, lkey):
+        if self.keyset is None:
+            self.keyset = frozenset(self.linekeys)
+        if lkey not in self.keyset:
+            raise KeyError(lkey)
+        return self.lines[lkey]
+
+    def __iter__(self):
+        return iter(self.linekeys)
+
+    def __len__(self):
+        return len(self.linekeys)
+
+    def values(self):
+        return [self.lines[lkey] for lkey in self.linekeys]
+
+    def items(self):
+        return [(lkey, self.lines[lkey]) for lkey in self.linekeys]
+
+    def __repr__(self):
+        return repr(OrderedDict(self.items()))
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(OrderedDict(self.items()), memo)
@@ -0,0 +1,233 @@
+"""Build and run generic DB queries that determine input files for a search.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import despymisc.miscutils as miscutils
+import intgutils.queryutils as queryutils
+import intgutils.intgdefs as intgdefs
+import intgutils.replace_funcs as replfuncs
+import processingfw.pfwdefs as pfwdefs
+import processingfw.pfwmasterlist as pfwmasterlist
+
+
+def get_search_dict(config, modulename, searchname):
+    """Return the list or file definition for the given search.
+    """
+    if modulename not in config[pfwdefs.SW_MODULESECT]:
+        raise Exception("Error: module '%s' does not exist.\n" % (modulename))
+
+    module_dict = config[pfwdefs.SW_MODULESECT][modulename]
+
+    if searchname is not None:
+        if pfwdefs.SW_LISTSECT in module_dict and \
+           searchname in module_dict[pfwdefs.SW_LISTSECT]:
+            search_dict = module_dict[pfwdefs.SW_LISTSECT][searchname]
+        elif pfwdefs.SW_FILESECT in module_dict and \
+                searchname in module_dict[pfwdefs.SW_FILESECT]:
+            search_dict = module_dict[pfwdefs.SW_FILESECT][searchname]
+        else:
+            raise Exception("Error: Could not find either list or file by name %s in module %s\n" %
+                            (searchname, modulename))
+    else:
+        raise Exception("Error: need to define either list or file or search\n")
+
+    return search_dict
+
+
+def create_query(config, modulename, search_dict):
+    """Create the query dictionary for gen_file_list from a search definition.
+    """
+    module_dict = config[pfwdefs.SW_MODULESECT][modulename]
+
+    archive_names = []
+
+    if config.getfull(pfwdefs.USE_HOME_ARCHIVE_INPUT) != 'never':
+        archive_names.append(config.getfull(pfwdefs.HOME_ARCHIVE))
+
+    if config.getfull(pfwdefs.USE_TARGET_ARCHIVE_INPUT) != 'never':
+        archive_names.append(config.getfull(pfwdefs.TARGET_ARCHIVE))
+
+    fields = miscutils.fwsplit(search_dict[pfwdefs.SW_QUERYFIELDS].lower())
+
+    if ('query_run' in config and 'fileclass' in search_dict and
+            'fileclass' in config and search_dict['fileclass'] == config['fileclass']):
+        query_run = config['query_run'].lower()
+        if query_run == 'current':
+            fields.append('run')
+        elif query_run == 'allbutfirstcurrent':
+            if 'current' not in config:
+                raise Exception("Internal Error:  Current object doesn't exist\n")
+            elif 'curr_blocknum' not in config['current']:
+                raise Exception("Internal Error:  current->curr_blocknum doesn't exist\n")
+            else:
+                block_num = config['current']['curr_blocknum']
+                if block_num > 0:
+                    fields.append('run')
+
+    query = {}
+    qtable = search_dict['query_table']
+    for fld in fields:
+        table = qtable
+        if '.' in fld:
+            table, fld = fld.split('.')
+
+        if fld in search_dict:
+            value = search_dict[fld]
+        elif fld in module_dict:
+            value = module_dict[fld]
+        elif fld in config:
+            value = config.getfull(fld)
+        else:
+            raise Exception("Error: genquery could not find value for query field %s\n" % (fld))
+
+        value = replfuncs.replace_vars(value, config,
+                                       {pfwdefs.PF_CURRVALS: {'modulename': modulename},
+                                        'searchobj': search_dict,
+                                        intgdefs.REPLACE_VARS: True,
+                                        'expand': True})[0]
+        if value is None:
+            raise Exception("Value=None for query field %s\n" % (fld))
+
+        if ',' in value:
+            value = miscutils.fwsplit(value)
+
+        if ':' in value:
+            value = miscutils.fwsplit(value)
+
+        if table not in query:
+            query[table] = {}
+
+        if 'key_vals' not in query[table]:
+            query[table]['key_vals'] = {}
+
+        query[table]['key_vals'][fld] = value
+
+    # if specified, insert join into query hash
+    if 'join' in search_dict:
+        joins = miscutils.fwsplit(search_dict['join'].lower())
+        for j in joins:
+            jmatch = re.search(r"(\S+)\.(\S+)\s*=\s*(\S+)", j)
+            if jmatch:
+                table = jmatch.group(1)
+                if table not in query:
+                    query[table] = {}
+                if 'join' not in query[table]:
+                    query[table]['join'] = j
+                else:
+                    query[jmatch.group(1)]['join'] += "," + j
+        #query[table]['join']=search_dict['join']
+
+    query[qtable]['select_fields'] = ['filename']
+
+    # check output fields for fields from other tables.
+    if 'output_fields' in search_dict:
+        output_fields = miscutils.fwsplit(search_dict['output_fields'].lower())
+
+        for ofield in output_fields:
+            ofmatch = re.search(r"(\S+)\.(\S+)", ofield)
+            if ofmatch:
+                table = ofmatch.group(1)
+                field = ofmatch.group(2)
+            else:
+                table = qtable
+                field = ofield
+            if table not in query:
+                query[table] = {}
+            if 'select_fields' not in query[table]:
+                query[table]['select_fields'] = []
+            if field not in query[table]['select_fields']:
+                query[table]['select_fields'].append(field)
+
+    for tbl in query:
+        if 'select_fields' in query[tbl]:
+            query[tbl]['select_fields'] = ','.join(query[tbl]['select_fields'])
+
+    if len(archive_names) > 0:
+        #query[qtable]['join'] = "%s.filename=file_archive_info.filename" % qtable
+        query['file_archive_info'] = {'select_fields': 'compression'}
+        query['file_archive_info']['join'] = "file_archive_info.filename=%s.filename" % qtable
+        query['file_archive_info']['key_vals'] = {'archive_name': ','.join(archive_names)}
+
+    return query
+
+
+def get_query_cache(config):
+    """Return query cache settings from config or None if caching is off.
+    """
+    (exists, cachedir) = config.search(pfwdefs.QUERY_CACHE_DIR, {intgdefs.REPLACE_VARS: True})
+    if not exists or not cachedir:
+        return None
+
+    (exists, ttl) = config.search(pfwdefs.QUERY_CACHE_TTL, {intgdefs.REPLACE_VARS: True})
+    if not exists:
+        ttl = pfwdefs.QUERY_CACHE_TTL_DEFAULT
+
+    (exists, token) = config.search(pfwdefs.QUERY_CACHE_TOKEN, {intgdefs.REPLACE_VARS: True})
+    if not exists:
+        token = None
+
+    return {'dir': cachedir, 'ttl': int(ttl), 'token': token}
+
+
+def get_query_cache_file(dbh, cache, query, qouttype):
+    """Return the cache filename for the results of query.
+    """
+    keydict = {'query': query, 'qouttype': qouttype}
+    if cache['token'] is not None:
+        # e.g., select max(id) from desfile so new files invalidate the cache
+        curs = dbh.cursor()
+        curs.execute(cache['token'])
+        keydict['token'] = [str(x) for x in curs.fetchone()]
+        curs.close()
+
+    key = hashlib.sha1(json.dumps(keydict, sort_keys=True).encode()).hexdigest()
+    return "%s/%s/%s.%s" % (cache['dir'], key[:2], key, qouttype)
+
+
+def gen_master_list(dbh, query, qoutfile, qouttype, searchname, out_file=None, cache=None):
+    """Run query and write the resulting master list.
+
+    If cache is given, identical queries reuse a master list saved by an earlier run.
+    """
+    print("Calling gen_file_list with the following query:\n", file=out_file)
+    miscutils.pretty_print_dict(query, out_file=out_file, sortit=False, indent=4)
+    print("\n\n", file=out_file)
+
+    cachefile = None
+    if cache is not None:
+        cachefile = get_query_cache_file(dbh, cache, query, qouttype)
+        if os.path.exists(cachefile) and \
+                time.time() - os.path.getmtime(cachefile) < cache['ttl']:
+            print("Using cached master list %s" % cachefile, file=out_file)
+            shutil.copyfile(cachefile, qoutfile)
+            return
+
+    files = queryutils.gen_file_list(dbh, query)
+
+    if len(files) == 0:
+        raise Exception("genquery: query returned zero results for %s\nAborting\n" %
+                        searchname)
+
+    ## output list
+    lines = queryutils.convert_single_files_to_lines(files)
+    if qouttype == pfwmasterlist.COLUMNAR_FORMAT:
+        pfwmasterlist.write_master_list(qoutfile, lines)
+    else:
+        queryutils.output_lines(qoutfile, lines, qouttype)
+
+    if cachefile is not None:
+        # copy then rename so concurrent readers never see a partial file
+        cachedir = os.path.dirname(cachefile)
+        miscutils.coremakedirs(cachedir)
+        (tmpfh, tmpname) = tempfile.mkstemp(dir=cachedir)
+        os.close(tmpfh)
+        shutil.copyfile(qoutfile, tmpname)
+        os.chmod(tmpname, 0o644)
+        os.replace(tmpname, cachefile)
+        print("Saved master list to cache %s" % cachefile, file=out_file)
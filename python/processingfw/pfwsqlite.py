@@ -0,0 +1,361 @@
+"""SQLite stand-in for the DES database used by PFWDB.
+
+Selected by a des services section with ``type = sqlite`` whose ``name`` is
+the database file (relative paths are relative to the services file).  It
+covers the task and pfw_* tables written by the framework so runs with
+use_db_out=True can happen offline, e.g., for benchmarking DB call volume.
+
+Only the PFWDB calls made while a run executes are supported: insert_run,
+insert_block, insert_jobs/insert_job, insert_wrapper, insert_exec,
+insert_data_query, the compress_task calls, task create/begin/end, the
+update_* and get_*_info calls and check_files.  There are no OPS_* metadata
+tables, so get_database_defaults is not supported (use_db_in must be False
+or the submit side must use Oracle), and QCF messages (blockpost) use their
+own Oracle connection.
+"""
+
+import configparser
+import datetime
+import os
+import re
+import socket
+import sqlite3
+
+from despydmdb import desdmdbi
+from despymisc import miscutils
+
+SQLITE_TIMEOUT = 60   # secs to wait on a locked database
+
+SCHEMA = [
+    "create table if not exists seq (name text primary key, val integer)",
+    "create table if not exists task (id integer primary key, name text, info_table text, "
+    "parent_task_id integer, root_task_id integer, label text, start_time timestamp, "
+    "end_time timestamp, status integer, exec_host text)",
+    "create table if not exists task_message (id integer primary key, task_id integer, "
+    "pfw_attempt_id integer, message_time timestamp, message_lvl integer, "
+    "message_pattern_id integer, message text, log_file text, log_line integer)",
+    "create table if not exists pfw_request (reqnum integer, project text, campaign text, "
+    "jira_id text, pipeline text)",
+    "create table if not exists pfw_unit (reqnum integer, unitname text)",
+    "create table if not exists pfw_attempt (id integer primary key, reqnum integer, "
+    "unitname text, attnum integer, operator text, submittime timestamp, numexpblk integer, "
+    "basket text, group_submit_id integer, task_id integer, subpipeprod text, "
+    "subpipever text, archive_path text, condorid integer, endtime timestamp, status integer)",
+    "create table if not exists pfw_attempt_label (pfw_attempt_id integer, label text)",
+    "create table if not exists pfw_attempt_val (pfw_attempt_id integer, key text, val text)",
+    "create table if not exists pfw_block (task_id integer primary key, pfw_attempt_id integer, "
+    "blknum integer, name text, target_site text, modulelist text, numexpjobs integer)",
+    "create table if not exists pfw_job (task_id integer primary key, pfw_attempt_id integer, "
+    "pfw_block_task_id integer, jobnum integer, expect_num_wrap integer, pipeprod text, "
+    "pipever text, jobkeys text, condor_job_id real, target_job_id text, jobroot text, "
+    "junktar text, diskusage integer)",
+    "create table if not exists pfw_wrapper (task_id integer primary key, "
+    "pfw_attempt_id integer, pfw_block_task_id integer, pfw_job_task_id integer, "
+    "wrapnum integer, modname text, name text, inputwcl text, wrapkeys text, "
+    "outputwcl text, log text, diskusage integer)",
+    "create table if not exists pfw_exec (task_id integer primary key, pfw_attempt_id integer, "
+    "pfw_block_task_id integer, pfw_job_task_id integer, pfw_wrapper_task_id integer, "
+    "execnum integer, name text, version text, cmdargs text, idrss integer, "
+    "inblock integer, isrss integer, ixrss integer, majflt integer, maxrss integer, "
+    "minflt integer, msgrcv integer, msgsnd integer, nivcsw integer, nsignals integer, "
+    "nswap integer, nvcsw integer, oublock integer, stime real, utime real)",
+    "create table if not exists pfw_data_query (task_id integer primary key, "
+    "pfw_attempt_id integer, pfw_block_task_id integer, modname text, datatype text, "
+    "dataname text, execname text, cmdargs text, version text)",
+    "create table if not exists compress_task (task_id integer primary key, name text, "
+    "version text, cmdargs text, num_requested integer, num_failed integer, "
+    "tot_bytes_before integer, tot_bytes_after integer)",
+    "create table if not exists desfile (id integer primary key, filename text, "
+    "compression text, filetype text, filesize integer, md5sum text, "
+    "pfw_attempt_id integer, wgb_task_id integer)",
+    "create table if not exists file_archive_info (desfile_id integer, filename text, "
+    "compression text, archive_name text, path text)",
+    "create table if not exists wgb (filename text, reqnum integer, unitname text, "
+    "attnum integer, blknum integer)",
+    "create table if not exists ops_archive (name text primary key, root text)",
+]
+
+# temporary table standing in for Oracle's global temporary table
+GTT_FILENAME = 'gtt_filename'
+
+sqlite3.register_adapter(datetime.datetime, lambda val: val.isoformat(' '))
+
+
+def get_sqlite_file(desfile=None, section=None):
+    """Return database file if the des services section selects sqlite, else None.
+    """
+    if desfile is None:
+        desfile = os.environ.get('DES_SERVICES', os.path.expanduser('~/.desservices.ini'))
+    if section is None:
+        section = os.environ.get('DES_DB_SECTION')
+    if section is None or not os.path.isfile(desfile):
+        return None
+
+    cfg = configparser.RawConfigParser()
+    cfg.read(desfile)
+    if not cfg.has_section(section) or \
+       cfg.get(section, 'type', fallback='').lower() != 'sqlite':
+        return None
+
+    dbfile = os.path.expanduser(cfg.get(section, 'name'))
+    if not os.path.isabs(dbfile):
+        dbfile = os.path.join(os.path.dirname(os.path.abspath(desfile)), dbfile)
+    return dbfile
+
+
+def _nullcmp(val1, val2):
+    """Return 1 if values are equal treating NULLs as equal (mimics DB function).
+    """
+    return int(val1 == val2)
+
+
+class SQLiteCursor(object):
+    """Wrap sqlite3 cursor adding cx_Oracle style prepare and missing column handling.
+    """
+
+    def __init__(self, dbi, curs):
+        self.dbi = dbi
+        self.curs = curs
+        self.prepared = None
+
+    def __getattr__(self, name):
+        return getattr(self.curs, name)
+
+    def __iter__(self):
+        return iter(self.curs)
+
+    def prepare(self, sql):
+        """Save statement for later execute(None, params).
+        """
+        self.prepared = sql
+
+    def execute(self, sql, params=()):
+        """Execute statement, adding columns missing from the stand-in schema.
+        """
+        if sql is None:
+            sql = self.prepared
+        self.dbi.add_missing_columns(sql, lambda: self.curs.execute(sql, params))
+        return self
+
+    def executemany(self, sql, paramlist):
+        """Execute statement for each set of params.
+        """
+        self.dbi.add_missing_columns(sql, lambda: self.curs.executemany(sql, paramlist))
+        return self
+
+
+class SQLiteDbi(desdmdbi.DesDmDbi):
+    """Implement the DesDmDbi methods used by PFWDB on top of a SQLite file.
+    """
+
+    def __init__(self, desfile=None, section=None):
+        self.type = 'sqlite'
+        self.dbfile = get_sqlite_file(desfile, section)
+        if self.dbfile is None:
+            raise ValueError("Error: des services section %s is not a sqlite section" % section)
+        if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+            miscutils.fwdebug_print("Using sqlite database %s" % self.dbfile)
+
+        # pooled connections may be borrowed by other threads (one at a time)
+        self.con = sqlite3.connect(self.dbfile, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+        self.con.create_function('nullcmp', 2, _nullcmp)
+        self.con.execute("pragma journal_mode=wal")
+        # sequences use their own autocommit connection so they do not
+        # hold the write lock until the next commit
+        self.seqcon = sqlite3.connect(self.dbfile, timeout=SQLITE_TIMEOUT, isolation_level=None,
+                                      check_same_thread=False)
+        for sql in SCHEMA:
+            self.seqcon.execute(sql)
+        self.con.execute("create temp table if not exists %s (filename text, compression text)" %
+                         GTT_FILENAME)
+
+    def add_missing_columns(self, sql, func):
+        """Run func adding any column an insert/update says is missing, then retrying.
+        """
+        match = re.match(r'\s*(?:insert\s+into|update)\s+(\w+)', sql, re.IGNORECASE)
+        while True:
+            try:
+                return func()
+            except sqlite3.OperationalError as err:
+                colmatch = re.search(r'(?:has no column named|no such column:) (\w+)', str(err))
+                if match is None or colmatch is None:
+                    raise
+                if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+                    miscutils.fwdebug_print("Adding column %s to %s" % (colmatch.group(1),
+                                                                        match.group(1)))
+                self.con.execute("alter table %s add column %s" % (match.group(1),
+                                                                   colmatch.group(1)))
+
+    def cursor(self):
+        return SQLiteCursor(self, self.con.cursor())
+
+    def commit(self):
+        self.con.commit()
+
+    def rollback(self):
+        self.con.rollback()
+
+    def close(self):
+        self.con.close()
+        self.seqcon.close()
+
+    def ping(self):
+        try:
+            self.con.execute("select 1").fetchall()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def get_named_bind_string(self, name):
+        return ':' + name
+
+    def get_positional_bind_string(self, pos=1):
+        return '?'
+
+    def get_current_timestamp_str(self):
+        return "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+    def from_dual(self):
+        return ''
+
+    def get_seq_next_value(self, seqname):
+        """Return next value of emulated sequence.
+        """
+        return self.get_seq_next_values(seqname, 1)[0]
+
+    def get_seq_next_values(self, seqname, count):
+        """Return list of count next values of emulated sequence.
+        """
+        if self.con.in_transaction:
+            # already holding the write lock, a second connection would wait on it
+            curs = self.con
+        else:
+            curs = self.seqcon
+            curs.execute("begin immediate")
+        try:
+            curs.execute("insert or ignore into seq (name, val) values (?, 0)", (seqname,))
+            curs.execute("update seq set val=val+? where name=?", (count, seqname))
+            val = curs.execute("select val from seq where name=?", (seqname,)).fetchone()[0]
+            if curs is self.seqcon:
+                curs.execute("commit")
+        except:
+            if curs is self.seqcon:
+                curs.execute("rollback")
+            raise
+        return list(range(val - count + 1, val + 1))
+
+    def basic_insert_row(self, table, row):
+        """Insert a row into a table (no commit).
+        """
+        ctstr = self.get_current_timestamp_str()
+        cols = list(row.keys())
+        vals = [ctstr if row[c] == ctstr else self.get_named_bind_string(c) for c in cols]
+        params = dict([(c, row[c]) for c in cols if row[c] != ctstr])
+        sql = "insert into %s (%s) values (%s)" % (table, ','.join(cols), ','.join(vals))
+        if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+            miscutils.fwdebug_print("sql> %s" % sql)
+        self.cursor().execute(sql, params)
+
+    def basic_update_row(self, table, updatevals, wherevals):
+        """Update rows in a table (no commit).
+        """
+        ctstr = self.get_current_timestamp_str()
+        params = {}
+        setvals = []
+        for col, val in updatevals.items():
+            if val == ctstr:
+                setvals.append("%s=%s" % (col, ctstr))
+            else:
+                setvals.append("%s=%s" % (col, self.get_named_bind_string(col)))
+                params[col] = val
+        whclause = []
+        for col, val in wherevals.items():
+            whclause.append("%s=%s" % (col, self.get_named_bind_string('w_' + col)))
+            params['w_' + col] = val
+        sql = "update %s set %s where %s" % (table, ','.join(setvals), ' and '.join(whclause))
+        if miscutils.fwdebug_check(3, 'PFWDB_DEBUG'):
+            miscutils.fwdebug_print("sql> %s" % sql)
+        curs = self.cursor()
+        curs.execute(sql, params)
+        return curs.rowcount
+
+    def insert_many(self, table, columns, rows):
+        """Insert many rows (dicts or sequences in column order) into a table.
+        """
+        if len(rows) == 0:
+            return
+        if isinstance(rows[0], dict):
+            rows = [[row.get(c) for c in columns] for row in rows]
+        sql = "insert into %s (%s) values (%s)" % (table, ','.join(columns),
+                                                   ','.join(['?'] * len(columns)))
+        self.cursor().executemany(sql, rows)
+
+    def query_results_dict(self, sql, tkey):
+        """Return query results as dict of row dicts keyed on tkey column value.
+        """
+        curs = self.cursor()
+        curs.execute(sql)
+        desc = [d[0].lower() for d in curs.description]
+        result = {}
+        for line in curs:
+            row = dict(zip(desc, line))
+            result[str(row[tkey.lower()]).lower()] = row
+        curs.close()
+        return result
+
+    def create_task(self, name, info_table, parent_task_id=None, root_task_id=None,
+                    i_am_root=False, label=None, do_begin=False, do_commit=False):
+        """Insert a row into the task table and return its id.
+        """
+        row = {'name': name, 'info_table': info_table, 'label': label}
+        row['id'] = self.get_seq_next_value('task_seq')
+        if parent_task_id is not None:
+            row['parent_task_id'] = int(parent_task_id)
+        if i_am_root:
+            row['root_task_id'] = row['id']
+        elif root_task_id is not None:
+            row['root_task_id'] = int(root_task_id)
+        self.basic_insert_row('task', row)
+        if do_begin:
+            self.begin_task(row['id'])
+        if do_commit:
+            self.commit()
+        return row['id']
+
+    def begin_task(self, task_id, do_commit=False):
+        """Set start time and exec host for a task.
+        """
+        self.basic_update_row('task', {'start_time': self.get_current_timestamp_str(),
+                                       'exec_host': socket.gethostname()},
+                              {'id': task_id})
+        if do_commit:
+            self.commit()
+
+    def end_task(self, task_id, status, do_commit=False):
+        """Set end time and status for a task.
+        """
+        self.basic_update_row('task', {'end_time': self.get_current_timestamp_str(),
+                                       'status': status},
+                              {'id': task_id})
+        if do_commit:
+            self.commit()
+
+    def load_filename_gtt(self, filelist):
+        """Load filenames (with optional compression) into the temp table and return its name.
+        """
+        rows = []
+        for fname in filelist:
+            if isinstance(fname, dict):
+                rows.append((fname['filename'], fname.get('compression')))
+            else:
+                (filename, compression) = miscutils.parse_fullname(
+                    fname, miscutils.CU_PARSE_FILENAME | miscutils.CU_PARSE_COMPRESSION)
+                rows.append((filename, compression))
+        self.con.executemany("insert into %s (filename, compression) values (?, ?)" %
+                             GTT_FILENAME, rows)
+        return GTT_FILENAME
+
+    def empty_gtt(self, gtt_name):
+        """Remove all rows from a temp table.
+        """
+        self.con.execute("delete from %s" % gtt_name)
@@ -11,12 +11,37 @@ import errno
 import time
 import subprocess
 import shlex
+import resource
+import collections
 
 import despymisc.miscutils as miscutils
 import processingfw.pfwdefs as pfwdefs
 import qcframework.Messaging as Messaging
 
 
+def search_overlay(*layers):
+    """Return mapping searching the given dictionaries in order without copying them.
+
+    Changes go into a new top layer, so the given dictionaries are never modified.
+    Use instead of a deepcopy followed by update for search objects and currvals.
+    """
+    return collections.ChainMap({}, *layers)
+
+
+def get_rss_mb():
+    """Return (current, peak) resident set size of this process in MB.
+    """
+    # ru_maxrss is in KB on linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    current = None
+    try:
+        with open('/proc/self/statm', 'r') as statmfh:
+            current = int(statmfh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024.0
+    except (IOError, OSError, ValueError):
+        pass
+    return (current, peak)
+
+
 def pad_jobnum(jobnum):
     """Pad the job number.
     """
@@ -107,9 +132,25 @@ def tar_dir(filename, indir):
         tar.add(indir)
 
 
-def tar_list(tarfilename, filelist):
+def tar_list(tarfilename, filelist, compressor=None):
     """Tars a directory.
+
+    If given, compressor (e.g., pigz) compresses .gz tarballs instead of python's gzip.
     """
+    if tarfilename.endswith('.gz') and compressor:
+        # stream uncompressed tar into the external compressor
+        with open(tarfilename, 'wb') as outfh:
+            proc = subprocess.Popen(shlex.split(compressor), stdin=subprocess.PIPE,
+                                    stdout=outfh)
+            with tarfile.open(fileobj=proc.stdin, mode='w|') as tar:
+                for filen in filelist:
+                    tar.add(filen)
+            proc.stdin.close()
+            if proc.wait() != 0:
+                raise Exception("Error: %s exited with %s while creating %s" %
+                                (compressor, proc.returncode, tarfilename))
+        return
+
     if tarfilename.endswith('.gz'):
         mode = 'w:gz'
     else:
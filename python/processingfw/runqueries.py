@@ -6,6 +6,7 @@ import sys
 import os
 import time
 import traceback
+import concurrent.futures
 
 import despymisc.miscutils as miscutils
 import intgutils.intgdefs as intgdefs
@@ -14,6 +15,7 @@ import processingfw.pfwdefs as pfwdefs
 import processingfw.pfwutils as pfwutils
 import processingfw.pfwconfig as pfwconfig
 import processingfw.pfwdb as pfwdb
+import processingfw.pfwquery as pfwquery
 from processingfw.pfwlog import log_pfw_event
 
 
@@ -23,6 +25,26 @@ def create_master_list(config, configfile, modname, moddict,
     """
     miscutils.fwdebug_print("BEG")
 
+    query = setup_master_list_query(config, configfile, modname, moddict,
+                                    search_name, search_dict, search_type)
+    if query is not None:
+        pfwdb.set_pool_limits(config)
+        exitcode = run_master_list_query(query)
+        if exitcode != 0:
+            miscutils.fwdie("Error: problem creating master list (exitcode = %s)" %
+                            (exitcode), exitcode)
+
+    miscutils.fwdebug_print("END")
+
+
+def setup_master_list_query(config, configfile, modname, moddict,
+                            search_name, search_dict, search_type):
+    """Determine the command that creates master list for a list or file def.
+
+    Everything needed from config is copied into the returned dict so the
+    query can be run from another thread without touching config.
+    """
+
     if 'qouttype' in search_dict:
         qouttype = search_dict['qouttype']
     else:
@@ -38,6 +60,7 @@ def create_master_list(config, configfile, modname, moddict,
                                                       'suffix': 'out'}})
 
     prog = None
+    inprocess = False
     if 'exec' in search_dict:
         prog = search_dict['exec']
         if 'args' not in search_dict:
@@ -59,10 +82,17 @@ def create_master_list(config, configfile, modname, moddict,
         args = "--qoutfile %s --qouttype %s --config %s --module %s --search %s" % \
                (qoutfile, qouttype, configfile, modname, search_name)
 
+        (exists, inprocess) = config.search(pfwdefs.QUERY_IN_PROCESS,
+                                            {intgdefs.REPLACE_VARS: True})
+        if exists:
+            inprocess = miscutils.convertBool(inprocess)
+        else:
+            inprocess = pfwdefs.QUERY_IN_PROCESS_DEFAULT
+
     if not prog:
         print("\tWarning: %s in module %s does not have exec or %s defined" % \
             (search_name, modname, pfwdefs.SW_QUERYFIELDS))
-        return
+        return None
 
     search_dict['qoutfile'] = qoutfile
     search_dict['qlog'] = qlog
@@ -92,13 +122,83 @@ def create_master_list(config, configfile, modname, moddict,
     else:
         datatype = search_type[0].upper()
 
+    query = {'modname': modname, 'search_name': search_name, 'datatype': datatype,
+             'prog': prog, 'args': args, 'version': query_version,
+             'qoutfile': qoutfile, 'qouttype': qouttype, 'qlog': qlog,
+             'inprocess': inprocess,
+             'use_db': miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)),
+             'use_qcf': config.getfull(pfwdefs.PF_USE_QCF),
+             'pfw_attempt_id': config['pfw_attempt_id']}
+
+    if query['use_db']:
+        # the parts of config insert_data_query uses
+        blknum = config[pfwdefs.PF_BLKNUM]
+        query['dbwcl'] = {'pfw_attempt_id': config['pfw_attempt_id'],
+                          pfwdefs.PF_BLKNUM: blknum,
+                          'task_id': {'attempt': config['task_id']['attempt'],
+                                      'begblock': config['task_id']['begblock'],
+                                      'block': {blknum: config['task_id']['block'][blknum]}}}
+
+    if inprocess:
+        query['des_services'] = config.getfull('submit_des_services')
+        query['des_db_section'] = config.getfull('submit_des_db_section')
+        query['cache'] = pfwquery.get_query_cache(config)
+        try:
+            qsearch_dict = pfwquery.get_search_dict(config, modname, search_name)
+            query['qdict'] = pfwquery.create_query(config, modname, qsearch_dict)
+        except:
+            # reported in the query's log file like genquerydb.py would
+            query['qdict'] = None
+            query['qdict_error'] = traceback.format_exc()
+
+    return query
+
+
+def run_query_in_process(query):
+    """Create master list for a query_fields search from the query built from config.
+
+    Output that genquerydb.py would print goes to the query's log file.
+    """
+    with open(query['qlog'], 'w') as qlogfh:
+        if query['qdict'] is None:
+            qlogfh.write(query['qdict_error'])
+            return pfwdefs.PF_EXIT_FAILURE
+
+        try:
+            dbh = pfwdb.get_pfwdb(query['des_services'], query['des_db_section'])
+            try:
+                pfwquery.gen_master_list(dbh, query['qdict'], query['qoutfile'],
+                                         query['qouttype'], query['search_name'],
+                                         out_file=qlogfh, cache=query['cache'])
+            finally:
+                pfwdb.release_pfwdb(dbh)
+            exitcode = 0
+        except:
+            (extype, exvalue, trback) = sys.exc_info()
+            traceback.print_exception(extype, exvalue, trback, file=qlogfh)
+            exitcode = pfwdefs.PF_EXIT_FAILURE
+
+    return exitcode
+
+
+def run_master_list_query(query):
+    """Run command creating a master list, recording it in the DB, and return exit code.
+
+    The query's start and end times are recorded in the task row of its
+    pfw_data_query row (printed instead if not using the DB).
+    """
+    starttime = time.time()
+    modname = query['modname']
+    search_name = query['search_name']
+    prog = query['prog']
+    args = query['args']
+
     # call code
     query_tid = None
-    if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
-        pfw_dbh = pfwdb.PFWDB()
-        query_tid = pfw_dbh.insert_data_query(config, modname, datatype, search_name,
-                                              prog, args, query_version)
-        #pfw_dbh.close()
+    if query['use_db']:
+        pfw_dbh = pfwdb.get_pfwdb()
+        query_tid = pfw_dbh.insert_data_query(query['dbwcl'], modname, query['datatype'],
+                                              search_name, prog, args, query['version'])
     else:
         pfw_dbh = None
 
@@ -106,17 +206,21 @@ def create_master_list(config, configfile, modname, moddict,
     print("\t\tCalling code to create master list for obj %s in module %s" % \
         (search_name, modname))
     print("\t\t", prog, args)
-    print("\t\tSee output in %s/%s" % (cwd, qlog))
-    print("\t\tSee master list will be in %s/%s" % (cwd, qoutfile))
+    print("\t\tSee output in %s/%s" % (cwd, query['qlog']))
+    print("\t\tSee master list will be in %s/%s" % (cwd, query['qoutfile']))
 
     print("\t\tCreating master list - start ", time.time())
 
     cmd = "%s %s" % (prog, args)
     exitcode = None
     try:
-        exitcode = pfwutils.run_cmd_qcf(cmd, qlog, query_tid, os.path.basename(prog),
-                                        config.getfull(pfwdefs.PF_USE_QCF), pfw_dbh,
-                                        config['pfw_attempt_id'])
+        if query['inprocess']:
+            exitcode = run_query_in_process(query)
+        else:
+            exitcode = pfwutils.run_cmd_qcf(cmd, query['qlog'], query_tid,
+                                            os.path.basename(prog),
+                                            query['use_qcf'], pfw_dbh,
+                                            query['pfw_attempt_id'])
         #exitcode = pfwutils.run_cmd_qcf(cmd, qlog, query_tid, os.path.basename(prog),
         #                                5000, config.getfull(pfwdefs.PF_USE_QCF))
     except:
@@ -129,23 +233,26 @@ def create_master_list(config, configfile, modname, moddict,
 
     print("\t\tCreating master list - end ", time.time())
     sys.stdout.flush()
-    if miscutils.convertBool(config.getfull(pfwdefs.PF_USE_DB_OUT)):
-        pfw_dbh = pfwdb.PFWDB()
+    if pfw_dbh is not None:
         pfw_dbh.end_task(query_tid, exitcode, True)
-        pfw_dbh.close()
-
-    if exitcode != 0:
-        miscutils.fwdie("Error: problem creating master list (exitcode = %s)" %
-                        (exitcode), exitcode)
+        pfwdb.release_pfwdb(pfw_dbh)
+    else:
+        print("DESDMTIME: query %s-%s %0.3f" % (modname, search_name, time.time()-starttime))
 
-    miscutils.fwdebug_print("END")
+    return exitcode
 
 
 def runqueries(config, configfile, modname, modules_prev_in_list):
     """Run any queries for a particular module.
+
+    Searches within a module never depend upon one another (depends refers to
+    previous modules), so their commands are run concurrently.
     """
     moddict = config[pfwdefs.SW_MODULESECT][modname]
 
+    # set up all the queries in the main thread since config isn't thread-safe
+    queries = []
+
     # process each "list" in each module
     if pfwdefs.SW_LISTSECT in moddict:
         uber_list_dict = moddict[pfwdefs.SW_LISTSECT]
@@ -160,8 +267,10 @@ def runqueries(config, configfile, modname, modules_prev_in_list):
                     list_dict['depends'] not in modules_prev_in_list:
                 print("\t%s-%s: creating master list\n" % \
                       (modname, listname))
-                create_master_list(config, configfile, modname,
-                                   moddict, listname, list_dict, pfwdefs.SW_LISTSECT)
+                query = setup_master_list_query(config, configfile, modname, moddict,
+                                                listname, list_dict, pfwdefs.SW_LISTSECT)
+                if query is not None:
+                    queries.append(query)
 
     # process each "file" in each module
     if pfwdefs.SW_FILESECT in moddict:
@@ -170,8 +279,35 @@ def runqueries(config, configfile, modname, modules_prev_in_list):
                     not file_dict['depends'] not in modules_prev_in_list:
                 print("\t%s-%s: creating master list\n" % \
                       (modname, filename))
-                create_master_list(config, configfile, modname,
-                                   moddict, filename, file_dict, pfwdefs.SW_FILESECT)
+                query = setup_master_list_query(config, configfile, modname, moddict,
+                                                filename, file_dict, pfwdefs.SW_FILESECT)
+                if query is not None:
+                    queries.append(query)
+
+    if len(queries) == 0:
+        return
+
+    (exists, maxthreads) = config.search(pfwdefs.MAX_QUERY_THREADS, {intgdefs.REPLACE_VARS: True})
+    if not exists:
+        maxthreads = pfwdefs.MAX_QUERY_THREADS_DEFAULT
+    maxthreads = max(1, min(int(maxthreads), len(queries)))
+
+    pfwdb.set_pool_limits(config)
+
+    starttime = time.time()
+    if maxthreads == 1:
+        exitcodes = [run_master_list_query(query) for query in queries]
+    else:
+        # the work is done by the query subprocesses or the DB, threads mostly wait
+        with concurrent.futures.ThreadPoolExecutor(max_workers=maxthreads) as executor:
+            exitcodes = list(executor.map(run_master_list_query, queries))
+    print("DESDMTIME: runqueries %s %0.3f (%s queries, %s at a time)" %
+          (modname, time.time()-starttime, len(queries), maxthreads))
+
+    for query, exitcode in zip(queries, exitcodes):
+        if exitcode != 0:
+            miscutils.fwdie("Error: problem creating master list %s-%s (exitcode = %s)" %
+                            (modname, query['search_name'], exitcode), exitcode)
 
 
 def main(argv=None):
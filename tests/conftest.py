@@ -0,0 +1,9 @@
+"""Make the framework's python and libexec code importable without installing it.
+"""
+
+import os
+import sys
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for subdir in ['libexec', 'python']:
+    sys.path.insert(0, os.path.join(TOPDIR, subdir))
@@ -0,0 +1,166 @@
+"""Tests for processingfw.pfwblock.
+"""
+
+import copy
+import io
+import re
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import pytest
+
+import intgutils.intgdefs as intgdefs
+
+from processingfw import pfwblock
+
+
+def make_master():
+    lines = OrderedDict()
+    for i in range(8):
+        files = OrderedDict()
+        files['image'] = OrderedDict([('filename', 'D%08d_c%02d.fits' % (i // 3, i)),
+                                      ('expnum', str(i // 3)),
+                                      ('band', 'gr'[i % 2])])
+        lines['line%05d' % i] = OrderedDict([('file', files)])
+    return {'list': {intgdefs.LISTENTRY: lines}}
+
+
+def divide_by_copying(master, keys):
+    """Sublists as create_sublists built them before they were views."""
+    sublists = OrderedDict()
+    keyvals = OrderedDict()
+    for linenick, linedict in list(master['list'][intgdefs.LISTENTRY].items()):
+        index = ""
+        listkeys = []
+        for key in keys:
+            val = pfwblock.get_value_from_line(linedict, key, None, 1)
+            index += val + '_'
+            listkeys.append(val)
+        keyvals[index] = listkeys
+        if index not in sublists:
+            sublists[index] = {'list': {intgdefs.LISTENTRY: OrderedDict()}}
+        sublists[index]['list'][intgdefs.LISTENTRY][linenick] = copy.deepcopy(linedict)
+    return (sublists, keyvals)
+
+
+@pytest.mark.parametrize('keys', [['expnum'], ['band'], ['expnum', 'band'], ['image.band']])
+def test_divide_master_list_matches_copies(keys):
+    master = make_master()
+    (sublists, keyvals) = pfwblock.divide_master_list(master, keys)
+    (oldsublists, oldkeyvals) = divide_by_copying(master, keys)
+
+    assert keyvals == oldkeyvals
+    assert list(sublists) == list(oldsublists)
+    for index, sublist in sublists.items():
+        view = sublist['list'][intgdefs.LISTENTRY]
+        old = oldsublists[index]['list'][intgdefs.LISTENTRY]
+        assert isinstance(view, Mapping)
+        assert list(view) == list(old)
+        assert len(view) == len(old)
+        assert list(view.items()) == list(old.items())
+        assert view.values() == list(old.values())
+        assert repr(view) == repr(old)
+        assert copy.deepcopy(view) == old
+
+        # lines are shared with the master, not copied
+        for linenick in view:
+            assert view[linenick] is master['list'][intgdefs.LISTENTRY][linenick]
+
+
+def test_view_only_has_its_lines():
+    master = make_master()
+    (sublists, _) = pfwblock.divide_master_list(master, ['band'])
+    view = sublists['g_']['list'][intgdefs.LISTENTRY]
+    assert 'line00000' in view
+    assert 'line00001' not in view
+    with pytest.raises(KeyError):
+        view['line00001']
+    with pytest.raises(TypeError):
+        view['line00000'] = {}
+
+    copied = copy.deepcopy(view)
+    copied['line00000']['file']['image']['band'] = 'z'
+    assert master['list'][intgdefs.LISTENTRY]['line00000']['file']['image']['band'] == 'g'
+
+
+def test_same_index_from_different_values():
+    lines = OrderedDict()
+    lines['line1'] = OrderedDict([('a', 'x_y'), ('b', 'z')])
+    lines['line2'] = OrderedDict([('a', 'x'), ('b', 'y_z')])
+    (sublists, keyvals) = pfwblock.divide_master_list({'list': {intgdefs.LISTENTRY: lines}},
+                                                      ['a', 'b'])
+    assert list(sublists) == ['x_y_z_']
+    assert list(sublists['x_y_z_']['list'][intgdefs.LISTENTRY]) == ['line1', 'line2']
+    assert list(keyvals) == ['x_y_z_']
+
+
+def output_line_print_value(listfh, line, lineformat, allow_missing, keyarr):
+    """Write a list line the way output_line did before compile_list_writer."""
+    lineformat = lineformat.lower()
+    if lineformat == 'config' or lineformat == 'wcl':
+        listfh.write("<file>\n")
+
+    numkeys = len(keyarr)
+    for i in range(0, numkeys):
+        key = keyarr[i]
+        valuefmt = None
+        if key.startswith('$FMT{'):
+            rmatch = re.match(r'\$FMT\{\s*([^,]+)\s*,\s*(\S+)\s*\}', key)
+            valuefmt = rmatch.group(1).strip()
+            key = rmatch.group(2).strip()
+
+        if '.' in key:
+            [nickname, key2] = key.replace(' ', '').split('.')
+            value = pfwblock.get_value_from_line(line, key2, nickname, None)
+            if value is None:
+                value = pfwblock.get_value_from_line(line, key2, None, 1)
+                if value is None:
+                    assert allow_missing
+                    value = ""
+                else:
+                    key = key2
+        else:
+            value = pfwblock.get_value_from_line(line, key, None, 1)
+
+        pfwblock.print_value(listfh, key, value, lineformat, i == numkeys - 1, valuefmt)
+
+    if lineformat == "config" or lineformat == 'wcl':
+        listfh.write("</file>\n")
+    else:
+        listfh.write("\n")
+
+
+def make_list_line(i):
+    files = OrderedDict()
+    files['image'] = OrderedDict([('filename', 'D%08d_c%02d.fits' % (i, i)),
+                                  ('expnum', i * 7),
+                                  ('exptime', 90.0 + i / 3.0),
+                                  ('band', 'gr'[i % 2])])
+    files['cat'] = OrderedDict([('filename', 'D%08d_c%02d_cat.fits' % (i, i))])
+    return OrderedDict([('file', files)])
+
+
+@pytest.mark.parametrize('lineformat', ['wcl', 'config', 'textcsv', 'texttab', 'textsp', 'TEXTCSV'])
+@pytest.mark.parametrize('keyarr', [
+    ['image.filename'],
+    ['image.filename', 'cat.filename', 'expnum', 'band'],
+    ['$FMT{%08d, expnum}', '$FMT{%.2f, image.exptime}', '$FMT{b_%s, band}'],
+    ['desfile.expnum', 'cat.filename'],
+])
+def test_list_writer_matches_print_value(lineformat, keyarr):
+    writer = pfwblock.compile_list_writer(keyarr, lineformat, True)
+    new = io.StringIO()
+    old = io.StringIO()
+    for i in range(3):
+        writer(new, make_list_line(i))
+        output_line_print_value(old, make_list_line(i), lineformat, True, keyarr)
+    assert new.getvalue() == old.getvalue()
+
+
+def test_list_writer_missing_value():
+    writer = pfwblock.compile_list_writer(['image.filename', 'cat.ccdnum'], 'textsp', True)
+    with pytest.raises(SystemExit):
+        writer(io.StringIO(), make_list_line(0))
+    with pytest.raises(SystemExit):
+        output_line_print_value(io.StringIO(), make_list_line(0), 'textsp', True,
+                                ['image.filename', 'cat.ccdnum'])
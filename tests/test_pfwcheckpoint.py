@@ -0,0 +1,95 @@
+"""Tests of begblock checkpoints.
+"""
+
+import os
+import pickle
+from collections import OrderedDict
+
+import pytest
+
+from processingfw import pfwcheckpoint
+
+
+class Config(dict):
+    """Minimal stand-in for PfwConfig."""
+
+    def combine_lists_files(self, modname):
+        return [(sname, {'qoutfile': qoutfile})
+                for (sname, qoutfile) in self.get('queries', {}).get(modname, [])]
+
+    def write(self, outfh):
+        outfh.write("reqnum = 1\n")
+
+
+@pytest.fixture
+def blockdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def write_file(name, text):
+    with open(name, 'w') as outfh:
+        outfh.write(text)
+
+
+def save_modules(config, modnames, masterdata):
+    for modname in modnames:
+        write_file('%s.wcl' % modname, modname)
+        masterdata[modname] = {'list': {'line': {'line1': {'file': {}}}}}
+        pfwcheckpoint.save_checkpoint(config, modname, ['%s.wcl' % modname], masterdata,
+                                      {'joblist': {}, 'modules_prev_in_list': {}})
+
+
+def test_prefix_of_module_list(blockdir):
+    save_modules(Config(), ['mod1', 'mod2'], OrderedDict())
+    assert pfwcheckpoint.check_manifest(['mod1', 'mod2', 'mod3']) is not None
+    assert pfwcheckpoint.check_manifest(['mod1', 'mod2']) is not None
+    assert pfwcheckpoint.check_manifest(['mod2', 'mod1', 'mod3']) is None
+    assert pfwcheckpoint.check_manifest(['mod1']) is None
+    assert pfwcheckpoint.check_manifest(['mod1', 'modx', 'mod3']) is None
+
+
+def test_changed_files_invalidate(blockdir):
+    write_file('mod1_query.json', '{}')
+    config = Config(queries={'mod1': [('list1', 'mod1_query.json')]})
+    save_modules(config, ['mod1', 'mod2'], OrderedDict())
+    assert pfwcheckpoint.check_manifest(['mod1', 'mod2']) is not None
+
+    write_file('mod1_query.json', '{"changed": 1}')
+    assert pfwcheckpoint.check_manifest(['mod1', 'mod2']) is None
+    write_file('mod1_query.json', '{}')
+    assert pfwcheckpoint.check_manifest(['mod1', 'mod2']) is not None
+
+    write_file('mod2.wcl', 'changed')
+    assert pfwcheckpoint.check_manifest(['mod1', 'mod2']) is None
+    write_file('mod2.wcl', 'mod2')
+    os.unlink('mod1.wcl')
+    assert pfwcheckpoint.check_manifest(['mod1', 'mod2']) is None
+
+
+def test_no_checkpoint(blockdir):
+    assert pfwcheckpoint.check_manifest(['mod1']) is None
+    assert pfwcheckpoint.load_checkpoint(['mod1']) is None
+
+
+def test_masterdata_saved_once_per_module(blockdir, monkeypatch):
+    masterdata = OrderedDict()
+    save_modules(Config(), ['mod1'], masterdata)
+    # mark mod1's file to show later checkpoints don't rewrite it
+    with open(pfwcheckpoint.MASTERDATA_FILE % 'mod1', 'wb') as outfh:
+        pickle.dump('mod1 data', outfh)
+
+    # freed master data isn't reloaded, data kept is read from its module's file
+    save_modules(Config(), ['mod2', 'mod3'], masterdata)
+    del masterdata['mod2']
+    pfwcheckpoint.save_checkpoint(Config(), 'mod4', [], masterdata, {'joblist': {}})
+
+    monkeypatch.setattr(pfwcheckpoint.pfwconfig, 'PfwConfig', lambda args: Config())
+    (_, state, completed) = pfwcheckpoint.load_checkpoint(['mod1', 'mod2', 'mod3', 'mod4'])
+    assert completed == ['mod1', 'mod2', 'mod3', 'mod4']
+    assert list(state['masterdata'].keys()) == ['mod1', 'mod3']
+    assert state['masterdata']['mod1'] == 'mod1 data'
+    assert state['masterdata']['mod3'] == masterdata['mod3']
+
+    pfwcheckpoint.remove_checkpoint()
+    assert [fname for fname in os.listdir('.') if 'checkpoint' in fname] == []
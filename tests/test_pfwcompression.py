@@ -0,0 +1,44 @@
+"""Tests for processingfw.pfwcompression.
+"""
+
+import gzip
+import os
+
+import processingfw.pfwcompression as pfwcompression
+
+
+def test_get_num_workers(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    assert pfwcompression.get_num_workers(100) == 1
+    assert pfwcompression.get_num_workers(100, 4) == 4
+    assert pfwcompression.get_num_workers(100, 16) == 8
+    assert pfwcompression.get_num_workers(100, 0) == 8
+    assert pfwcompression.get_num_workers(100, 0, 3) == 3
+    assert pfwcompression.get_num_workers(2, 0) == 2
+    assert pfwcompression.get_num_workers(0, 4) == 1
+
+    monkeypatch.setattr(os, 'cpu_count', lambda: None)
+    assert pfwcompression.get_num_workers(100, 0) == 1
+
+
+def test_missing_file_doesnt_stop_others(tmp_path):
+    good = [str(tmp_path / ('file%d.txt' % i)) for i in range(3)]
+    for fname in good:
+        with open(fname, 'w') as fh:
+            fh.write(fname * 100)
+    missing = str(tmp_path / 'missing.txt')
+
+    (results, bytes_before, bytes_after) = pfwcompression.compress_files(
+        [good[0], missing] + good[1:], '.gz', 'gzip', '-1', max_try_cnt=1,
+        nprocs=2, backend='gzip')
+
+    assert results[missing]['status'] == 1
+    assert results[missing]['outname'] is None
+    assert 'does not exist' in results[missing]['err']
+    for fname in good:
+        assert results[fname]['status'] == 0
+        assert not os.path.exists(fname)
+        with gzip.open(results[fname]['outname'], 'rt') as fh:
+            assert fh.read() == fname * 100
+    assert bytes_before == sum(len(fname) * 100 for fname in good)
+    assert 0 < bytes_after
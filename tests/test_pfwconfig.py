@@ -0,0 +1,96 @@
+"""Tests for memoizing pattern expansions in processingfw.pfwconfig.
+"""
+
+import re
+
+import processingfw.pfwdefs as pfwdefs
+from processingfw.pfwconfig import PfwConfig
+
+
+def make_config(values):
+    """Return a PfwConfig holding values without reading any wcl."""
+    config = PfwConfig.__new__(PfwConfig)
+    config.expand_cache = {}
+    config.expand_stats = {'hits': 0, 'misses': 0, 'uncacheable': 0}
+    config.expand_deps = {}
+    config.expand_key_versions = {}
+    config.expand_base_version = 0
+    dict.update(config, values)
+
+    def search(name, opts=None):
+        opts = opts or {}
+        for where in [opts.get(pfwdefs.PF_CURRVALS), opts.get('searchobj'), config]:
+            if where and name in where:
+                return True, dict.__getitem__(where, name)
+        return False, None
+    config.search = search
+    return config
+
+
+def expand(config, pattern, searchopts=None):
+    """Expand pattern through the cache, returning (result, whether expandfunc ran)."""
+    calls = []
+
+    def expandfunc():
+        calls.append(pattern)
+        text = pattern
+        while '${' in text:
+            text = re.sub(r'\$\{([^}:]+)[^}]*\}',
+                          lambda m: str(config.search(m.group(1), searchopts)[1]), text)
+        return text
+
+    key = config.get_expand_cache_key(pattern, searchopts, ('test',))
+    return config._cached_expand(key, pattern, searchopts, expandfunc), bool(calls)
+
+
+def test_repeat_is_hit_and_result_matches():
+    config = make_config({'reqnum': '12', 'run': 'r${reqnum}'})
+    assert expand(config, '${run}_x') == ('r12_x', True)
+    assert expand(config, '${run}_x') == ('r12_x', False)
+    assert config.expand_stats == {'hits': 1, 'misses': 1, 'uncacheable': 0}
+
+
+def test_only_patterns_using_changed_key_are_invalidated():
+    config = make_config({'reqnum': '12', 'wrapnum': '1', 'run': 'r${reqnum}'})
+    expand(config, '${run}_${wrapnum}')
+    expand(config, '${run}_log')
+
+    config.inc_wrapnum()
+    assert expand(config, '${run}_${wrapnum}') == ('r12_2', True)
+    assert expand(config, '${run}_log') == ('r12_log', False)
+
+    # nested reference
+    config['reqnum'] = '13'
+    assert expand(config, '${run}_log') == ('r13_log', True)
+
+
+def test_searchobj_values_are_part_of_key():
+    config = make_config({'modulename': 'mod'})
+    opts1 = {'searchobj': {'ccdnum': '1'}}
+    opts2 = {'searchobj': {'ccdnum': '2'}}
+    assert expand(config, '${modulename}_${ccdnum}', opts1) == ('mod_1', True)
+    assert expand(config, '${modulename}_${ccdnum}', opts2) == ('mod_2', True)
+    assert expand(config, '${modulename}_${ccdnum}', {'searchobj': {'ccdnum': '1'}}) == ('mod_1', False)
+
+    # searchobj value now hides top-level value
+    assert expand(config, '${modulename}', {'searchobj': {'modulename': 'other'}}) == ('other', True)
+    assert expand(config, '${modulename}') == ('mod', True)
+
+
+def test_currvals_and_sections():
+    config = make_config({'jobnum': '0', 'current': {}})
+    assert expand(config, 'j${jobnum}', {pfwdefs.PF_CURRVALS: {'jobnum': '3'}}) == ('j3', True)
+    assert expand(config, 'j${jobnum}', {pfwdefs.PF_CURRVALS: {'jobnum': '4'}}) == ('j4', True)
+    assert expand(config, 'j${jobnum}', {pfwdefs.PF_CURRVALS: {'jobnum': '3'}}) == ('j3', False)
+
+    # in-place change of current values invalidates everything
+    config.touch_expand_key('current')
+    assert expand(config, 'j${jobnum}', {pfwdefs.PF_CURRVALS: {'jobnum': '3'}}) == ('j3', True)
+
+
+def test_uncacheable():
+    config = make_config({})
+    assert expand(config, 'a_${missing}')[1]
+    assert expand(config, 'a_${missing}')[1]
+    assert expand(config, 'a_$FUNC{x}')[1]
+    assert config.expand_stats['uncacheable'] == 3
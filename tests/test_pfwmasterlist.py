@@ -0,0 +1,99 @@
+"""Tests of columnar master list storage.
+"""
+
+import copy
+import pickle
+from collections import OrderedDict
+
+import pytest
+
+import intgutils.intgdefs as intgdefs
+
+from processingfw import pfwmasterlist
+
+
+def make_master():
+    lines = OrderedDict()
+    for i in range(5):
+        files = OrderedDict()
+        files['image'] = OrderedDict([('filename', 'D%08d_c%02d_immasked.fits' % (i // 2, i)),
+                                      ('compression', '.fz'),
+                                      ('expnum', i // 2),
+                                      ('ccdnum', i),
+                                      ('exptime', 90.0)])
+        if i % 2 == 0:
+            files['cat'] = OrderedDict([('filename', 'D%08d_cat.fits' % i),
+                                        ('compression', None)])
+        lines['line%05d' % i] = OrderedDict([('file', files), ('saved', i == 0)])
+    return {'list': {intgdefs.LISTENTRY: lines}}
+
+
+def write_read(tmp_path, master):
+    filename = str(tmp_path / 'master.columnar')
+    pfwmasterlist.write_master_list(filename, master)
+    return pfwmasterlist.read_master_list(filename)
+
+
+def plain(value):
+    """Return value with all mappings converted to plain dicts (order ignored)."""
+    if hasattr(value, 'items'):
+        return {key: plain(val) for key, val in value.items()}
+    return value
+
+
+def as_dict(master):
+    return plain(master['list'][intgdefs.LISTENTRY])
+
+
+def test_round_trip(tmp_path):
+    master = make_master()
+    result = write_read(tmp_path, master)
+    assert as_dict(result) == as_dict(master)
+
+    line = result['list'][intgdefs.LISTENTRY]['line00002']
+    assert line['file']['image']['expnum'] == 1
+    assert line['file']['image']['exptime'] == 90.0
+    assert line['file']['cat']['compression'] is None
+    assert line['saved'] is False
+    assert sorted(line['file'].keys()) == ['cat', 'image']
+    assert list(result['list'][intgdefs.LISTENTRY]['line00001']['file'].keys()) == ['image']
+
+
+def test_round_trip_empty(tmp_path):
+    result = write_read(tmp_path, {'list': {intgdefs.LISTENTRY: OrderedDict()}})
+    assert len(result['list'][intgdefs.LISTENTRY]) == 0
+
+
+def test_strings_decoded_on_first_use(tmp_path):
+    result = write_read(tmp_path, make_master())
+    lines = result['list'][intgdefs.LISTENTRY]
+    assert len(lines.store.strings) == 0
+    assert lines['line00003']['file']['image']['ccdnum'] == 3
+    assert len(lines.store.strings) == 1
+
+
+def test_missing_file_nickname(tmp_path):
+    lines = write_read(tmp_path, make_master())['list'][intgdefs.LISTENTRY]
+    assert 'cat' not in lines['line00001']['file']
+    with pytest.raises(KeyError):
+        lines['line00001']['file']['cat']
+
+
+def test_changes_and_pickle(tmp_path):
+    master = make_master()
+    lines = write_read(tmp_path, master)['list'][intgdefs.LISTENTRY]
+    expected = as_dict(master)
+
+    lines['line00001']['file']['image']['fullname'] = 'red/D00000000_c01_immasked.fits.fz'
+    expected['line00001']['file']['image']['fullname'] = 'red/D00000000_c01_immasked.fits.fz'
+    del lines['line00002']['file']['cat']
+    del expected['line00002']['file']['cat']
+    lines['line00003']['file']['cat'] = {'filename': 'new.fits'}
+    expected['line00003']['file']['cat'] = {'filename': 'new.fits'}
+    del lines['line00004']
+    del expected['line00004']
+    assert plain(lines) == expected
+
+    restored = pickle.loads(pickle.dumps(lines))
+    assert plain(restored) == expected
+    assert plain(copy.deepcopy(restored)) == expected
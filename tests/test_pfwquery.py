@@ -0,0 +1,97 @@
+"""Tests for the master list query cache in processingfw.pfwquery.
+"""
+
+import os
+import sqlite3
+
+import processingfw.pfwdefs as pfwdefs
+import processingfw.pfwmasterlist as pfwmasterlist
+import processingfw.pfwquery as pfwquery
+
+
+class Config(dict):
+    """Minimal stand-in for PfwConfig/WCL."""
+
+    def search(self, key, opts=None):
+        return (key in self, self.get(key))
+
+
+QUERY = {'image': {'select_fields': 'filename', 'key_vals': {'expnum': '123'}}}
+
+
+def test_get_query_cache():
+    assert pfwquery.get_query_cache(Config()) is None
+    assert pfwquery.get_query_cache(Config({pfwdefs.QUERY_CACHE_DIR: ''})) is None
+
+    cache = pfwquery.get_query_cache(Config({pfwdefs.QUERY_CACHE_DIR: '/cache'}))
+    assert cache == {'dir': '/cache', 'ttl': pfwdefs.QUERY_CACHE_TTL_DEFAULT, 'token': None}
+
+    cache = pfwquery.get_query_cache(Config({pfwdefs.QUERY_CACHE_DIR: '/cache',
+                                             pfwdefs.QUERY_CACHE_TTL: '60',
+                                             pfwdefs.QUERY_CACHE_TOKEN: 'select 1'}))
+    assert cache == {'dir': '/cache', 'ttl': 60, 'token': 'select 1'}
+
+
+def test_cache_file_key():
+    cache = {'dir': '/cache', 'ttl': 60, 'token': None}
+    fname = pfwquery.get_query_cache_file(None, cache, QUERY, 'wcl')
+    assert fname.startswith('/cache/')
+    assert fname.endswith('.wcl')
+    assert os.path.basename(fname)[:2] == os.path.basename(os.path.dirname(fname))
+
+    # same query built in a different order
+    query2 = {'image': {'key_vals': {'expnum': '123'}, 'select_fields': 'filename'}}
+    assert pfwquery.get_query_cache_file(None, cache, query2, 'wcl') == fname
+
+    query3 = {'image': {'select_fields': 'filename', 'key_vals': {'expnum': '124'}}}
+    assert pfwquery.get_query_cache_file(None, cache, query3, 'wcl') != fname
+    jsonname = pfwquery.get_query_cache_file(None, cache, QUERY, 'json')
+    assert os.path.splitext(jsonname)[0] != os.path.splitext(fname)[0]
+
+
+def test_cache_file_token():
+    dbh = sqlite3.connect(':memory:')
+    dbh.execute('create table desfile (id integer)')
+    dbh.execute('insert into desfile values (1)')
+    cache = {'dir': '/cache', 'ttl': 60, 'token': 'select max(id) from desfile'}
+
+    fname = pfwquery.get_query_cache_file(dbh, cache, QUERY, 'wcl')
+    assert pfwquery.get_query_cache_file(dbh, cache, QUERY, 'wcl') == fname
+
+    dbh.execute('insert into desfile values (2)')
+    assert pfwquery.get_query_cache_file(dbh, cache, QUERY, 'wcl') != fname
+
+
+def test_gen_master_list_ttl(tmp_path, monkeypatch):
+    calls = []
+
+    def gen_file_list(dbh, query):
+        calls.append(query)
+        return [{'filename': 'file%d.fits' % len(calls), 'compression': None}]
+    monkeypatch.setattr(pfwquery.queryutils, 'gen_file_list', gen_file_list)
+
+    cache = {'dir': str(tmp_path / 'cache'), 'ttl': 60, 'token': None}
+    qoutfile = str(tmp_path / 'list.col')
+    with open(os.devnull, 'w') as devnull:
+        def gen():
+            pfwquery.gen_master_list(None, QUERY, qoutfile, pfwmasterlist.COLUMNAR_FORMAT,
+                                     'image', out_file=devnull, cache=cache)
+            with open(qoutfile, 'rb') as fh:
+                return fh.read()
+
+        first = gen()
+        assert len(calls) == 1
+        cachefile = pfwquery.get_query_cache_file(None, cache, QUERY,
+                                                  pfwmasterlist.COLUMNAR_FORMAT)
+        assert os.path.exists(cachefile)
+
+        # hit within ttl
+        os.unlink(qoutfile)
+        assert gen() == first
+        assert len(calls) == 1
+
+        # expired
+        old = os.path.getmtime(cachefile) - 120
+        os.utime(cachefile, (old, old))
+        assert gen() != first
+        assert len(calls) == 2
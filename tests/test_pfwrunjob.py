@@ -0,0 +1,47 @@
+"""Tests for libexec/pfwrunjob.py.
+"""
+
+import pfwrunjob
+
+
+def make_inputs(wrappers):
+    """Return inputs entries for {wrapnum: (input files, output files)}."""
+    inputs = {}
+    for wrapnum, (ins, outs) in wrappers.items():
+        inputs[wrapnum] = (None, None, None, {'infiles': ins}, {'outfiles': outs})
+    return inputs
+
+
+def test_build_wrapper_dag_edges():
+    groups = [('task1', 2, ['1', '2']),
+              ('task2', 2, ['3', '4']),
+              ('task3', 1, ['5'])]
+    inputs = make_inputs({
+        '1': (['/in/raw1.fits'], ['/out/red1.fits']),
+        '2': (['/in/raw2.fits'], ['/out/red2.fits']),
+        '3': (['/out/red1.fits', '/in/bias.fits'], ['/out/cat1.fits']),
+        '4': (['/other/dir/red2.fits', '/out/red1.fits'], ['/out/cat2.fits']),
+        '5': (['/out/cat1.fits', '/out/cat2.fits', '/out/red2.fits'], []),
+    })
+
+    deps = pfwrunjob.build_wrapper_dag(groups, inputs)
+    assert list(deps) == ['1', '2', '3', '4', '5']
+    assert deps['1'] == set()
+    assert deps['2'] == set()
+    assert deps['3'] == set(['1'])
+    assert deps['4'] == set(['1', '2'])   # matched by filename, not path
+    assert deps['5'] == set(['2', '3', '4'])
+
+
+def test_build_wrapper_dag_same_group():
+    # outputs only satisfy wrappers in later groups, same as the group barrier
+    groups = [('task1', 2, ['1', '2']),
+              ('task2', 1, ['3'])]
+    inputs = make_inputs({
+        '1': ([], ['/out/a.fits']),
+        '2': (['/out/a.fits'], ['/out/b.fits']),
+        '3': (['/out/b.fits'], ['/out/a.fits']),
+    })
+
+    deps = pfwrunjob.build_wrapper_dag(groups, inputs)
+    assert deps == {'1': set(), '2': set(), '3': set(['2'])}
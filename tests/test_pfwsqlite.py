@@ -0,0 +1,103 @@
+"""Smoke test of PFWDB writes against the SQLite stand-in.
+"""
+
+import pytest
+
+from processingfw import pfwdb
+from processingfw import pfwdefs
+
+
+class Config(dict):
+    """Minimal stand-in for PfwConfig/WCL."""
+
+    def getfull(self, key, default=None):
+        return self.get(key, default)
+
+
+def make_config():
+    return Config({pfwdefs.REQNUM: '1234',
+                   pfwdefs.UNITNAME: 'D00001',
+                   pfwdefs.SW_BLOCKLIST: 'blk1',
+                   pfwdefs.SW_MODULELIST: 'mod1,mod2',
+                   pfwdefs.PF_BLKNUM: '1',
+                   'project': 'TST',
+                   'campaign': 'Y1',
+                   'jira_id': 'DESOPS-1',
+                   'pipeline': 'test',
+                   'operator': 'tester',
+                   'basket': None,
+                   'group_submit_id': None,
+                   'blockname': 'blk1',
+                   'target_site': 'local',
+                   'pipeprod': 'prod',
+                   'pipever': '1.0'})
+
+
+def make_dbh(tmp_path):
+    desfile = tmp_path / 'des.ini'
+    desfile.write_text("[db-sqlite]\ntype = sqlite\nname = test.db\n")
+    return pfwdb.PFWDB(str(desfile), 'db-sqlite')
+
+
+def select(dbh, sql):
+    curs = dbh.cursor()
+    curs.execute(sql)
+    return curs.fetchall()
+
+
+def test_run_block_jobs_tasks(tmp_path):
+    dbh = make_dbh(tmp_path)
+    assert isinstance(dbh, pfwdb.SQLitePFWDB)
+    config = make_config()
+
+    dbh.insert_run(config)
+    dbh.insert_block(config)
+    blktid = config['task_id']['block']['1']
+    dbh.insert_jobs(config, {'1': {'jobnum': '1', 'numexpwrap': 2},
+                             '2': {'jobnum': '2', 'numexpwrap': 3}})
+    jobtid = config['task_id']['job']['1']
+    tid = dbh.create_task(name='jobwrapper', info_table=None, parent_task_id=jobtid,
+                          root_task_id=config['task_id']['attempt'], do_begin=True,
+                          do_commit=True)
+    dbh.end_task(tid, 0, True)
+
+    assert select(dbh, "select reqnum, unitname, attnum from pfw_attempt") == \
+        [(1234, 'D00001', 1)]
+    assert select(dbh, "select task_id, blknum from pfw_block") == [(blktid, 1)]
+    assert select(dbh, "select jobnum, expect_num_wrap, pfw_block_task_id from pfw_job "
+                       "order by jobnum") == [(1, 2, blktid), (2, 3, blktid)]
+    (start, end, status, parent) = select(dbh, "select start_time, end_time, status, "
+                                               "parent_task_id from task where id=%s" % tid)[0]
+    assert start is not None and end is not None
+    assert (status, parent) == (0, jobtid)
+    dbh.close()
+
+
+def test_write_behind_matches_direct(tmp_path):
+    dbh = make_dbh(tmp_path)
+    direct = dbh.create_task(name='direct', info_table=None, do_begin=True, do_commit=True)
+    dbh.set_write_behind(True, 3600)
+    queued = dbh.create_task(name='queued', info_table=None, do_begin=True)
+    dbh.end_task(queued, 0)
+    assert select(dbh, "select status from task where id=%s" % queued) == [(0,)]
+
+    # queued rows are stamped with server time, so order with server-stamped rows
+    times = dict(select(dbh, "select id, start_time from task"))
+    assert times[direct] <= times[queued]
+    dbh.close()
+
+
+def test_reopen_task(tmp_path):
+    dbh = make_dbh(tmp_path)
+    tid = dbh.create_task(name='begblock', info_table=None, do_begin=True, do_commit=True)
+    dbh.end_task(tid, 1, True)
+    dbh.reopen_task(tid, True)
+    assert select(dbh, "select end_time, status from task where id=%s" % tid) == [(None, None)]
+    dbh.close()
+
+
+def test_database_defaults_not_supported(tmp_path):
+    dbh = make_dbh(tmp_path)
+    with pytest.raises(NotImplementedError):
+        dbh.get_database_defaults()
+    dbh.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""Compare time and memory of dividing a synthetic master list into sublists.
+"""
+
+import argparse
+import copy
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import intgutils.intgdefs as intgdefs
+import processingfw.pfwblock as pfwblock
+
+
+def make_master(numlines, ccds_per_exp):
+    """Create a master list similar to one returned by a single-epoch query.
+    """
+    lines = OrderedDict()
+    for i in range(numlines):
+        expnum = 100000 + i // ccds_per_exp
+        ccdnum = i % ccds_per_exp + 1
+        fdict = {'filename': 'D%08d_g_c%02d_r1p1_immasked.fits' % (expnum, ccdnum),
+                 'compression': '.fz',
+                 'expnum': expnum,
+                 'ccdnum': ccdnum,
+                 'band': 'g',
+                 'fullname': 'red/immask/D%08d_g_c%02d_r1p1_immasked.fits.fz' % (expnum, ccdnum)}
+        lines['line%08d' % i] = {'file': {'file0001': fdict}}
+    return {'list': {intgdefs.LISTENTRY: lines}}
+
+
+def divide_with_copies(master, keys):
+    """Divide master list the way create_sublists used to, copying every line.
+    """
+    sublists = OrderedDict()
+    keyvals = OrderedDict()
+    for linenick, linedict in master['list'][intgdefs.LISTENTRY].items():
+        index = ""
+        listkeys = []
+        for key in keys:
+            val = pfwblock.get_value_from_line(linedict, key, None, 1)
+            index += val + '_'
+            listkeys.append(val)
+        keyvals[index] = listkeys
+        if index not in sublists:
+            sublists[index] = {'list': {intgdefs.LISTENTRY: OrderedDict()}}
+        sublists[index]['list'][intgdefs.LISTENTRY][linenick] = copy.deepcopy(linedict)
+    return (sublists, keyvals)
+
+
+def run(name, func, master, keys):
+    """Run one way of dividing and print its time and memory.
+    """
+    starttime = time.time()
+    (sublists, _) = func(master, keys)
+    elapsed = time.time() - starttime
+    del sublists
+
+    # separate run for memory since tracing slows things down
+    tracemalloc.start()
+    (sublists, _) = func(master, keys)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%-8s %8.2f sec %10.1f MB peak  %s sublists" %
+          (name, elapsed, peak / 1024.0 / 1024.0, len(sublists)))
+    return sublists
+
+
+def main(argv):
+    """Program entry point.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark sublist creation')
+    parser.add_argument('--numlines', action='store', type=int, default=1000000)
+    parser.add_argument('--ccds', action='store', type=int, default=62,
+                        help='lines per value of the first divide_by key')
+    parser.add_argument('--divide_by', action='store', default='expnum')
+    args = parser.parse_args(argv)
+
+    keys = args.divide_by.lower().split(',')
+    master = make_master(args.numlines, args.ccds)
+    print("master list: %s lines, divide_by %s" % (args.numlines, keys))
+
+    views = run('views', pfwblock.divide_master_list, master, keys)
+    copies = run('copies', divide_with_copies, master, keys)
+
+    if list(views.keys()) != list(copies.keys()):
+        print("Error: sublist indexes differ")
+        return 1
+    for index, sublist in views.items():
+        if list(sublist['list'][intgdefs.LISTENTRY].items()) != \
+           list(copies[index]['list'][intgdefs.LISTENTRY].items()):
+            print("Error: sublist %s differs" % index)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))